@@ -0,0 +1,96 @@
+import contextlib
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+
+BENCHMARKS = ('tokens', 'create', 'bulk_create', 'redeem', 'concurrency', 'async_view', 'metrics', 'urls', 'digest')
+
+
+def setup():
+    """
+    Configure django with settings of test project.
+    """
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root_dir not in sys.path:
+        sys.path.insert(0, root_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Create test database for the time of benchmark and destroy it after.
+    """
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timeit(func, *args, **kwargs):
+    """
+    Return tuple (seconds, result) of calling func.
+    """
+    t = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - t, result
+
+
+def percentiles(timings):
+    """
+    Return dict with percentiles of timings in milliseconds.
+    """
+    timings = sorted(timings)
+    result = {}
+    for p in (50, 90, 99):
+        result['p{}_ms'.format(p)] = round(timings[min(len(timings) - 1, len(timings) * p // 100)] * 1000, 3)
+    result['max_ms'] = round(timings[-1] * 1000, 3)
+    return result
+
+
+def main(*args):
+    """
+    Run benchmarks and print results as JSON.
+    args - names of benchmarks (all by default) and optionally --output=<file>
+    """
+    output = None
+    names = []
+    for arg in args:
+        if arg.startswith('--output='):
+            output = arg.split('=', 1)[1]
+        else:
+            names.append(arg)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise SystemExit('Unknown benchmark: {}. Available: {}.'.format(name, ', '.join(BENCHMARKS)))
+    setup()
+    import django
+    import privateurl
+    from django.db import connection
+    results = {
+        'meta': {
+            'privateurl': privateurl.__version__,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+    }
+    with test_database():
+        for name in names or BENCHMARKS:
+            if name == 'async_view' and django.VERSION < (3, 1):
+                continue
+            results[name] = importlib.import_module('benchmarks.{}'.format(name)).run()
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data + '\n')
+    print(data)
+    return results
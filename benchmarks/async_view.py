@@ -0,0 +1,43 @@
+"""
+Compare throughput of sync and async privateurl_view under ASGI test client.
+
+Usage: python -m benchmarks.async_view [number] [concurrency]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks import setup, test_database
+
+
+async def measure(client, url, number, concurrency):
+    async def worker(n):
+        for i in range(n):
+            await client.get(url)
+
+    t = time.time()
+    await asyncio.gather(*[worker(number // concurrency) for i in range(concurrency)])
+    return time.time() - t
+
+
+def run(number=2000, concurrency=10):
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+    from django.urls import reverse
+    from privateurl.models import PrivateUrl
+
+    obj = PrivateUrl.create('bench', hits_limit=0)
+    kwargs = {'action': obj.action, 'token': obj.token}
+    client = AsyncClient()
+    result = {'number': number, 'concurrency': concurrency}
+    for name, url in (('sync', reverse('purl:privateurl', kwargs=kwargs)),
+                      ('async', reverse('privateurl_async', kwargs=kwargs))):
+        seconds = async_to_sync(measure)(client, url, number, concurrency)
+        result['{}_rps'.format(name)] = round(number / seconds, 1)
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:3]]))
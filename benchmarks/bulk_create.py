@@ -0,0 +1,34 @@
+"""
+Compare PrivateUrl.bulk_create_urls with a loop of PrivateUrl.create.
+
+Usage: python -m benchmarks.bulk_create [number]
+"""
+import datetime
+import sys
+
+from benchmarks import setup, test_database, timeit
+
+
+def run(number=5000):
+    from privateurl.models import PrivateUrl
+
+    specs = [{'expire': datetime.timedelta(days=1), 'data': {'n': i}} for i in range(number)]
+
+    def loop_create():
+        for spec in specs:
+            PrivateUrl.create('bench-loop', **spec)
+
+    loop_time, _ = timeit(loop_create)
+    bulk_time, _ = timeit(PrivateUrl.bulk_create_urls, 'bench-bulk', specs)
+    return {
+        'number': number,
+        'create_loop_sec': round(loop_time, 4),
+        'bulk_create_urls_sec': round(bulk_time, 4),
+        'speedup': round(loop_time / bulk_time, 2) if bulk_time else None,
+    }
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:2]]))
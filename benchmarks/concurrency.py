@@ -0,0 +1,59 @@
+"""
+Check that concurrent redemptions of one private url respect hits_limit and measure their throughput.
+
+Usage: python -m benchmarks.concurrency [threads] [hits_per_thread]
+"""
+import sys
+import threading
+import time
+
+from benchmarks import setup, test_database
+
+
+def run(threads=8, hits_per_thread=50):
+    from django.db import connection
+    from privateurl.models import PrivateUrl
+
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        return {'skipped': 'in-memory database does not allow multiple connections'}
+
+    result = {'threads': threads, 'vendor': connection.vendor}
+    for hits_limit in (threads * hits_per_thread // 2, 0):
+        obj = PrivateUrl.create('bench-concurrency', hits_limit=hits_limit)
+        barrier = threading.Barrier(threads)
+        counted, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                for i in range(hits_per_thread):
+                    counted.append(PrivateUrl.objects.get(pk=obj.pk).consume())
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for i in range(threads)]
+        t = time.time()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        seconds = time.time() - t
+        hit_counter = PrivateUrl.objects.get(pk=obj.pk).hit_counter
+        expected = hits_limit or counted.count(True)
+        result['limited' if hits_limit else 'unlimited'] = {
+            'hits_limit': hits_limit,
+            'counted': counted.count(True),
+            'hit_counter': hit_counter,
+            'correct': counted.count(True) == hit_counter == expected and not errors,
+            'errors': len(errors),
+            'hits_per_sec': round(len(counted) / seconds, 1),
+        }
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:3]]))
@@ -0,0 +1,33 @@
+"""
+Measure throughput of PrivateUrl.create with and without token collisions.
+
+Usage: python -m benchmarks.create [number]
+"""
+import sys
+
+from benchmarks import setup, test_database, timeit
+
+
+def run(number=2000):
+    from privateurl.models import PrivateUrl
+
+    result = {'number': number}
+    seconds, _ = timeit(lambda: [PrivateUrl.create('bench-create') for i in range(number)])
+    result['create_per_sec'] = round(number / seconds, 1)
+
+    # two symbols give 3844 different tokens, so collisions are frequent
+    token_min_size_bak = PrivateUrl.TOKEN_MIN_SIZE
+    PrivateUrl.TOKEN_MIN_SIZE = 2
+    try:
+        n = min(number, 2000)
+        seconds, _ = timeit(lambda: [PrivateUrl.create('bench-collisions', token_size=2) for i in range(n)])
+    finally:
+        PrivateUrl.TOKEN_MIN_SIZE = token_min_size_bak
+    result['create_with_collisions_per_sec'] = round(n / seconds, 1)
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:2]]))
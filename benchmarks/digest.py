@@ -0,0 +1,98 @@
+"""
+Compare size of unique index (and of all indexes) and lookup latency of raw tokens with stored digests of tokens.
+Index size is measured on PostgreSQL and SQLite built with dbstat.
+
+Usage: python -m benchmarks.digest [number]
+"""
+import sys
+import time
+
+from benchmarks import percentiles, setup, test_database
+
+
+def index_size(model, columns):
+    """
+    Return size in bytes of unique index of model on columns or None if database doesn't report it.
+    """
+    from django.db import DatabaseError, connection
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        names = [name for name, c in constraints.items() if c['unique'] and c['columns'] == columns]
+        if not names:
+            return None
+        try:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_relation_size(%s::regclass)', [names[0]])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [names[0]])
+            else:
+                return None
+        except DatabaseError:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def indexes_size(model):
+    """
+    Return size in bytes of all indexes of table of model or None if database doesn't report it.
+    """
+    from django.db import DatabaseError, connection
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_indexes_size(%s::regclass)', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                               "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)", [table])
+            else:
+                return None
+        except DatabaseError:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def lookup_timings(urls):
+    from privateurl.models import PrivateUrl
+    timings = []
+    for action, token in urls:
+        t = time.time()
+        assert PrivateUrl.objects.get_or_none(action, token) is not None
+        timings.append(time.time() - t)
+    return percentiles(timings)
+
+
+def run(number=20000):
+    from django.core.management import call_command
+    from privateurl import settings as purl_settings
+    from privateurl.models import PrivateUrl
+
+    digest_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST
+    fallback_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK
+    objs = PrivateUrl.bulk_create_urls('bench-digest', [{}] * number, batch_size=1000)
+    urls = [(obj.action, obj.token) for obj in objs[:1000]]
+    result = {'number': number}
+    try:
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = False
+        result['token'] = dict(lookup_timings(urls), index_bytes=index_size(PrivateUrl, ['action', 'token']),
+                               all_indexes_bytes=indexes_size(PrivateUrl))
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = True
+        call_command('privateurl_digest_tokens', clear_tokens=True, batch_size=1000, verbosity=0)
+        purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK = False
+        result['digest'] = dict(lookup_timings(urls), index_bytes=index_size(PrivateUrl, ['action', 'token_digest']),
+                                token_index_bytes=index_size(PrivateUrl, ['action', 'token']),
+                                all_indexes_bytes=indexes_size(PrivateUrl))
+    finally:
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = digest_bak
+        purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK = fallback_bak
+    PrivateUrl.objects.filter(action='bench-digest').delete()
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:2]]))
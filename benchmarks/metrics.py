@@ -0,0 +1,56 @@
+"""
+Measure overhead of metrics in privateurl_view when metrics are disabled and enabled.
+
+Usage: python -m benchmarks.metrics [number]
+"""
+import sys
+import time
+from timeit import default_timer
+
+from benchmarks import setup, test_database
+
+
+def view_time(client, url, number):
+    t = time.time()
+    for i in range(number):
+        client.get(url)
+    return time.time() - t
+
+
+def run(number=2000):
+    from django.test import Client
+    from privateurl import metrics as purl_metrics, settings as purl_settings
+    from privateurl.models import PrivateUrl
+
+    backend_bak = purl_settings.PRIVATEURL_METRICS_BACKEND
+    result = {'number': number}
+    try:
+        # the same calls that privateurl_view does with disabled metrics
+        purl_settings.PRIVATEURL_METRICS_BACKEND = None
+        purl_metrics.reset_metrics()
+        t = time.time()
+        for i in range(number):
+            metrics = purl_metrics.get_metrics()
+            start = default_timer()
+            metrics.timing('lookup', default_timer() - start, 'bench')
+            start = default_timer()
+            metrics.timing('counter', default_timer() - start, 'bench')
+            metrics.incr('ok', 'bench')
+        result['disabled_overhead_us_per_request'] = round((time.time() - t) / number * 1e6, 3)
+
+        url = PrivateUrl.create('bench-metrics', hits_limit=0).get_absolute_url()
+        client = Client()
+        for name, backend in (('disabled', None), ('in_memory', 'privateurl.metrics.InMemoryMetrics')):
+            purl_settings.PRIVATEURL_METRICS_BACKEND = backend
+            purl_metrics.reset_metrics()
+            result['{}_view_us_per_request'.format(name)] = round(view_time(client, url, number) / number * 1e6, 1)
+    finally:
+        purl_settings.PRIVATEURL_METRICS_BACKEND = backend_bak
+        purl_metrics.reset_metrics()
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:2]]))
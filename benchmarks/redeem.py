@@ -0,0 +1,52 @@
+"""
+Measure latency and number of queries of privateurl_view requests through Django test client.
+
+Usage: python -m benchmarks.redeem [number]
+"""
+import logging
+import sys
+import time
+
+from benchmarks import percentiles, setup, test_database
+
+
+def run(number=1000):
+    from django.db import connection
+    from django.test import Client
+    from privateurl.models import PrivateUrl
+
+    client = Client()
+    result = {'number': number}
+    queries = []
+
+    def count_queries(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    # not found responses are logged as warnings
+    logger = logging.getLogger('django.request')
+    logger_level = logger.level
+    logger.setLevel(logging.ERROR)
+    cases = (
+        ('limited', lambda: [PrivateUrl.create('bench-redeem') for i in range(number)]),
+        ('unlimited', lambda: [PrivateUrl.create('bench-redeem', hits_limit=0)] * number),
+        ('not_found', lambda: [PrivateUrl(action='bench-redeem', token='unknown-token')] * number),
+    )
+    for name, get_objs in cases:
+        urls = [obj.get_absolute_url() for obj in get_objs()]
+        timings = []
+        del queries[:]
+        with connection.execute_wrapper(count_queries):
+            for url in urls:
+                t = time.time()
+                client.get(url)
+                timings.append(time.time() - t)
+        result[name] = dict(percentiles(timings), queries_per_request=round(len(queries) / float(number), 2))
+    logger.setLevel(logger_level)
+    return result
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        print(run(*[int(v) for v in sys.argv[1:2]]))
@@ -0,0 +1,50 @@
+"""
+Compare token generation with the previous implementation of PrivateUrl.generate_token.
+
+Usage: python -m benchmarks.tokens [number]
+"""
+import random
+import sys
+
+from benchmarks import setup, timeit
+
+
+def legacy_generate_token(size=(8, 64), dashed_piece_size=12):
+    """
+    Previous implementation: reseeds global random and inserts dashes by slicing in a loop.
+    """
+    from django.utils.crypto import get_random_string
+
+    if size[0] != size[1]:
+        random.seed(get_random_string(length=100))
+        _size = random.randint(*size)
+    else:
+        _size = size[0]
+    token = get_random_string(length=_size)
+    if dashed_piece_size:
+        n = dashed_piece_size
+        while n < len(token):
+            token = token[:n] + '-' + token[n:]
+            n += dashed_piece_size + 1
+        token = token[:_size].rstrip('-')
+    return token
+
+
+def run(number=20000):
+    from privateurl.models import PrivateUrl
+
+    legacy_time, _ = timeit(lambda: [legacy_generate_token() for i in range(number)])
+    token_time, _ = timeit(lambda: [PrivateUrl.generate_token(size=(8, 64)) for i in range(number)])
+    tokens_time, _ = timeit(PrivateUrl.generate_tokens, number, size=(8, 64))
+    return {
+        'number': number,
+        'legacy_generate_token_sec': round(legacy_time, 4),
+        'generate_token_sec': round(token_time, 4),
+        'generate_tokens_sec': round(tokens_time, 4),
+        'speedup': round(legacy_time / tokens_time, 2) if tokens_time else None,
+    }
+
+
+if __name__ == '__main__':
+    setup()
+    print(run(*[int(v) for v in sys.argv[1:2]]))
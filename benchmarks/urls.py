@@ -0,0 +1,34 @@
+"""
+Compare building urls of private urls by reverse() with privateurl.urlbuilder.
+
+Usage: python -m benchmarks.urls [number]
+"""
+import sys
+
+from benchmarks import setup, timeit
+
+
+def run(number=100000):
+    from django.urls import reverse
+    from privateurl import settings as purl_settings, urlbuilder
+    from privateurl.models import PrivateUrl
+
+    objs = [PrivateUrl(action='bench-urls', token=token) for token in PrivateUrl.generate_tokens(number)]
+    name = '{}:privateurl'.format(purl_settings.PRIVATEURL_URL_NAMESPACE)
+    reverse_time, expected = timeit(lambda: [reverse(name, kwargs={'action': obj.action, 'token': obj.token})
+                                             for obj in objs])
+    method_time, _ = timeit(lambda: [obj.get_absolute_url() for obj in objs])
+    bulk_time, urls = timeit(urlbuilder.build_urls, objs)
+    assert urls == expected
+    return {
+        'number': number,
+        'reverse_sec': round(reverse_time, 4),
+        'get_absolute_url_sec': round(method_time, 4),
+        'build_urls_sec': round(bulk_time, 4),
+        'speedup': round(reverse_time / bulk_time, 2) if bulk_time else None,
+    }
+
+
+if __name__ == '__main__':
+    setup()
+    print(run(*[int(v) for v in sys.argv[1:2]]))
@@ -1,3 +1,5 @@
+from .registry import get_action, register_action, unregister_action  # noqa
+
 __version__ = '1.4.0'
 
 default_app_config = 'privateurl.apps.PrivateURLConfig'
@@ -1,19 +1,116 @@
+import django
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext, ugettext_lazy as _
 
-from .models import PrivateUrl
+from . import cache as purl_cache, registry, settings as purl_settings
+from .models import PrivateUrl, PrivateUrlHit, PrivateUrlStats
+
+
+def estimate_count(model, using):
+    """
+    Return number of rows of model table from statistics of database (PostgreSQL, MySQL) or None.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't count all rows of large tables. Count of unfiltered table is taken from statistics
+    of database if it is greater than settings.PRIVATEURL_ADMIN_COUNT_LIMIT, rows of filtered queryset
+    are counted up to this limit.
+    """
+
+    @cached_property
+    def count(self):
+        limit = purl_settings.PRIVATEURL_ADMIN_COUNT_LIMIT
+        qs = self.object_list
+        if not limit or not hasattr(qs, 'query'):
+            return super(EstimatedCountPaginator, self).count
+        if not qs.query.where:
+            estimate = estimate_count(qs.model, qs.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return qs.order_by()[:limit].count()
+
+
+def get_actions(model):
+    """
+    Return sorted list of actions for admin filter. Actions are taken from settings.PRIVATEURL_ACTIONS
+    and registry if it is set, otherwise distinct actions of table are cached
+    for settings.PRIVATEURL_ADMIN_ACTIONS_CACHE_TIMEOUT seconds.
+    """
+    if purl_settings.PRIVATEURL_ACTIONS is not None:
+        return sorted(set(purl_settings.PRIVATEURL_ACTIONS) | set(registry.get_names()))
+    key = '{}:admin_actions:{}'.format(purl_settings.PRIVATEURL_CACHE_KEY_PREFIX, model._meta.label_lower)
+    actions = cache.get(key)
+    if actions is None:
+        actions = sorted(model.objects.order_by().values_list('action', flat=True).distinct())
+        cache.set(key, actions, purl_settings.PRIVATEURL_ADMIN_ACTIONS_CACHE_TIMEOUT)
+    return actions
+
+
+class ActionListFilter(admin.SimpleListFilter):
+    title = _('action')
+    parameter_name = 'action__exact'
+
+    def lookups(self, request, model_admin):
+        return [(action, action) for action in get_actions(model_admin.model)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(action=self.value())
+
+
+class AvailableListFilter(admin.SimpleListFilter):
+    title = _('available')
+    parameter_name = 'available'
+
+    def lookups(self, request, model_admin):
+        return (('1', _('Yes')), ('0', _('No')))
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.available()
+        if self.value() == '0':
+            return queryset.unavailable()
 
 
 class PrivateUrlAdmin(admin.ModelAdmin):
     list_display = ('action_with_token', 'user', 'created', 'expire', 'used', 'available')
-    list_filter = ('action',)
+    list_filter = (ActionListFilter, AvailableListFilter)
     list_select_related = ('user',)
     raw_id_fields = ('user',)
+    # primary key grows with created, so ordering by it uses index and doesn't need extra sorting
+    ordering = ('-pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('expire_now', 'reset_counters', 'purge_unavailable')
 
     def __init__(self, *args, **kwargs):
         super(PrivateUrlAdmin, self).__init__(*args, **kwargs)
 
     def action_with_token(self, obj):
+        if obj.token is None:
+            return '{}/#{}'.format(obj.action, obj.token_digest[:12])
         return '{}/{}'.format(obj.action, obj.token)
 
     action_with_token.short_description = _('action/token')
@@ -26,8 +123,81 @@ class PrivateUrlAdmin(admin.ModelAdmin):
     def available(self, obj):
         return obj.is_available()
 
-    used.short_description = _('available')
+    available.short_description = _('available')
     available.boolean = True
 
+    def expire_now(self, request, queryset):
+        purl_cache.invalidate_queryset(queryset)
+        n = queryset.order_by().update(expire=timezone.now())
+        self.message_user(request, gettext('Expired {} private urls.').format(n))
+
+    expire_now.short_description = _('Expire selected private urls now')
+
+    def reset_counters(self, request, queryset):
+        purl_cache.invalidate_queryset(queryset)
+        n = queryset.order_by().update(hit_counter=0, first_hit=None, last_hit=None)
+        self.message_user(request, gettext('Reset counters of {} private urls.').format(n))
+
+    reset_counters.short_description = _('Reset hit counters of selected private urls')
+
+    def purge_unavailable(self, request, queryset):
+        purl_cache.invalidate_queryset(queryset)
+        n = queryset.order_by().unavailable().delete()[0]
+        self.message_user(request, gettext('Deleted {} private urls that can no longer be used.').format(n))
+
+    purge_unavailable.short_description = _('Delete selected private urls that can no longer be used')
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """
+    Admin of rows that are written by privateurl only, they can be viewed and deleted.
+    Before Django 2.1 (no view permission) change permission is required for changelist,
+    so all fields are read-only and saving is refused instead.
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    if django.VERSION >= (2, 1):
+        def has_change_permission(self, request, obj=None):
+            return False
+
+    def get_readonly_fields(self, request, obj=None):
+        return [f.name for f in self.model._meta.fields]
+
+    def get_actions(self, request):
+        # actions are allowed by change permission before Django 2.1
+        actions = super(ReadOnlyAdmin, self).get_actions(request)
+        for name in list(actions):
+            if name != 'delete_selected':
+                del actions[name]
+        return actions
+
+    def save_model(self, request, obj, form, change):
+        raise PermissionDenied
+
+
+class PrivateUrlStatsAdmin(ReadOnlyAdmin):
+    """
+    Read-only view of daily rollups maintained by privateurl.stats.
+    """
+    list_display = ('date', 'action', 'created', 'redeemed', 'failed', 'expired')
+    list_filter = (ActionListFilter,)
+    date_hierarchy = 'date'
+    ordering = ('-date', 'action')
+
+
+class PrivateUrlHitAdmin(ReadOnlyAdmin):
+    """
+    Read-only view of hit log written by privateurl.hitlog.
+    """
+    list_display = ('created', 'action', 'url_id', 'outcome', 'ip', 'user_agent')
+    list_filter = (ActionListFilter, 'outcome')
+    ordering = ('-pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 admin.site.register(PrivateUrl, PrivateUrlAdmin)
+admin.site.register(PrivateUrlHit, PrivateUrlHitAdmin)
+admin.site.register(PrivateUrlStats, PrivateUrlStatsAdmin)
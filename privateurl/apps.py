@@ -5,3 +5,8 @@ from django.utils.translation import ugettext_lazy as _
 class PrivateURLConfig(AppConfig):
     name = 'privateurl'
     verbose_name = _('Django Private URL')
+
+    def ready(self):
+        from . import cache, settings as purl_settings
+        if purl_settings.PRIVATEURL_CACHE:
+            cache.connect_signals()
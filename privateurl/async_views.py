@@ -0,0 +1,68 @@
+import asyncio
+from timeit import default_timer
+
+from asgiref.sync import sync_to_async
+
+from .metrics import get_metrics, live_receivers, receiver_name
+from .models import PrivateUrl
+from .registry import get_action
+from .signals import privateurl_ok, privateurl_fail
+from .views import get_response, process_hit
+
+
+async def call(func, **named):
+    """
+    Await coroutine function in event loop or call sync function in thread.
+    """
+    if asyncio.iscoroutinefunction(func):
+        return await func(**named)
+    return await sync_to_async(func)(**named)
+
+
+async def asend(signal, name, sender, **named):
+    """
+    Async version of privateurl.metrics.send_signal: async receivers run in event loop, sync ones in thread.
+    """
+    metrics = get_metrics()
+    if not metrics.enabled:
+        results = await sync_to_async(signal.send)(sender, **named)
+        return [(receiver, await result if asyncio.iscoroutine(result) else result) for receiver, result in results]
+    action = named['action']
+    start = default_timer()
+    responses = []
+    for receiver in live_receivers(signal, sender):
+        t = default_timer()
+        responses.append((receiver, await call(receiver, signal=signal, sender=sender, **named)))
+        metrics.timing('receiver', default_timer() - t, action, signal=name, receiver=receiver_name(receiver))
+    metrics.timing(name, default_timer() - start, action)
+    return responses
+
+
+async def adispatch(signal, name, **named):
+    """
+    Async version of privateurl.views.dispatch, sync handler of action runs in thread.
+    """
+    entry = get_action(named['action'])
+    if entry is None:
+        return await asend(signal, name, PrivateUrl, **named)
+    results = []
+    handler = entry.on_ok if name == 'ok' else entry.on_fail
+    if handler is not None:
+        start = default_timer()
+        results.append((handler, await call(handler, **named)))
+        get_metrics().timing('handler', default_timer() - start, named['action'], signal=name)
+    if entry.send_signals:
+        results.extend(await asend(signal, name, PrivateUrl, **named))
+    return results
+
+
+async def privateurl_view(request, action, token):
+    # database and cache are queried in thread, not in event loop
+    obj, reason, now = await sync_to_async(process_hit)(request, action, token)
+    if reason:
+        results = await adispatch(privateurl_fail, 'fail', request=request, obj=obj, action=action, reason=reason)
+    else:
+        results = await adispatch(privateurl_ok, 'ok', request=request, obj=obj, action=action)
+        if obj.auto_delete:
+            await sync_to_async(obj.delete_if_unavailable)(dt=now)
+    return get_response(results, reason)
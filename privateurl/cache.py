@@ -0,0 +1,119 @@
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+
+from . import settings as purl_settings
+from .digest import make_digest
+from .metrics import get_metrics
+
+NOT_FOUND = 'not-found'
+
+
+def get_cache():
+    """
+    Return cache backend for PrivateUrl lookups or None if caching is disabled.
+    """
+    if purl_settings.PRIVATEURL_CACHE:
+        return caches[purl_settings.PRIVATEURL_CACHE]
+
+
+def make_key(action, token, digest=None):
+    """
+    Return cache key of object. Keys are made of digests of tokens if settings.PRIVATEURL_TOKEN_DIGEST is set,
+    so objects whose tokens aren't stored can be invalidated.
+    """
+    if purl_settings.PRIVATEURL_TOKEN_DIGEST:
+        token = digest or make_digest(token)
+    return '{}:{}:{}'.format(purl_settings.PRIVATEURL_CACHE_KEY_PREFIX, action, token)
+
+
+def get_or_none(manager, action, token):
+    """
+    Read-through lookup of PrivateUrl object by action and token.
+    Object is restored from cached row without user, it will be loaded on first access to obj.user.
+    Counters of cached object are a snapshot, PrivateUrl.consume checks them by database.
+    """
+    cache = get_cache()
+    key = make_key(action, token)
+    row = cache.get(key)
+    metrics = get_metrics()
+    if row == NOT_FOUND:
+        metrics.incr('cache', action, result='not_found')
+        return None
+    model = manager.model
+    if row is not None:
+        metrics.incr('cache', action, result='hit')
+        return model.from_db(manager.db, list(row), list(row.values()))
+    metrics.incr('cache', action, result='miss')
+    obj = manager.get_or_none_from_db(action, token)
+    if obj is None:
+        cache.set(key, NOT_FOUND, purl_settings.PRIVATEURL_CACHE_NOT_FOUND_TIMEOUT)
+    else:
+        cache.set(key, make_row(obj), purl_settings.PRIVATEURL_CACHE_TIMEOUT)
+    return obj
+
+
+def make_row(obj):
+    """
+    Return dict of loaded fields of object that can be pickled by cache backends.
+    Binary fields are stored as bytes, some databases (PostgreSQL) return memoryview that can't be pickled.
+    """
+    deferred = obj.get_deferred_fields()
+    row = {}
+    for f in obj._meta.concrete_fields:
+        if f.attname not in deferred:
+            value = getattr(obj, f.attname)
+            row[f.attname] = bytes(value) if isinstance(value, memoryview) else value
+    return row
+
+
+def invalidate(action, token, digest=None):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete(make_key(action, token, digest))
+
+
+def invalidate_many(objs):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete_many([make_key(obj.action, obj.token, obj.token_digest) for obj in objs])
+
+
+def invalidate_queryset(qs, chunk_size=1000):
+    """
+    Invalidate cached objects of queryset before bulk update or delete, which don't send signals.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    keys = []
+    for action, token, digest in qs.order_by().values_list('action', 'token', 'token_digest').iterator():
+        keys.append(make_key(action, token, digest))
+        if len(keys) >= chunk_size:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_receiver(sender, instance, **kwargs):
+    invalidate(instance.action, instance.token, instance.token_digest)
+
+
+def connect_signals():
+    """
+    Connect receivers that invalidate cache on saving or deleting objects of PrivateUrl and its shards.
+    Receivers are connected only when cache is enabled because they disable fast deleting of querysets.
+    """
+    from .sharding import get_models
+    for model in get_models():
+        label = model._meta.label_lower
+        post_save.connect(invalidate_receiver, sender=model, dispatch_uid='privateurl_cache_save_' + label)
+        post_delete.connect(invalidate_receiver, sender=model, dispatch_uid='privateurl_cache_delete_' + label)
+
+
+def disconnect_signals():
+    from .sharding import get_models
+    for model in get_models():
+        label = model._meta.label_lower
+        post_save.disconnect(sender=model, dispatch_uid='privateurl_cache_save_' + label)
+        post_delete.disconnect(sender=model, dispatch_uid='privateurl_cache_delete_' + label)
@@ -0,0 +1,30 @@
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# the first byte of compressed value marks its codec, so values stay readable after changing codec
+CODECS = {
+    'zlib': (b'z', zlib),
+    'bz2': (b'b', bz2),
+    'lzma': (b'x', lzma),
+}
+MARKS = {mark: module for mark, module in CODECS.values()}
+
+
+def compress(text, codec):
+    """
+    Return bytes of text compressed by codec (zlib, bz2 or lzma).
+    """
+    if codec not in CODECS or CODECS[codec][1] is None:
+        raise ValueError('Unsupported data codec: {}'.format(codec))
+    mark, module = CODECS[codec]
+    return mark + module.compress(text.encode('utf-8'))
+
+
+def decompress(value):
+    value = bytes(value)
+    return MARKS[value[:1]].decompress(value[1:]).decode('utf-8')
@@ -0,0 +1,22 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+
+from . import settings as purl_settings
+
+# hex of 128 bits, it doesn't depend on case insensitive collations unlike base64
+DIGEST_SIZE = 32
+
+
+def get_key():
+    return force_bytes(purl_settings.PRIVATEURL_TOKEN_DIGEST_KEY or settings.SECRET_KEY)
+
+
+def make_digest(token):
+    """
+    Return keyed digest of token that is stored instead of token if settings.PRIVATEURL_TOKEN_DIGEST is set:
+    the first 128 bits of HMAC-SHA256 as hex string.
+    """
+    return hmac.new(get_key(), b'privateurl.token:' + force_bytes(token), hashlib.sha256).hexdigest()[:DIGEST_SIZE]
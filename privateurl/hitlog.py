@@ -0,0 +1,197 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import close_old_connections, transaction
+
+from . import settings as purl_settings
+from .metrics import get_metrics
+from .throttling import get_client_ip
+
+logger = logging.getLogger('privateurl.hitlog')
+
+MODES = ('thread', 'on_commit')
+POLICIES = ('drop', 'block')
+
+
+def make_record(request, action, obj, reason, dt):
+    """
+    Return dict of fields of privateurl.models.PrivateUrlHit for hit of private url.
+    """
+    ip = get_client_ip(request)
+    try:
+        validate_ipv46_address(ip)
+    except ValidationError:
+        ip = None
+    return {
+        'created': dt,
+        'action': action,
+        # signed private urls aren't stored, so they have no primary key
+        'url_id': getattr(obj, 'pk', None),
+        'outcome': reason or 'ok',
+        'ip': ip,
+        'user_agent': request.META.get('HTTP_USER_AGENT', '')[:255],
+    }
+
+
+def write_records(records, batch_size):
+    model = apps.get_model('privateurl', 'PrivateUrlHit')
+    model.objects.bulk_create([model(**record) for record in records], batch_size=batch_size)
+    return len(records)
+
+
+class HitLogWriter(object):
+    """
+    Queue of hit records in memory of process that are written by bulk_create.
+    Mode 'thread' writes them from background thread every flush interval or when batch is collected,
+    mode 'on_commit' lets request write them after commit of its transaction when batch is collected
+    or flush interval is over. Records that don't fit queue of max_size are dropped, policy 'block' waits
+    up to block_timeout seconds for background thread before dropping.
+    Queue is written on process exit.
+    """
+
+    def __init__(self, mode, max_size, batch_size, flush_interval, policy='drop', block_timeout=0.1):
+        if mode not in MODES:
+            raise ValueError('Unknown mode of hit log: {}'.format(mode))
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy of hit log: {}'.format(policy))
+        self.mode = mode
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.cond = threading.Condition()
+        self.records = []
+        self.dropped = 0
+        self.flushed_at = time.time()
+        self.thread = None
+        self.stopped = False
+
+    def add(self, record):
+        """
+        Queue record. Return True if caller should flush queue (mode 'on_commit').
+        """
+        with self.cond:
+            if len(self.records) >= self.max_size and self.policy == 'block' and self.thread is not None:
+                self.cond.notify_all()
+                deadline = time.time() + self.block_timeout
+                while len(self.records) >= self.max_size and time.time() < deadline:
+                    self.cond.wait(deadline - time.time())
+            if len(self.records) >= self.max_size:
+                self.dropped += 1
+                get_metrics().incr('hit_log', record['action'], result='dropped')
+                return False
+            self.records.append(record)
+            if self.mode == 'thread':
+                self._start()
+                if len(self.records) >= self.batch_size:
+                    self.cond.notify_all()
+                return False
+        return len(self.records) >= self.batch_size or time.time() - self.flushed_at >= self.flush_interval
+
+    def _start(self):
+        if self.thread is None and not self.stopped:
+            self.thread = threading.Thread(target=self._run, name='privateurl-hitlog')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.stopped and len(self.records) < self.batch_size:
+                    self.cond.wait(self.flush_interval)
+                stopped = self.stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self):
+        """
+        Write queued records. Return number of written records.
+        """
+        with self.cond:
+            records, self.records = self.records, []
+            self.flushed_at = time.time()
+            # producers waiting for free space
+            self.cond.notify_all()
+        if not records:
+            return 0
+        try:
+            if self.thread is not None and threading.current_thread() is self.thread:
+                close_old_connections()
+            return write_records(records, self.batch_size)
+        except Exception:
+            logger.exception('Failed to write %s hits of private urls.', len(records))
+            return 0
+
+    def stop(self, timeout=5):
+        """
+        Stop background thread and write the rest of queue.
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Return hit log writer or None if hit log is disabled (settings.PRIVATEURL_HIT_LOG).
+    """
+    global _writer
+    if not purl_settings.PRIVATEURL_HIT_LOG:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = HitLogWriter(purl_settings.PRIVATEURL_HIT_LOG,
+                                   max_size=purl_settings.PRIVATEURL_HIT_LOG_MAX_SIZE,
+                                   batch_size=purl_settings.PRIVATEURL_HIT_LOG_BATCH_SIZE,
+                                   flush_interval=purl_settings.PRIVATEURL_HIT_LOG_FLUSH_INTERVAL,
+                                   policy=purl_settings.PRIVATEURL_HIT_LOG_POLICY,
+                                   block_timeout=purl_settings.PRIVATEURL_HIT_LOG_BLOCK_TIMEOUT)
+            atexit.register(_writer.stop)
+    return _writer
+
+
+def reset_writer():
+    """
+    Stop current writer (queued records are written), the next one is created by settings.
+    """
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def add(request, action, obj, reason, dt):
+    """
+    Queue hit without writing to database. Return True if caller should flush hit log.
+    """
+    writer = get_writer()
+    return writer.add(make_record(request, action, obj, reason, dt)) if writer is not None else False
+
+
+def log_hit(request, action, obj, reason, dt):
+    """
+    Queue hit, in mode 'on_commit' queue is written after commit of current transaction when it is due.
+    """
+    if add(request, action, obj, reason, dt):
+        transaction.on_commit(flush_hit_log)
+
+
+def flush_hit_log():
+    writer = get_writer()
+    return writer.flush() if writer is not None else 0
@@ -0,0 +1,183 @@
+import atexit
+import threading
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+
+from . import settings as purl_settings
+
+
+DEFAULT_MODEL = 'privateurl.privateurl'
+
+
+def make_ident(pk, model=None):
+    """
+    Return identifier of object in hit buffer: pk for PrivateUrl, "label:pk" for other models.
+    """
+    label = model._meta.label_lower if model is not None else DEFAULT_MODEL
+    return pk if label == DEFAULT_MODEL else '{}:{}'.format(label, pk)
+
+
+def split_hits(hits):
+    """
+    Group hits by models. Return dict {model: {pk: hit}}.
+    """
+    result = {}
+    for ident, hit in hits.items():
+        label, pk = ident.rsplit(':', 1) if isinstance(ident, str) else (DEFAULT_MODEL, ident)
+        model = apps.get_model(label)
+        result.setdefault(model, {})[model._meta.pk.to_python(pk)] = hit
+    return result
+
+
+def apply_hits(hits, batch_size=100, model=None):
+    """
+    Write buffered hits to database using one UPDATE per batch.
+    hits - dict {pk: (count, first_hit, last_hit)}
+    model - model of objects, None for PrivateUrl
+    """
+    model = model or apps.get_model(DEFAULT_MODEL)
+    pks = sorted(hits)
+    for i in range(0, len(pks), batch_size):
+        chunk = pks[i:i + batch_size]
+
+        def case(n, output_field):
+            return Case(*[When(pk=pk, then=Value(hits[pk][n])) for pk in chunk], output_field=output_field)
+
+        model.objects.filter(pk__in=chunk).update(
+            hit_counter=F('hit_counter') + case(0, models.PositiveIntegerField()),
+            first_hit=Coalesce(F('first_hit'), case(1, models.DateTimeField())),
+            last_hit=case(2, models.DateTimeField()),
+        )
+    return len(pks)
+
+
+def flush_to_db(hits):
+    """
+    Write hits of buffer (dict {ident: hit}) to database. Return number of updated objects.
+    """
+    return sum(apply_hits(model_hits, model=model) for model, model_hits in split_hits(hits).items())
+
+
+class MemoryHitBuffer(object):
+    """
+    Accumulate hits in memory of current process.
+    Buffer is flushed on adding hit when flush interval is over and on process exit.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.flushed_at = time.time()
+
+    def add(self, pk, dt, model=None):
+        pk = make_ident(pk, model)
+        with self.lock:
+            count, first_hit, last_hit = self.hits.get(pk, (0, dt, dt))
+            self.hits[pk] = (count + 1, first_hit, dt)
+        if self.flush_interval and time.time() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            hits, self.hits = self.hits, {}
+            self.flushed_at = time.time()
+        return flush_to_db(hits)
+
+
+class CacheHitBuffer(object):
+    """
+    Accumulate hits in cache backend using atomic incr, so hits of all processes are shared.
+    Buffer is flushed by management command privateurl_flush_hits, only one flush should run at once.
+    """
+
+    def __init__(self, cache_alias, key_prefix):
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+
+    def key(self, *parts):
+        return ':'.join([self.key_prefix, 'hits'] + [str(p) for p in parts])
+
+    def incr(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            if self.cache.add(key, 1, timeout=None):
+                return 1
+            return self.cache.incr(key)
+
+    def add(self, pk, dt, model=None):
+        pk = make_ident(pk, model)
+        if self.incr(self.key('count', pk)) == 1:
+            # register object in the list of pending objects when its counter becomes non-zero
+            self.cache.set(self.key('slot', self.incr(self.key('seq'))), pk, timeout=None)
+        self.cache.add(self.key('first', pk), dt, timeout=None)
+        self.cache.set(self.key('last', pk), dt, timeout=None)
+
+    def flush(self):
+        start = self.cache.get(self.key('start'), 1)
+        end = self.cache.get(self.key('seq'), 0)
+        slot_keys = [self.key('slot', n) for n in range(start, end + 1)]
+        pks = set(self.cache.get_many(slot_keys).values())
+        hits, pending = {}, []
+        for pk in pks:
+            count = self.cache.get(self.key('count', pk)) or 0
+            if count <= 0:
+                continue
+            first_hit, last_hit = self.cache.get(self.key('first', pk)), self.cache.get(self.key('last', pk))
+            self.cache.delete(self.key('first', pk))
+            hits[pk] = (count, first_hit or last_hit, last_hit)
+            try:
+                if self.cache.decr(self.key('count', pk), count) > 0:
+                    pending.append(pk)
+            except ValueError:
+                # counter was evicted after reading, hits added since then registered object again
+                pass
+        for pk in pending:
+            self.cache.set(self.key('slot', self.incr(self.key('seq'))), pk, timeout=None)
+        self.cache.set(self.key('start'), end + 1, timeout=None)
+        self.cache.delete_many(slot_keys)
+        return flush_to_db(hits)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_hit_buffer():
+    """
+    Return hit buffer selected by settings.PRIVATEURL_HIT_BUFFER or None if buffering is disabled.
+    """
+    global _buffer
+    if not purl_settings.PRIVATEURL_HIT_BUFFER:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            if purl_settings.PRIVATEURL_HIT_BUFFER == 'memory':
+                _buffer = MemoryHitBuffer(purl_settings.PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL)
+                atexit.register(_buffer.flush)
+            elif purl_settings.PRIVATEURL_HIT_BUFFER == 'cache':
+                _buffer = CacheHitBuffer(purl_settings.PRIVATEURL_HIT_BUFFER_CACHE,
+                                         purl_settings.PRIVATEURL_CACHE_KEY_PREFIX)
+            else:
+                raise ValueError('Unknown PRIVATEURL_HIT_BUFFER value: {}'.format(purl_settings.PRIVATEURL_HIT_BUFFER))
+    return _buffer
+
+
+def reset_hit_buffer():
+    global _buffer
+    with _buffer_lock:
+        _buffer = None
+
+
+def flush_hits():
+    """
+    Write hits accumulated by buffer to database. Return number of updated objects.
+    """
+    hit_buffer = get_hit_buffer()
+    return hit_buffer.flush() if hit_buffer else 0
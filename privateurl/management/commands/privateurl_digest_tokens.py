@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from privateurl import cache as purl_cache, settings as purl_settings
+from privateurl.digest import make_digest
+from privateurl.sharding import get_models
+
+
+class Command(BaseCommand):
+    help = ('Store digests of tokens of existing private urls (see PRIVATEURL_TOKEN_DIGEST). '
+            'Rows are updated in chunks of primary key ranges.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows updated per query.')
+        parser.add_argument('--clear-tokens', action='store_true',
+                            help='Remove tokens of rows after storing their digests.')
+        parser.add_argument('--dry-run', action='store_true', help='Only show number of rows to update.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be greater than 0.')
+        if options['clear_tokens'] and not purl_settings.PRIVATEURL_TOKEN_DIGEST:
+            raise CommandError('Tokens can be removed only if PRIVATEURL_TOKEN_DIGEST is set, '
+                               'otherwise urls would not be found.')
+        verbose = options['verbosity'] > 0
+        for model in get_models():
+            qs = model.objects.filter(token__isnull=False)
+            if not options['clear_tokens']:
+                qs = qs.filter(token_digest__isnull=True)
+            if options['dry_run']:
+                if verbose:
+                    self.stdout.write('{}: {} rows.'.format(model._meta.label, qs.count()))
+                continue
+            n = self.convert(model, qs, options['batch_size'], options['clear_tokens'])
+            if verbose:
+                self.stdout.write('{}: updated {} rows.'.format(model._meta.label, n))
+
+    def convert(self, model, qs, batch_size, clear_tokens):
+        n, last_pk = 0, None
+        fields = ['token_digest', 'token'] if clear_tokens else ['token_digest']
+        while True:
+            chunk = qs.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values_list('pk', 'action', 'token')[:batch_size])
+            if not rows:
+                return n
+            objs = [model(pk=pk, action=action, token=None if clear_tokens else token,
+                          token_digest=make_digest(token)) for pk, action, token in rows]
+            if hasattr(model.objects, 'bulk_update'):
+                model.objects.bulk_update(objs, fields)
+            else:
+                for obj in objs:
+                    model.objects.filter(pk=obj.pk).update(**dict((f, getattr(obj, f)) for f in fields))
+            purl_cache.invalidate_many(objs)
+            n += len(rows)
+            last_pk = rows[-1][0]
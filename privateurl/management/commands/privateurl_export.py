@@ -0,0 +1,68 @@
+import datetime
+import io
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from privateurl import serialization
+from privateurl.sharding import get_models
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Date must be in format YYYY-MM-DD, got "{}".'.format(value))
+
+
+class Command(BaseCommand):
+    help = 'Export private urls with their stats to CSV or JSON Lines. Rows are streamed by chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Output file, standard output by default.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Output format, by default it is csv for .csv files and jsonl otherwise.')
+        parser.add_argument('--action', action='append', dest='actions', default=[],
+                            help='Export only this action (can be used several times).')
+        parser.add_argument('--created-from', type=parse_date, help='Export urls created on this date or later.')
+        parser.add_argument('--created-to', type=parse_date, help='Export urls created before this date.')
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--available', action='store_true', help='Export only urls that can be used.')
+        group.add_argument('--unavailable', action='store_true', help='Export only urls that can no longer be used.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows fetched per query.')
+
+    def get_queryset(self, model, options, now):
+        qs = model.objects.all()
+        if options['actions']:
+            qs = qs.filter(action__in=options['actions'])
+        tz = timezone.get_current_timezone()
+        if options['created_from']:
+            qs = qs.filter(created__gte=timezone.make_aware(
+                datetime.datetime.combine(options['created_from'], datetime.time()), tz))
+        if options['created_to']:
+            qs = qs.filter(created__lt=timezone.make_aware(
+                datetime.datetime.combine(options['created_to'], datetime.time()), tz))
+        if options['available']:
+            qs = qs.available(now)
+        elif options['unavailable']:
+            qs = qs.unavailable(now)
+        return qs
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be greater than 0.')
+        fmt = options['format'] or ('csv' if (options['output'] or '').endswith('.csv') else 'jsonl')
+        now = timezone.now()
+        rows = itertools.chain.from_iterable(
+            serialization.export_rows(self.get_queryset(model, options, now), chunk_size=options['chunk_size'])
+            for model in get_models()
+        )
+        write = serialization.write_csv if fmt == 'csv' else serialization.write_jsonl
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                n = write(rows, f)
+            if options['verbosity'] > 0:
+                self.stdout.write('Exported {} private urls.'.format(n))
+        else:
+            write(rows, self.stdout)
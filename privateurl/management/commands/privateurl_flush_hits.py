@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from privateurl.hits import flush_hits
+
+
+class Command(BaseCommand):
+    help = 'Write hits of unlimited private urls accumulated by hit buffer to database.'
+
+    def handle(self, *args, **options):
+        n = flush_hits()
+        if options['verbosity'] > 0:
+            self.stdout.write('Updated {} private urls.'.format(n))
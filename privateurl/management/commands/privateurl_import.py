@@ -0,0 +1,43 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from privateurl import serialization
+
+
+class Command(BaseCommand):
+    help = 'Import private urls from CSV or JSON Lines file made by privateurl_export using batched inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Input file, "-" for standard input.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Input format, by default it is csv for .csv files and jsonl otherwise.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows inserted per query.')
+        parser.add_argument('--conflict', choices=serialization.CONFLICTS, default='skip',
+                            help='What to do with urls whose action and token exist: skip (default), update '
+                                 'or error (stop import, previous batches are kept).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be greater than 0.')
+        fmt = options['format'] or ('csv' if options['input'].endswith('.csv') else 'jsonl')
+        read = serialization.read_csv if fmt == 'csv' else serialization.read_jsonl
+        if options['input'] == '-':
+            stream = sys.stdin
+        else:
+            stream = io.open(options['input'], encoding='utf-8', newline='')
+        try:
+            stats = serialization.import_rows(read(stream), batch_size=options['batch_size'],
+                                              conflict=options['conflict'])
+        except KeyError as e:
+            raise CommandError('Field {} is missing.'.format(e))
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if options['verbosity'] > 0:
+            self.stdout.write('Created {created}, updated {updated}, skipped {skipped}, '
+                              'skipped with unknown users {unknown_user}.'.format(**{
+                                  k: stats[k] for k in ('created', 'updated', 'skipped', 'unknown_user')}))
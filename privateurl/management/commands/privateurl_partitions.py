@@ -0,0 +1,51 @@
+import datetime
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError, connections, router
+from django.utils import timezone
+
+from privateurl import sharding
+
+
+def parse_month(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError('Month must be in format YYYY-MM, got "{}".'.format(value))
+
+
+class Command(BaseCommand):
+    help = 'Create monthly partitions of private urls model ahead and drop old ones (PostgreSQL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Label of model partitioned by month, e.g. myapp.TrackingUrl.')
+        parser.add_argument('--months', type=int, default=3,
+                            help='Number of months (starting from the current one) to create partitions for.')
+        parser.add_argument('--drop-before', type=parse_month,
+                            help='Drop partitions of months earlier than this one (YYYY-MM).')
+        parser.add_argument('--dry-run', action='store_true', help='Only show partitions that would be dropped.')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        if not sharding.is_shard(model):
+            raise CommandError('Model {} doesn\'t store private urls.'.format(model._meta.label))
+        connection = connections[router.db_for_write(model)]
+        verbose = options['verbosity'] > 0
+        try:
+            if not options['dry_run']:
+                today = timezone.localdate() if hasattr(timezone, 'localdate') else timezone.now().date()
+                for name in sharding.create_partitions(model, connection, today, options['months']):
+                    if verbose:
+                        self.stdout.write('Created partition {}.'.format(name))
+            if options['drop_before']:
+                for name in sharding.drop_partitions(model, connection, options['drop_before'],
+                                                     dry_run=options['dry_run']):
+                    if verbose:
+                        self.stdout.write('{} partition {}.'.format(
+                            'Would drop' if options['dry_run'] else 'Dropped', name))
+        except (ValueError, NotSupportedError) as e:
+            raise CommandError(str(e))
@@ -0,0 +1,92 @@
+import datetime
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from privateurl.models import PrivateUrl
+from privateurl.sharding import get_models
+
+
+def parse_retention(value):
+    try:
+        action, days = value.split('=')
+        return action, int(days)
+    except ValueError:
+        raise CommandError('Retention must be in format action=days, got "{}".'.format(value))
+
+
+class Command(BaseCommand):
+    help = 'Delete private urls that can no longer be used. Rows are deleted in chunks of primary key ranges.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', action='append', dest='actions', default=[],
+                            help='Purge only this action (can be used several times).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows deleted per query.')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to sleep between batches.')
+        parser.add_argument('--retention', type=int, default=0,
+                            help='Keep unusable rows for this number of days after expire or last hit.')
+        parser.add_argument('--action-retention', action='append', dest='action_retentions', default=[],
+                            type=parse_retention, help='Retention for action in format action=days.')
+        parser.add_argument('--dry-run', action='store_true', help='Only show number of rows per action.')
+
+    def get_queryset(self, actions, retention, action_retentions, now=None, model=PrivateUrl):
+        """
+        Return queryset of rows to delete. Row is deleted if it is unavailable (see PrivateUrl.is_available)
+        and it has become unavailable earlier than retention of its action.
+        """
+        now = now or timezone.now()
+
+        def cutoff_q(days):
+            cutoff = now - datetime.timedelta(days=days)
+            exhausted = Q(hits_limit__gt=0, hit_counter__gte=F('hits_limit'))
+            return Q(expire__lte=cutoff) | exhausted & (Q(last_hit__lte=cutoff) | Q(last_hit__isnull=True))
+
+        q = ~Q(action__in=list(action_retentions)) & cutoff_q(retention)
+        for action, days in action_retentions.items():
+            q |= Q(action=action) & cutoff_q(days)
+        qs = model.objects.unavailable(now).filter(q)
+        if actions:
+            qs = qs.filter(action__in=actions)
+        return qs.order_by()
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be greater than 0.')
+        now = timezone.now()
+        querysets = [self.get_queryset(options['actions'], options['retention'], dict(options['action_retentions']),
+                                       now=now, model=model) for model in get_models()]
+        if options['dry_run']:
+            counts = Counter()
+            for qs in querysets:
+                for row in qs.values('action').annotate(n=Count('pk')).order_by('action'):
+                    counts[row['action']] += row['n']
+            for action in sorted(counts):
+                self.stdout.write('{}: {}'.format(action, counts[action]))
+            self.stdout.write('Total: {}'.format(sum(counts.values())))
+            return
+        total = sum(self.purge(qs, options) for qs in querysets)
+        if options['verbosity'] > 0:
+            self.stdout.write('Purged {} private urls.'.format(total))
+
+    def purge(self, qs, options):
+        """
+        Delete rows of queryset in chunks. Return number of deleted rows.
+        """
+        verbose = options['verbosity'] > 0
+        total, last_pk = 0, None
+        while True:
+            chunk = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+            pks = list(chunk.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            deleted, _ = qs.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+            total += deleted
+            last_pk = pks[-1]
+            if verbose:
+                self.stdout.write('Deleted {} rows (total {}).'.format(deleted, total))
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        return total
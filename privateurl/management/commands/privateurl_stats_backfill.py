@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from privateurl.sharding import get_models
+from privateurl.stats import collect_rollups, fill_stats, flush_stats
+
+
+class Command(BaseCommand):
+    help = ('Fill daily usage stats (created and redeemed counters) from existing private urls for days '
+            'that have no stats yet. Rows are aggregated in chunks of primary key ranges.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', action='append', dest='actions', default=[],
+                            help='Backfill only this action (can be used several times).')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of primary keys aggregated per query.')
+        parser.add_argument('--dry-run', action='store_true', help='Only show counters per action and date.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be greater than 0.')
+        # rollups of counters buffered by this process exist after flush, so they aren't filled twice
+        flush_stats()
+        counts = {}
+        for model in get_models():
+            qs = model.objects.all()
+            if options['actions']:
+                qs = qs.filter(action__in=options['actions'])
+            collect_rollups(qs, chunk_size=options['chunk_size'], counts=counts)
+        verbose = options['verbosity'] > 0
+        if options['dry_run']:
+            if verbose:
+                for (action, date), values in sorted(counts.items()):
+                    self.stdout.write('{} {}: created {}, redeemed {}'.format(
+                        action, date, values['created'], values['redeemed']))
+            return
+        n = fill_stats(counts)
+        if verbose:
+            self.stdout.write('Created {} daily stats.'.format(n))
@@ -0,0 +1,127 @@
+import logging
+import threading
+from timeit import default_timer
+
+from django.utils.module_loading import import_string
+
+from . import settings as purl_settings
+
+logger = logging.getLogger('privateurl.metrics')
+
+
+class BaseMetrics(object):
+    """
+    Base class of metrics backends. Backend is selected by settings.PRIVATEURL_METRICS_BACKEND.
+    Names of timings: lookup, counter, ok, fail (all receivers of signal), receiver (one receiver).
+    Names of counters: ok, fail (tag reason), cache (tag result).
+    Methods record nothing, subclasses override ones they need.
+    """
+    enabled = True
+
+    def timing(self, name, seconds, action, **tags):
+        pass
+
+    def incr(self, name, action, value=1, **tags):
+        pass
+
+
+class NullMetrics(BaseMetrics):
+    """
+    Default backend that records nothing, durations aren't measured.
+    """
+    enabled = False
+
+
+class LoggingMetrics(BaseMetrics):
+    """
+    Write metrics to logger privateurl.metrics with level DEBUG.
+    """
+
+    def format_tags(self, action, tags):
+        return ' '.join('{}={}'.format(k, v) for k, v in sorted(dict(tags, action=action).items()))
+
+    def timing(self, name, seconds, action, **tags):
+        logger.debug('privateurl.%s %.3fms %s', name, seconds * 1000, self.format_tags(action, tags))
+
+    def incr(self, name, action, value=1, **tags):
+        logger.debug('privateurl.%s +%s %s', name, value, self.format_tags(action, tags))
+
+
+class InMemoryMetrics(BaseMetrics):
+    """
+    Collect counters and aggregated timings in memory of process (like statsd does).
+    Use snapshot() for reading and reset() for clearing collected values.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    @staticmethod
+    def key(name, action, tags):
+        return (name, action) + tuple(sorted(tags.items()))
+
+    def timing(self, name, seconds, action, **tags):
+        key = self.key(name, action, tags)
+        with self.lock:
+            count, total, maximum = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def incr(self, name, action, value=1, **tags):
+        key = self.key(name, action, tags)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'timings': dict(self.timings)}
+
+    def reset(self):
+        with self.lock:
+            self.counters, self.timings = {}, {}
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        path = purl_settings.PRIVATEURL_METRICS_BACKEND
+        _metrics = import_string(path)() if path else NullMetrics()
+    return _metrics
+
+
+def reset_metrics():
+    global _metrics
+    _metrics = None
+
+
+def receiver_name(receiver):
+    return '{}.{}'.format(getattr(receiver, '__module__', ''),
+                          getattr(receiver, '__qualname__', getattr(receiver, '__name__', repr(receiver))))
+
+
+def live_receivers(signal, sender):
+    """
+    Return list of receivers connected to signal for sender.
+    """
+    return list(signal._live_receivers(sender))
+
+
+def send_signal(signal, name, sender, **named):
+    """
+    Send signal and record duration of every receiver if metrics are enabled.
+    """
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return signal.send(sender, **named)
+    action = named['action']
+    start = default_timer()
+    responses = []
+    for receiver in live_receivers(signal, sender):
+        t = default_timer()
+        responses.append((receiver, receiver(signal=signal, sender=sender, **named)))
+        metrics.timing('receiver', default_timer() - t, action, signal=name, receiver=receiver_name(receiver))
+    metrics.timing(name, default_timer() - start, action)
+    return responses
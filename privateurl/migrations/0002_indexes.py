@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+# conditional indexes are available since Django 2.2
+PARTIAL_INDEXES = django.VERSION >= (2, 2)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('privateurl', '0001_initial'),
+    ]
+
+    operations = [
+        # action and token are looked up only together by unique index (action, token)
+        migrations.AlterField(
+            model_name='privateurl',
+            name='action',
+            field=models.SlugField(db_index=False, max_length=40,
+                                   validators=[django.core.validators.RegexValidator('^[-_a-zA-Z0-9]+$')],
+                                   verbose_name='action'),
+        ),
+        migrations.AlterField(
+            model_name='privateurl',
+            name='token',
+            field=models.SlugField(db_index=False, max_length=64,
+                                   validators=[django.core.validators.RegexValidator('^[-a-zA-Z0-9]+$')],
+                                   verbose_name='token'),
+        ),
+        # used by create(..., replace=True)
+        migrations.AlterIndexTogether(
+            name='privateurl',
+            index_together={('action', 'user')},
+        ),
+    ]
+
+    if PARTIAL_INDEXES:
+        operations += [
+            migrations.AlterField(
+                model_name='privateurl',
+                name='expire',
+                field=models.DateTimeField(blank=True, null=True, verbose_name='expire'),
+            ),
+            migrations.AddIndex(
+                model_name='privateurl',
+                index=models.Index(condition=models.Q(expire__isnull=False), fields=['expire'],
+                                   name='privateurl_expire_notnull'),
+            ),
+        ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privateurl', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privateurl',
+            name='data_compressed',
+            field=models.BinaryField(blank=True, null=True, verbose_name='compressed data'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privateurl', '0003_data_compressed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivateUrlStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.SlugField(db_index=False, max_length=40, verbose_name='action')),
+                ('date', models.DateField(verbose_name='date')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='created')),
+                ('redeemed', models.PositiveIntegerField(default=0, verbose_name='redeemed')),
+                ('failed', models.PositiveIntegerField(default=0, help_text='Failed hits except hits of expired urls.', verbose_name='failed')),
+                ('expired', models.PositiveIntegerField(default=0, help_text='Hits of expired urls.', verbose_name='expired')),
+            ],
+            options={
+                'verbose_name': 'private url stats',
+                'verbose_name_plural': 'private url stats',
+                'ordering': ('-date', 'action'),
+                'unique_together': {('action', 'date')},
+                'index_together': {('date', 'action')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:17
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privateurl', '0004_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privateurl',
+            name='token_digest',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, verbose_name='token digest'),
+        ),
+        migrations.AlterField(
+            model_name='privateurl',
+            name='token',
+            field=models.SlugField(db_index=False, max_length=64, null=True, validators=[django.core.validators.RegexValidator('^[-a-zA-Z0-9]+$')], verbose_name='token'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='privateurl',
+            unique_together={('action', 'token_digest'), ('action', 'token')},
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privateurl', '0005_token_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivateUrlHit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='created')),
+                ('action', models.SlugField(db_index=False, max_length=40, verbose_name='action')),
+                ('url_id', models.BigIntegerField(blank=True, null=True, verbose_name='private url id')),
+                ('outcome', models.CharField(help_text='"ok" or reason of fail.', max_length=20, verbose_name='outcome')),
+                ('ip', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP address')),
+                ('user_agent', models.CharField(blank=True, max_length=255, verbose_name='user agent')),
+            ],
+            options={
+                'verbose_name': 'private url hit',
+                'verbose_name_plural': 'private url hits',
+                'ordering': ('-pk',),
+                'index_together': {('action', 'created')},
+            },
+        ),
+    ]
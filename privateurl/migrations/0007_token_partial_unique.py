@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:36
+
+import django
+from django.db import migrations, models
+
+# names of constraints of abstract models can contain %(class)s since Django 3.0
+PARTIAL_UNIQUE = django.VERSION >= (3, 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privateurl', '0006_hit_log'),
+    ]
+
+    operations = []
+
+    if PARTIAL_UNIQUE:
+        operations += [
+            # rows whose tokens are stored as digests only have NULL tokens, they are left out of index
+            migrations.AddConstraint(
+                model_name='privateurl',
+                constraint=models.UniqueConstraint(condition=models.Q(token__isnull=False), fields=('action', 'token'),
+                                                   name='privateurl_privateurl_token_uniq'),
+            ),
+            migrations.AlterUniqueTogether(
+                name='privateurl',
+                unique_together={('action', 'token_digest')},
+            ),
+        ]
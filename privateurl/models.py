@@ -1,42 +1,314 @@
 import datetime
 import json
+import os
 import random
+import re
+import sqlite3
+from collections import Counter
 
+import django
 from django.conf import settings
-
-try:
-    from django.urls import reverse
-except ImportError:
-    from django.core.urlresolvers import reverse  # noqa
 from django.core.validators import RegexValidator
 from django.db import models, IntegrityError
-from django.db import transaction
+from django.db import connections, router, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
-from . import settings as purl_settings
+from . import compression, cache as purl_cache, hits as purl_hits, registry, settings as purl_settings
+from . import sharding, stats as purl_stats, urlbuilder
+from .digest import DIGEST_SIZE, make_digest
+
+
+# conditional indexes are available since Django 2.2
+PARTIAL_INDEXES = django.VERSION >= (2, 2)
+# names of constraints of abstract models can contain %(class)s since Django 3.0
+PARTIAL_UNIQUE = django.VERSION >= (3, 0)
+
+TOKEN_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+_sysrandom = random.SystemRandom()
+_token_configs = {}
+_token_res = {}
+# characters of tokens of any size and dashed_piece_size
+_token_chars_re = re.compile(r'^[-a-zA-Z0-9]+$')
+
+
+def random_chars(length):
+    """
+    Return string of cryptographically random symbols from TOKEN_ALPHABET.
+    Bytes greater than the largest multiple of alphabet size are dropped, so symbols are distributed uniformly.
+    """
+    limit = 256 - 256 % len(TOKEN_ALPHABET)
+    chars = []
+    while len(chars) < length:
+        chars.extend(TOKEN_ALPHABET[b % len(TOKEN_ALPHABET)] for b in bytearray(os.urandom(length + 8)) if b < limit)
+    return ''.join(chars[:length])
+
+
+def can_update_returning(connection):
+    """
+    Return True if database backend supports UPDATE ... RETURNING statement.
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return False
+
+
+PROJECTION_KEYS = ('select_user', 'user_fields', 'defer_data')
+
 
+def get_projection(action):
+    """
+    Return dict that controls which columns are loaded by lookup of action: settings.PRIVATEURL_PROJECTION
+    updated by settings.PRIVATEURL_ACTION_PROJECTIONS[action].
+    select_user - join user, bool
+    user_fields - names of user fields that are loaded by join, None loads all of them
+    defer_data - don't load data until get_data() is called, bool
+    """
+    projection = {'select_user': True, 'user_fields': None, 'defer_data': purl_settings.PRIVATEURL_DEFER_DATA}
+    projection.update(purl_settings.PRIVATEURL_PROJECTION)
+    projection.update(purl_settings.PRIVATEURL_ACTION_PROJECTIONS.get(action, {}))
+    unknown = set(projection) - set(PROJECTION_KEYS)
+    if unknown:
+        raise ValueError('Unknown projection keys of action {}: {}'.format(action, ', '.join(sorted(unknown))))
+    return projection
 
-class PrivateUrlManager(models.Manager):
+
+def restore_token(obj, token):
+    """
+    Set token of object found by digest of token, return object.
+    """
+    if obj is not None and obj.token is None:
+        obj.token = token
+    return obj
+
+
+class PrivateUrlQuerySet(models.QuerySet):
+    def available(self, dt=None):
+        """
+        Filter objects that can be used (the same rules as PrivateUrl.is_available).
+        """
+        return self.filter(self.model.available_q(dt))
+
+    def unavailable(self, dt=None):
+        """
+        Filter objects that can no longer be used.
+        """
+        return self.exclude(self.model.available_q(dt))
+
+
+class PrivateUrlManager(models.Manager.from_queryset(PrivateUrlQuerySet)):
     def get_or_none(self, action, token):
-        try:
-            return self.select_related('user').get(action=action, token=token)
-        except self.model.DoesNotExist:
-            pass
+        model = self.model.get_shard(action)
+        if model is not self.model:
+            return model.objects.get_or_none(action, token)
+        if purl_settings.PRIVATEURL_CACHE:
+            obj = purl_cache.get_or_none(self, action, token)
+        else:
+            obj = self.get_or_none_from_db(action, token)
+        return restore_token(obj, token)
 
+    def revoke(self, user=None, actions=None, created_before=None, hard=False, batch_size=1000):
+        """
+        Revoke private urls by set-based queries, at least one filter is required.
+        user - user object or its primary key
+        actions - list of names of actions, None for all actions
+        created_before - revoke only urls created before this time, datetime
+        hard - delete rows by chunks of batch_size without fetching objects and sending signals, bool,
+            otherwise urls that can be used are expired now by one UPDATE
+        Cached objects are invalidated. Manager of PrivateUrl revokes urls in all shards.
+        Return number of revoked urls.
+        """
+        if user is None and actions is None and created_before is None:
+            raise ValueError('Pass user, actions or created_before for revoking private urls.')
+        if batch_size < 1:
+            raise ValueError('Argument batch_size must be greater than 0.')
+        now = timezone.now()
+        total = 0
+        for model in sharding.get_models() if self.model is PrivateUrl else [self.model]:
+            qs = model.objects.order_by()
+            if user is not None:
+                qs = qs.filter(user=user)
+            if actions is not None:
+                qs = qs.filter(action__in=list(actions))
+            if created_before is not None:
+                qs = qs.filter(created__lt=created_before)
+            if hard:
+                while True:
+                    pks = list(qs.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                    if not pks:
+                        break
+                    chunk = model.objects.filter(pk__in=pks)
+                    purl_cache.invalidate_queryset(chunk)
+                    total += chunk._raw_delete(chunk.db)
+            else:
+                qs = qs.available(now)
+                purl_cache.invalidate_queryset(qs)
+                total += qs.update(expire=now)
+        return total
+
+    def get_many(self, pairs, chunk_size=500):
+        """
+        Find objects by pairs (action, token) without cache. Tokens of action are fetched by one query
+        per chunk of chunk_size (and one more for tokens not found by digest if fallback is enabled,
+        see get_token_lookups).
+        Return dict {(action, token): object} of found objects.
+        """
+        by_action = {}
+        for action, token in pairs:
+            by_action.setdefault(action, {})[token] = None
+        result = {}
+        for action, tokens in by_action.items():
+            model = self.model.get_shard(action)
+            qs = model.objects.get_lookup_queryset(action).order_by()
+            if model.partition_by_month:
+                # the newest object of duplicate token wins
+                qs = qs.order_by('created', 'pk')
+            tokens = list(tokens)
+            for i in range(0, len(tokens), chunk_size):
+                for token, obj in model.objects._get_chunk(qs, action, tokens[i:i + chunk_size]).items():
+                    result[(action, token)] = obj
+        return result
+
+    def _get_chunk(self, qs, action, tokens):
+        if not purl_settings.PRIVATEURL_TOKEN_DIGEST:
+            return dict((obj.token, obj) for obj in qs.filter(action=action, token__in=tokens))
+        digests = dict((make_digest(token), token) for token in tokens)
+        result = dict((digests[obj.token_digest], obj)
+                      for obj in qs.filter(action=action, token_digest__in=list(digests)))
+        missing = [token for token in tokens if token not in result]
+        if missing and purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK:
+            result.update((obj.token, obj) for obj in qs.filter(action=action, token__in=missing,
+                                                                token_digest__isnull=True))
+        for token, obj in result.items():
+            restore_token(obj, token)
+        return result
+
+    def verify_many(self, action, tokens, consume=False):
+        """
+        Check many tokens of action by one query per chunk of tokens.
+        consume - count hits of available tokens by one conditional UPDATE, bool
+        Return dict {token: reason} where reason is None if url is available (it was used if consume is set),
+        otherwise reason of fail like in privateurl_fail signal: 'not_found', 'expired', 'limit_reached',
+        'unknown_action' or 'invalid_token'. Signals aren't sent, consumed hits are counted by stats.
+        Signed tokens are checked without database if settings.PRIVATEURL_SIGNED_TOKENS is set.
+        """
+        from .signing import SignedPrivateUrl
+        model = self.model.get_shard(action)
+        now = timezone.now()
+        result, lookup, signed = {}, [], {}
+        for token in tokens:
+            obj = SignedPrivateUrl.load(action, token) if purl_settings.PRIVATEURL_SIGNED_TOKENS else None
+            if obj is not None:
+                result[token] = obj.unavailable_reason(dt=now)
+                if result[token] is None:
+                    signed[token] = obj
+                continue
+            result[token] = model.precheck(action, token)
+            if result[token] is None:
+                lookup.append(token)
+        found = model.objects.get_many([(action, token) for token in lookup])
+        objs = {}
+        for token in lookup:
+            obj = found.get((action, token))
+            result[token] = 'not_found' if obj is None else obj.unavailable_reason(dt=now)
+            if result[token] is None:
+                objs[token] = obj
+        if not consume:
+            return result
+        for token, obj in signed.items():
+            if not obj.consume(dt=now):
+                result[token] = obj.unavailable_reason(dt=now) or 'limit_reached'
+        counted = set(id(obj) for obj in model.consume_many(list(objs.values()), dt=now))
+        for token, obj in objs.items():
+            if id(obj) not in counted:
+                result[token] = obj.unavailable_reason(dt=now) or 'limit_reached'
+        exhausted = [obj.pk for obj in objs.values() if id(obj) in counted and obj.auto_delete
+                     and obj.pk is not None and not obj.is_available(dt=now)]
+        if exhausted:
+            model.objects.filter(pk__in=exhausted).unavailable(now).delete()
+        fields = Counter(purl_stats.get_field(reason) for reason in result.values())
+        for field, n in fields.items():
+            purl_stats.record(action, field, n=n, dt=now)
+        return result
+
+    def get_token_lookups(self, token):
+        """
+        Return list of filters that are tried one by one for finding object by token.
+        If settings.PRIVATEURL_TOKEN_DIGEST is set object is found by digest and then by token if it has no digest
+        yet and settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK is set.
+        """
+        if not purl_settings.PRIVATEURL_TOKEN_DIGEST:
+            return [{'token': token}]
+        lookups = [{'token_digest': make_digest(token)}]
+        if purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK:
+            # rows that haven't been converted by privateurl_digest_tokens command
+            lookups.append({'token': token, 'token_digest__isnull': True})
+        return lookups
 
-class PrivateUrl(models.Model):
+    def get_lookup_queryset(self, action):
+        """
+        Return queryset for looking up objects of action with projection of action (see get_projection).
+        """
+        projection = get_projection(action)
+        qs = self.all()
+        user_model = self.model._meta.get_field('user').related_model
+        # users can't be joined if they are stored in other database than shard
+        if projection['select_user'] and router.db_for_read(self.model) == router.db_for_read(user_model):
+            qs = qs.select_related('user')
+            if projection['user_fields'] is not None:
+                fields = [f.name for f in self.model._meta.concrete_fields]
+                qs = qs.only(*fields + ['user__' + f for f in projection['user_fields']])
+        if projection['defer_data']:
+            qs = qs.defer('data', 'data_compressed')
+        return qs
+
+    def get_or_none_from_db(self, action, token):
+        """
+        Find object by action and token in database. Tokens of partitioned models aren't unique
+        (see privateurl.sharding.PartitionByMonth), the newest object is returned for duplicate token.
+        """
+        qs = self.get_lookup_queryset(action)
+        for lookup in self.get_token_lookups(token):
+            if self.model.partition_by_month:
+                obj = qs.filter(action=action, **lookup).order_by('-created', '-pk').first()
+                if obj is not None:
+                    return obj
+                continue
+            try:
+                return qs.get(action=action, **lookup)
+            except self.model.DoesNotExist:
+                pass
+
+
+class AbstractPrivateUrl(models.Model):
+    """
+    Base of models that store private urls. Subclasses can be used as shards for actions
+    (see settings.PRIVATEURL_SHARDS).
+    """
     TOKEN_MIN_SIZE = 8
     TOKEN_MAX_SIZE = 64
 
+    # alias of database where model is stored, it is used by privateurl.sharding.PrivateUrlRouter
+    shard_database = None
+    # table is partitioned by month of created (PostgreSQL), see privateurl.sharding.PartitionByMonth
+    partition_by_month = False
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('user'), null=True, blank=True,
                              on_delete=models.CASCADE)
-    action = models.SlugField(verbose_name=_('action'), max_length=40, db_index=True,
+    action = models.SlugField(verbose_name=_('action'), max_length=40, db_index=False,
                               validators=[RegexValidator(r'^[-_a-zA-Z0-9]+$')])
-    token = models.SlugField(verbose_name=_('token'), max_length=TOKEN_MAX_SIZE,
+    # token is NULL if only its digest is stored (settings.PRIVATEURL_TOKEN_DIGEST)
+    token = models.SlugField(verbose_name=_('token'), max_length=TOKEN_MAX_SIZE, db_index=False, null=True,
                              validators=[RegexValidator(r'^[-a-zA-Z0-9]+$')])
+    token_digest = models.CharField(verbose_name=_('token digest'), max_length=DIGEST_SIZE, null=True, blank=True,
+                                    editable=False)
     expire = models.DateTimeField(verbose_name=_('expire'), null=True, blank=True, db_index=True)
     data = models.TextField(verbose_name=_('data'), blank=True)
+    data_compressed = models.BinaryField(verbose_name=_('compressed data'), null=True, blank=True, editable=False)
     created = models.DateTimeField(verbose_name=_('created'), auto_now_add=True, db_index=True)
     hits_limit = models.PositiveIntegerField(verbose_name=_('hits limit'), default=1,
                                              help_text=_('Set 0 to unlimited.'))
@@ -49,24 +321,80 @@ class PrivateUrl(models.Model):
     objects = PrivateUrlManager()
 
     class Meta:
-        db_table = 'privateurl_privateurl'
+        abstract = True
         ordering = ('-created',)
-        unique_together = ('action', 'token')
+        if PARTIAL_UNIQUE:
+            # tokens of rows that store only digest are NULL, they aren't indexed
+            unique_together = (('action', 'token_digest'),)
+            constraints = [
+                models.UniqueConstraint(fields=['action', 'token'], condition=Q(token__isnull=False),
+                                        name='%(app_label)s_%(class)s_token_uniq'),
+            ]
+        else:
+            unique_together = (('action', 'token'), ('action', 'token_digest'))
+        index_together = [('action', 'user')]
         verbose_name = _('private url')
         verbose_name_plural = _('private urls')
 
+    @classmethod
+    def get_shard(cls, action):
+        """
+        Return model that stores urls of action. PrivateUrl routes actions by settings.PRIVATEURL_SHARDS,
+        other models store all actions they are used with.
+        """
+        if not purl_settings.PRIVATEURL_SHARDS or cls is not PrivateUrl:
+            return cls
+        return sharding.get_model(action)
+
+    def save(self, *args, **kwargs):
+        """
+        Save object, only digest of token is stored if settings.PRIVATEURL_TOKEN_DIGEST is set.
+        Token is kept in memory, so get_absolute_url of saved object works.
+        """
+        if not purl_settings.PRIVATEURL_TOKEN_DIGEST or self.token is None:
+            return super(AbstractPrivateUrl, self).save(*args, **kwargs)
+        token = self.token
+        self.token_digest, self.token = make_digest(token), None
+        try:
+            return super(AbstractPrivateUrl, self).save(*args, **kwargs)
+        finally:
+            self.token = token
+
     def get_data(self):
-        if self.data != '':
-            return json.loads(self.data)
+        """
+        Return decoded data. Decoded value is memoized until data is changed.
+        """
+        deferred = [f for f in ('data', 'data_compressed') if f in self.get_deferred_fields()]
+        if deferred:
+            self.refresh_from_db(fields=deferred)
+        raw = self.data if self.data_compressed is None else self.data_compressed
+        memo = self.__dict__.get('_data_memo')
+        if memo is not None and memo[0] is raw:
+            return memo[1]
+        if self.data_compressed is not None:
+            value = json.loads(compression.decompress(raw))
+        elif raw != '':
+            value = json.loads(raw)
+        else:
+            value = None
+        self._data_memo = (raw, value)
+        return value
 
     def set_data(self, data):
-        if data is None:
-            self.data = ''
-        else:
-            self.data = json.dumps(data, sort_keys=True)
+        """
+        Set data as json text or compressed json if settings.PRIVATEURL_DATA_CODEC is set.
+        """
+        self.data, self.data_compressed = '', None
+        if data is not None:
+            text = json.dumps(data, sort_keys=True)
+            codec = purl_settings.PRIVATEURL_DATA_CODEC
+            if codec and len(text) >= purl_settings.PRIVATEURL_DATA_COMPRESS_MIN_SIZE:
+                self.data_compressed = compression.compress(text, codec)
+            else:
+                self.data = text
 
     @classmethod
-    def create(cls, action, user=None, expire=None, data=None, hits_limit=1, auto_delete=False,
+    def create(cls, action, user=None, expire=None, data=None, hits_limit=None, auto_delete=None,
                token_size=None, replace=False, dashed_piece_size=None):
         """
         Create new object PrivateUrl.
@@ -74,14 +402,28 @@ class PrivateUrl(models.Model):
         user - user object or None
         expire - expire time, datetime, timedelta or None for disable time limit
         data - additional data that, any object that cant dumps as standard json
-        hits_limit - limit of request hits, int (0 - ulimited)
-        auto_delete - auto remove when url will be not available, bool
+        hits_limit - limit of request hits, int (0 - ulimited), None set default value of action or 1
+        auto_delete - auto remove when url will be not available, bool, None set default value of action or False
         token_size - length of token, tuple (min, max) or static int,
-            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
+            None set default value of action or from settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
         replace - remove exist object for user and action before creating, bool
         dashed_piece_size - split token with dash every N symbols, int,
             None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE
+        Arguments expire, hits_limit, auto_delete and token_size that are None get defaults of action
+        registered by privateurl.register_action.
+        Object is created in shard of action (see settings.PRIVATEURL_SHARDS).
         """
+        model = cls.get_shard(action)
+        if model is not cls:
+            return model.create(action, user=user, expire=expire, data=data, hits_limit=hits_limit,
+                                auto_delete=auto_delete, token_size=token_size, replace=replace,
+                                dashed_piece_size=dashed_piece_size)
+        defaults = registry.get_defaults(action, expire=expire, hits_limit=hits_limit, auto_delete=auto_delete,
+                                         token_size=token_size, dashed_piece_size=dashed_piece_size)
+        expire, token_size = defaults['expire'], defaults['token_size']
+        dashed_piece_size = defaults['dashed_piece_size']
+        hits_limit = 1 if defaults['hits_limit'] is None else defaults['hits_limit']
+        auto_delete = bool(defaults['auto_delete'])
         if replace and user:
             cls.objects.filter(action=action, user=user).delete()
         if isinstance(expire, datetime.timedelta):
@@ -90,11 +432,12 @@ class PrivateUrl(models.Model):
         while True:
             try:
                 token = cls.generate_token(size=token_size, dashed_piece_size=dashed_piece_size)
-                obj = PrivateUrl(user=user, action=action, token=token, expire=expire,
-                                 hits_limit=hits_limit, auto_delete=auto_delete)
+                obj = cls(user=user, action=action, token=token, expire=expire,
+                          hits_limit=hits_limit, auto_delete=auto_delete)
                 obj.set_data(data)
-                with transaction.atomic():
+                with transaction.atomic(using=router.db_for_write(cls)):
                     obj.save()
+                purl_stats.record(action, 'created')
                 return obj
             except IntegrityError:
                 n += 1
@@ -103,17 +446,206 @@ class PrivateUrl(models.Model):
                         action, token_size
                     ))
 
-    def is_available(self, dt=None):
+    @classmethod
+    def create_signed(cls, action, user=None, expire=None, data=None, single_use=False):
         """
-        Return True if object can be used.
+        Create signed private url that isn't stored in database (see privateurl.signing.SignedPrivateUrl).
+        action - name of action (slug)
+        user - user object or None, user must have integer primary key
+        expire - expire time, datetime, timedelta or None for disable time limit
+        data - small additional data that can be dumped as standard json
+        single_use - allow only one hit, expire is required for it, bool
+        """
+        from .signing import SignedPrivateUrl
+        expire = registry.get_defaults(action, expire=expire)['expire']
+        return SignedPrivateUrl.create(action, user=user, expire=expire, data=data, single_use=single_use)
+
+    @classmethod
+    def bulk_create_urls(cls, action, specs, batch_size=500, token_size=None, dashed_piece_size=None):
+        """
+        Create many PrivateUrl objects using batched inserts.
+        action - name of action (slug)
+        specs - iterable of dicts, each one can contain keys user, expire, data, hits_limit, auto_delete
+            and replace with the same meaning as arguments of create method (including defaults of action)
+        batch_size - number of objects that will be inserted per one query, int
+        token_size - length of token, tuple (min, max) or static int,
+            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
+        dashed_piece_size - split token with dash every N symbols, int,
+            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE
+        Return list of created objects in order of specs (objects removed by later specs with replace are skipped).
+        Objects have primary keys, they are selected by tokens if database doesn't return them from inserts.
+        """
+        model = cls.get_shard(action)
+        if model is not cls:
+            return model.bulk_create_urls(action, specs, batch_size=batch_size, token_size=token_size,
+                                          dashed_piece_size=dashed_piece_size)
+        if batch_size < 1:
+            raise AttributeError('Attr batch_size must be greater than 0.')
+        now = timezone.now()
+        defaults = registry.get_defaults(action, token_size=token_size, dashed_piece_size=dashed_piece_size)
+        token_size, dashed_piece_size = defaults['token_size'], defaults['dashed_piece_size']
+        result, batch = [], []
+        for spec in specs:
+            defaults = registry.get_defaults(action, expire=spec.get('expire'), hits_limit=spec.get('hits_limit'),
+                                             auto_delete=spec.get('auto_delete'))
+            expire = defaults['expire']
+            if isinstance(expire, datetime.timedelta):
+                expire = now + expire
+            obj = cls(user=spec.get('user'), action=action, expire=expire,
+                      hits_limit=1 if defaults['hits_limit'] is None else defaults['hits_limit'],
+                      auto_delete=bool(defaults['auto_delete']))
+            obj.set_data(spec.get('data'))
+            batch.append((obj, bool(spec.get('replace'))))
+            if len(batch) >= batch_size:
+                result = cls._bulk_insert_batch(action, batch, token_size, dashed_piece_size, result)
+                batch = []
+        if batch:
+            result = cls._bulk_insert_batch(action, batch, token_size, dashed_piece_size, result)
+        if result:
+            purl_stats.record(action, 'created', n=len(result))
+        return result
+
+    @classmethod
+    def _bulk_insert_batch(cls, action, batch, token_size, dashed_piece_size, result):
+        """
+        Insert batch and return result with its objects. Objects of previous batches that are removed
+        by specs of batch with replace are dropped from result.
+        """
+        replace_users = set(obj.user_id for obj, replace in batch if replace and obj.user_id)
+        if replace_users:
+            result = [obj for obj in result if obj.user_id not in replace_users]
+        result.extend(cls._bulk_insert(action, batch, token_size, dashed_piece_size))
+        return result
+
+    @classmethod
+    def _bulk_insert(cls, action, batch, token_size, dashed_piece_size):
+        replace_users = {obj.user_id: i for i, (obj, replace) in enumerate(batch) if replace and obj.user_id}
+        if replace_users:
+            cls.objects.filter(action=action, user__in=list(replace_users)).delete()
+        # later spec with replace=True removes objects of the same user created by previous specs
+        objs = [obj for i, (obj, replace) in enumerate(batch) if replace_users.get(obj.user_id, i) <= i]
+        max_tries, n = 20, 0
+        pending = objs
+        while True:
+            pending_ids = set(id(obj) for obj in pending)
+            seen = set(obj.token for obj in objs if id(obj) not in pending_ids)
+            collisions, checked = [], []
+            tokens = cls.generate_tokens(len(pending), size=token_size, dashed_piece_size=dashed_piece_size)
+            for obj, token in zip(pending, tokens):
+                obj.token = token
+                if obj.token in seen:
+                    collisions.append(obj)
+                else:
+                    seen.add(obj.token)
+                    checked.append(obj)
+            if checked:
+                exist = cls._existing_tokens(action, [obj.token for obj in checked])
+                collisions.extend(obj for obj in checked if obj.token in exist)
+            if not collisions:
+                try:
+                    with transaction.atomic(using=router.db_for_write(cls)):
+                        cls._bulk_save(objs)
+                    purl_cache.invalidate_many(objs)
+                    return objs
+                except IntegrityError:
+                    # objects with the same tokens were inserted concurrently
+                    exist = cls._existing_tokens(action, [obj.token for obj in objs])
+                    collisions = [obj for obj in objs if obj.token in exist]
+                    if not collisions:
+                        raise
+            pending = collisions
+            n += 1
+            if n > max_tries:
+                raise RuntimeError("Failed to create PrivateUrl objects (action={}, token_size={})".format(
+                    action, token_size
+                ))
+
+    @classmethod
+    def _existing_tokens(cls, action, tokens):
+        """
+        Return set of tokens of action that are stored (as tokens or digests).
+        """
+        if not purl_settings.PRIVATEURL_TOKEN_DIGEST:
+            return set(cls.objects.filter(action=action, token__in=tokens).values_list('token', flat=True))
+        digests = dict((make_digest(token), token) for token in tokens)
+        return set(digests[digest] for digest in cls.objects.filter(
+            action=action, token_digest__in=list(digests)).values_list('token_digest', flat=True))
+
+    @classmethod
+    def _bulk_save(cls, objs):
+        """
+        Insert objects by bulk_create, only digests of tokens are stored if settings.PRIVATEURL_TOKEN_DIGEST is set.
+        """
+        if not purl_settings.PRIVATEURL_TOKEN_DIGEST:
+            cls.objects.bulk_create(objs)
+            cls._fetch_pks(objs, 'token')
+            return
+        tokens = [obj.token for obj in objs]
+        for obj in objs:
+            obj.token_digest, obj.token = make_digest(obj.token), None
+        try:
+            cls.objects.bulk_create(objs)
+            cls._fetch_pks(objs, 'token_digest')
+        finally:
+            for obj, token in zip(objs, tokens):
+                obj.token = token
+
+    @classmethod
+    def _fetch_pks(cls, objs, field, chunk_size=500):
+        """
+        Set primary keys of inserted objects by their unique field if database doesn't return them
+        from bulk insert (e.g. SQLite).
+        """
+        if not objs or objs[0].pk is not None:
+            return
+        action = objs[0].action
+        for i in range(0, len(objs), chunk_size):
+            chunk = dict((getattr(obj, field), obj) for obj in objs[i:i + chunk_size])
+            qs = cls.objects.filter(action=action, **{field + '__in': list(chunk)}).order_by()
+            for value, pk in qs.values_list(field, 'pk'):
+                chunk[value].pk = pk
+
+    @classmethod
+    def available_q(cls, dt=None):
+        """
+        Return Q object that matches objects which can be used (SQL version of is_available).
+        """
+        return ((Q(expire__isnull=True) | Q(expire__gt=dt or timezone.now()))
+                & (Q(hits_limit=0) | Q(hit_counter__lt=F('hits_limit'))))
+
+    def unavailable_reason(self, dt=None):
+        """
+        Return reason why object can't be used: 'expired', 'limit_reached' or None if object can be used.
         """
         if self.expire and self.expire <= (dt or timezone.now()):
-            return False
+            return 'expired'
         if self.hits_limit and self.hits_limit <= self.hit_counter:
-            return False
-        return True
+            return 'limit_reached'
+
+    def is_available(self, dt=None):
+        """
+        Return True if object can be used.
+        """
+        return self.unavailable_reason(dt=dt) is None
+
+    def _hit_update_kwargs(self, now):
+        return {
+            'hit_counter': F('hit_counter') + 1,
+            'last_hit': now,
+            'first_hit': Coalesce(F('first_hit'), Value(now, output_field=models.DateTimeField())),
+        }
+
+    def _set_hit(self, now, hit_counter=None):
+        self.hit_counter = self.hit_counter + 1 if hit_counter is None else hit_counter
+        if not self.first_hit:
+            self.first_hit = now
+        self.last_hit = now
 
     def hit_counter_inc(self):
+        """
+        Count hit without checking availability. Only counter fields are written by one UPDATE,
+        so fields that weren't loaded by projection of lookup aren't fetched or saved.
+        """
         obj_is_exists = self.pk is not None
         now = timezone.now()
         self.hit_counter += 1
@@ -121,22 +653,134 @@ class PrivateUrl(models.Model):
             if obj_is_exists:
                 self.delete()
             return
-        uf = {'hit_counter', 'last_hit'}
+        if obj_is_exists:
+            type(self).objects.filter(pk=self.pk).update(**self._hit_update_kwargs(now))
         if not self.first_hit:
             self.first_hit = now
-            uf.add('first_hit')
         self.last_hit = now
-        if obj_is_exists:
-            self.save(update_fields=uf)
+
+    def consume(self, dt=None):
+        """
+        Count hit if object is available. Checking and updating is done by one conditional query,
+        so concurrent requests can't use object more times than hits_limit allows.
+        Hits of unlimited objects are written by hit buffer if settings.PRIVATEURL_HIT_BUFFER is set.
+        Return True if hit was counted, otherwise False.
+        """
+        now = dt or timezone.now()
+        hit_buffer = purl_hits.get_hit_buffer() if self.pk is not None and not self.hits_limit else None
+        if self.pk is None or hit_buffer is not None:
+            if not self.is_available(dt=now):
+                return False
+            if hit_buffer is not None:
+                hit_buffer.add(self.pk, now, model=type(self))
+            self._set_hit(now)
+            return True
+        db = self._state.db or router.db_for_write(type(self), instance=self)
+        connection = connections[db]
+        if can_update_returning(connection):
+            value = connection.ops.adapt_datetimefield_value(now)
+            with connection.cursor() as cursor:
+                cursor.execute(self._consume_sql(connection, 1), [value, value, self.pk, value])
+                row = cursor.fetchone()
+            if row is None:
+                purl_cache.invalidate(self.action, self.token, self.token_digest)
+                return False
+            self._set_hit(now, hit_counter=row[1])
+            return True
+        qs = type(self).objects.using(db).filter(pk=self.pk).available(now)
+        if not qs.update(**self._hit_update_kwargs(now)):
+            purl_cache.invalidate(self.action, self.token, self.token_digest)
+            return False
+        if self.auto_delete and self.hits_limit:
+            # re-read counter for knowing if object has been exhausted by concurrent requests
+            self._set_hit(now, hit_counter=type(self).objects.using(db).filter(pk=self.pk).values_list(
+                'hit_counter', flat=True).first())
+        else:
+            self._set_hit(now)
+        return True
 
     @classmethod
-    def generate_token(cls, size=None, dashed_piece_size=None):
+    def _consume_sql(cls, connection, n):
         """
-        Generate new unique token.
-        size - length of token, tuple (min, max) or static int,
-            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
-        dashed_piece_size - split token with dash every N symbols, int,
-            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE
+        Return SQL of conditional UPDATE ... RETURNING pk, hit_counter that counts hits of n available objects.
+        Parameters are now, now, n primary keys, now.
+        """
+        opts = cls._meta
+        qn = connection.ops.quote_name
+        columns = {f: qn(opts.get_field(f).column) for f in ('hit_counter', 'hits_limit', 'first_hit',
+                                                             'last_hit', 'expire')}
+        return ('UPDATE {table} SET {hit_counter} = {hit_counter} + 1, {last_hit} = %s, '
+                '{first_hit} = COALESCE({first_hit}, %s) '
+                'WHERE {pk} IN ({pks}) AND ({expire} IS NULL OR {expire} > %s) '
+                'AND ({hits_limit} = 0 OR {hit_counter} < {hits_limit}) '
+                'RETURNING {pk}, {hit_counter}').format(table=qn(opts.db_table), pk=qn(opts.pk.column),
+                                                        pks=', '.join(['%s'] * n), **columns)
+
+    @classmethod
+    def consume_many(cls, objs, dt=None, batch_size=500):
+        """
+        Count hits of available objects of this model by one conditional UPDATE per batch_size objects
+        (the same rules as consume).
+        Hits of unlimited objects are written by hit buffer if settings.PRIVATEURL_HIT_BUFFER is set.
+        Return list of objects whose hits were counted.
+        """
+        now = dt or timezone.now()
+        hit_buffer = purl_hits.get_hit_buffer()
+        counted, pending = set(), {}
+        for obj in objs:
+            if not obj.is_available(dt=now):
+                continue
+            if obj.pk is not None and (hit_buffer is None or obj.hits_limit):
+                pending[obj.pk] = obj
+                continue
+            if obj.pk is not None:
+                hit_buffer.add(obj.pk, now, model=cls)
+            obj._set_hit(now)
+            counted.add(id(obj))
+        if pending:
+            db = router.db_for_write(cls)
+            connection = connections[db]
+            pks, counters = list(pending), {}
+            with transaction.atomic(using=db):
+                for i in range(0, len(pks), batch_size):
+                    chunk = pks[i:i + batch_size]
+                    if can_update_returning(connection):
+                        value = connection.ops.adapt_datetimefield_value(now)
+                        with connection.cursor() as cursor:
+                            cursor.execute(cls._consume_sql(connection, len(chunk)), [value, value] + chunk + [value])
+                            counters.update(cursor.fetchall())
+                    else:
+                        qs = cls.objects.using(db).filter(pk__in=chunk)
+                        qs.available(now).update(**pending[chunk[0]]._hit_update_kwargs(now))
+                        # updated rows are locked until commit, so last hit of them is this one
+                        counters.update(qs.filter(last_hit=now).values_list('pk', 'hit_counter'))
+            for pk, obj in pending.items():
+                if pk in counters:
+                    obj._set_hit(now, hit_counter=counters[pk])
+                    counted.add(id(obj))
+                else:
+                    purl_cache.invalidate(obj.action, obj.token, obj.token_digest)
+        return [obj for obj in objs if id(obj) in counted]
+
+    def delete_if_unavailable(self, dt=None):
+        """
+        Delete object if it can no longer be used. Deleting is conditional, so object used
+        by other requests in the meantime is checked by database state.
+        Return True if object was deleted.
+        """
+        now = dt or timezone.now()
+        if self.pk is None or self.is_available(dt=now):
+            return False
+        deleted, _ = type(self).objects.filter(pk=self.pk).unavailable(now).delete()
+        if deleted:
+            self.pk = None
+        return bool(deleted)
+
+    @classmethod
+    def _token_config(cls, size, dashed_piece_size):
+        """
+        Return validated tuple ((min size, max size), dashed_piece_size).
+        Configurations of valid arguments are cached, so they are validated only once.
         """
         if size is None:
             size = purl_settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
@@ -144,6 +788,15 @@ class PrivateUrl(models.Model):
         if dashed_piece_size is None:
             dashed_piece_size = purl_settings.PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE
 
+        key = None
+        if type(dashed_piece_size) is int:
+            if type(size) is int:
+                key = (size, dashed_piece_size, cls.TOKEN_MIN_SIZE, cls.TOKEN_MAX_SIZE)
+            elif isinstance(size, (list, tuple)) and all(type(v) is int for v in size):
+                key = (tuple(size), dashed_piece_size, cls.TOKEN_MIN_SIZE, cls.TOKEN_MAX_SIZE)
+        if key in _token_configs:
+            return _token_configs[key]
+
         if not isinstance(size, (int, list, tuple)):
             raise AttributeError('Attr size must be int, list or tuple.')
 
@@ -166,22 +819,179 @@ class PrivateUrl(models.Model):
         elif dashed_piece_size < 0:
             raise AttributeError('Attr dash_split_each must be greater or equal 0.')
 
-        if size[0] != size[1]:
-            random.seed(get_random_string(length=100))
-            _size = random.randint(*size)
-        else:
-            _size = size[0]
+        config = (size, dashed_piece_size)
+        if key is not None:
+            _token_configs[key] = config
+        return config
 
-        token = get_random_string(length=_size)
+    @staticmethod
+    def _make_token(size, dashed_piece_size):
+        _size = size[0] if size[0] == size[1] else _sysrandom.randint(*size)
+        token = random_chars(_size)
         if dashed_piece_size:
             n = dashed_piece_size
-            while n < len(token):
-                token = token[:n] + '-' + token[n:]
-                n += dashed_piece_size + 1
-            token = token[:_size].rstrip('-')
-
+            token = '-'.join(token[i:i + n] for i in range(0, _size, n))[:_size].rstrip('-')
         return token
 
+    @classmethod
+    def _token_re(cls, size=None, dashed_piece_size=None):
+        size, dashed_piece_size = cls._token_config(size, dashed_piece_size)
+        key = (size, dashed_piece_size)
+        if key not in _token_res:
+            if dashed_piece_size:
+                pattern = r'^(?:[a-zA-Z0-9]{{{n}}}-)*[a-zA-Z0-9]{{1,{n}}}$'.format(n=dashed_piece_size)
+            else:
+                pattern = r'^[a-zA-Z0-9]+$'
+            # token is cut to its size after inserting dashes, so it is shorter by one if it ended with dash
+            _token_res[key] = (re.compile(pattern), size[0] - (1 if dashed_piece_size else 0), size[1])
+        return _token_res[key]
+
+    @classmethod
+    def is_valid_token(cls, token, size=None, dashed_piece_size=None):
+        """
+        Return True if token could be generated by generate_token with the same arguments.
+        """
+        regex, min_size, max_size = cls._token_re(size, dashed_piece_size)
+        return min_size <= len(token) <= max_size and regex.match(token) is not None
+
+    @classmethod
+    def precheck(cls, action, token):
+        """
+        Check action and token without database query. Action is checked if settings.PRIVATEURL_ACTIONS is set
+        (registered actions are known too), token format is checked if settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT
+        is True. Size and dashes of token are checked if token_size is in defaults of registered action,
+        otherwise urls could be created with any size, so only characters and limits of size are checked.
+        Return reason of fail ('unknown_action' or 'invalid_token') or None.
+        """
+        actions = purl_settings.PRIVATEURL_ACTIONS
+        if actions is not None and action not in actions and registry.get_action(action) is None:
+            return 'unknown_action'
+        if purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT:
+            defaults = registry.get_defaults(action, token_size=None, dashed_piece_size=None)
+            if defaults['token_size'] is not None:
+                valid = cls.is_valid_token(token, size=defaults['token_size'],
+                                           dashed_piece_size=defaults['dashed_piece_size'])
+            else:
+                # token is shorter than TOKEN_MIN_SIZE by one if it ended with dash
+                valid = (cls.TOKEN_MIN_SIZE - 1 <= len(token) <= cls.TOKEN_MAX_SIZE
+                         and _token_chars_re.match(token) is not None)
+            if not valid:
+                return 'invalid_token'
+
+    @classmethod
+    def generate_token(cls, size=None, dashed_piece_size=None):
+        """
+        Generate new unique token.
+        size - length of token, tuple (min, max) or static int,
+            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_SIZE
+        dashed_piece_size - split token with dash every N symbols, int,
+            None set default value from settings.PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE
+        """
+        return cls._make_token(*cls._token_config(size, dashed_piece_size))
+
+    @classmethod
+    def generate_tokens(cls, n, size=None, dashed_piece_size=None):
+        """
+        Generate list of n different tokens.
+        size, dashed_piece_size - the same as in generate_token method
+        """
+        size, dashed_piece_size = cls._token_config(size, dashed_piece_size)
+        tokens, tries = set(), 0
+        while len(tokens) < n:
+            tries += 1
+            if tries > n * 20 + 20:
+                raise RuntimeError('Failed to generate {} different tokens (token_size={})'.format(n, size))
+            tokens.add(cls._make_token(size, dashed_piece_size))
+        return list(tokens)
+
     def get_absolute_url(self):
-        return reverse('{}:privateurl'.format(purl_settings.PRIVATEURL_URL_NAMESPACE),
-                       kwargs={'action': self.action, 'token': self.token})
+        if self.token is None:
+            raise ValueError('Url of private url whose token is stored as digest only can\'t be built.')
+        return urlbuilder.build_url(self.action, self.token)
+
+
+class PrivateUrl(AbstractPrivateUrl):
+    if PARTIAL_INDEXES:
+        # index of all rows is replaced by partial one below, shard models keep it
+        expire = models.DateTimeField(verbose_name=_('expire'), null=True, blank=True)
+
+    class Meta(AbstractPrivateUrl.Meta):
+        db_table = 'privateurl_privateurl'
+        if PARTIAL_INDEXES:
+            indexes = [
+                models.Index(fields=['expire'], name='privateurl_expire_notnull',
+                             condition=Q(expire__isnull=False)),
+            ]
+
+
+class PrivateUrlStatsQuerySet(models.QuerySet):
+    def period(self, date_from=None, date_to=None):
+        """
+        Filter rollups of days from date_from to date_to inclusive, None means unbounded.
+        """
+        qs = self
+        if date_from is not None:
+            qs = qs.filter(date__gte=date_from)
+        if date_to is not None:
+            qs = qs.filter(date__lte=date_to)
+        return qs
+
+    def totals(self):
+        """
+        Return dict with sums of counters of rollups, one aggregate query.
+        """
+        result = self.order_by().aggregate(*[models.Sum(f) for f in purl_stats.FIELDS])
+        return dict((f, result['{}__sum'.format(f)] or 0) for f in purl_stats.FIELDS)
+
+    def by_action(self):
+        """
+        Return dict {action: dict with sums of counters}.
+        """
+        rows = self.order_by().values('action').annotate(*[models.Sum(f) for f in purl_stats.FIELDS])
+        return dict((row['action'], dict((f, row['{}__sum'.format(f)] or 0) for f in purl_stats.FIELDS))
+                    for row in rows)
+
+
+class PrivateUrlStats(models.Model):
+    """
+    Usage of action per day, it is maintained by privateurl.stats if settings.PRIVATEURL_STATS is enabled.
+    """
+    action = models.SlugField(verbose_name=_('action'), max_length=40, db_index=False)
+    date = models.DateField(verbose_name=_('date'))
+    created = models.PositiveIntegerField(verbose_name=_('created'), default=0)
+    redeemed = models.PositiveIntegerField(verbose_name=_('redeemed'), default=0)
+    failed = models.PositiveIntegerField(verbose_name=_('failed'), default=0,
+                                         help_text=_('Failed hits except hits of expired urls.'))
+    expired = models.PositiveIntegerField(verbose_name=_('expired'), default=0, help_text=_('Hits of expired urls.'))
+
+    objects = PrivateUrlStatsQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-date', 'action')
+        unique_together = ('action', 'date')
+        index_together = [('date', 'action')]
+        verbose_name = _('private url stats')
+        verbose_name_plural = _('private url stats')
+
+    def __str__(self):
+        return '{} {}'.format(self.action, self.date)
+
+
+class PrivateUrlHit(models.Model):
+    """
+    Hit of private url, it is written by privateurl.hitlog if settings.PRIVATEURL_HIT_LOG is set.
+    Rows are only appended, url_id isn't foreign key because urls are deleted by raw queries and stored in shards.
+    """
+    created = models.DateTimeField(verbose_name=_('created'))
+    action = models.SlugField(verbose_name=_('action'), max_length=40, db_index=False)
+    url_id = models.BigIntegerField(verbose_name=_('private url id'), null=True, blank=True)
+    outcome = models.CharField(verbose_name=_('outcome'), max_length=20,
+                               help_text=_('"ok" or reason of fail.'))
+    ip = models.GenericIPAddressField(verbose_name=_('IP address'), null=True, blank=True)
+    user_agent = models.CharField(verbose_name=_('user agent'), max_length=255, blank=True)
+
+    class Meta:
+        ordering = ('-pk',)
+        index_together = [('action', 'created')]
+        verbose_name = _('private url hit')
+        verbose_name_plural = _('private url hits')
@@ -0,0 +1,66 @@
+DEFAULT_KEYS = ('hits_limit', 'expire', 'token_size', 'dashed_piece_size', 'auto_delete')
+
+_actions = {}
+
+
+class Action(object):
+    """
+    Registered action: handlers of succeeded and failed hits and default arguments of PrivateUrl.create.
+    """
+    def __init__(self, name, on_ok=None, on_fail=None, defaults=None, send_signals=True):
+        defaults = dict(defaults or {})
+        unknown = set(defaults) - set(DEFAULT_KEYS)
+        if unknown:
+            raise ValueError('Unknown defaults of action {}: {}'.format(name, ', '.join(sorted(unknown))))
+        self.name = name
+        self.on_ok = on_ok
+        self.on_fail = on_fail
+        self.defaults = defaults
+        self.send_signals = send_signals
+
+    def __repr__(self):
+        return '<Action {}>'.format(self.name)
+
+
+def register_action(name, on_ok=None, on_fail=None, defaults=None, send_signals=True):
+    """
+    Register action and return it, previous registration of the same name is replaced.
+    name - name of action (slug)
+    on_ok - handler of succeeded hit, it is called with the same keyword arguments as receivers
+        of privateurl_ok signal (request, obj, action) and can return dict with response
+    on_fail - handler of failed hit, it is called with the same keyword arguments as receivers
+        of privateurl_fail signal (request, obj, action, reason) and can return dict with response
+    defaults - dict of default values of hits_limit, expire, token_size, dashed_piece_size and auto_delete
+        for PrivateUrl.create, token_size and dashed_piece_size are used by PrivateUrl.precheck too
+    send_signals - send privateurl_ok and privateurl_fail signals for this action too, bool
+    """
+    action = Action(name, on_ok=on_ok, on_fail=on_fail, defaults=defaults, send_signals=send_signals)
+    _actions[name] = action
+    return action
+
+
+def unregister_action(name):
+    _actions.pop(name, None)
+
+
+def get_action(name):
+    """
+    Return registered action or None.
+    """
+    return _actions.get(name)
+
+
+def get_names():
+    return list(_actions)
+
+
+def get_defaults(name, **values):
+    """
+    Return values where None ones are replaced with defaults of registered action.
+    """
+    action = _actions.get(name)
+    if action is not None:
+        for key, value in values.items():
+            if value is None and key in action.defaults:
+                values[key] = action.defaults[key]
+    return values
@@ -0,0 +1,244 @@
+import csv
+import json
+from collections import Counter
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import models, router, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils.dateparse import parse_datetime
+
+from . import compression, cache as purl_cache, settings as purl_settings
+from .digest import make_digest
+
+FIELDS = ('action', 'token', 'token_digest', 'user', 'expire', 'data', 'created', 'hits_limit', 'hit_counter',
+          'first_hit', 'last_hit', 'auto_delete')
+DATETIME_FIELDS = ('expire', 'created', 'first_hit', 'last_hit')
+CONFLICTS = ('skip', 'update', 'error')
+
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_rows(qs, chunk_size=2000):
+    """
+    Yield dicts with FIELDS of objects of queryset. Rows are fetched by chunks, so memory use doesn't depend
+    on number of rows. User is exported as username, data as decoded value.
+    """
+    user_model = get_user_model()
+    qs = qs.order_by('pk').values_list('action', 'token', 'token_digest', 'user_id', 'expire', 'data',
+                                       'data_compressed', 'created', 'hits_limit', 'hit_counter', 'first_hit',
+                                       'last_hit', 'auto_delete')
+    rows = qs.iterator(chunk_size=chunk_size) if django.VERSION >= (2, 0) else qs.iterator()
+    for chunk in iter_chunks(rows, chunk_size):
+        user_ids = set(row[3] for row in chunk if row[3] is not None)
+        usernames = dict(user_model._default_manager.filter(pk__in=user_ids).values_list(
+            'pk', user_model.USERNAME_FIELD)) if user_ids else {}
+        for (action, token, token_digest, user_id, expire, data, data_compressed, created, hits_limit, hit_counter,
+             first_hit, last_hit, auto_delete) in chunk:
+            text = data if data_compressed is None else compression.decompress(data_compressed)
+            yield {
+                'action': action,
+                'token': token,
+                'token_digest': token_digest,
+                'user': usernames.get(user_id),
+                'expire': expire,
+                'data': json.loads(text) if text else None,
+                'created': created,
+                'hits_limit': hits_limit,
+                'hit_counter': hit_counter,
+                'first_hit': first_hit,
+                'last_hit': last_hit,
+                'auto_delete': auto_delete,
+            }
+
+
+def format_datetimes(row):
+    # isoformat keeps microseconds which DjangoJSONEncoder drops
+    row = dict(row)
+    for f in DATETIME_FIELDS:
+        row[f] = row[f].isoformat() if row[f] else None
+    return row
+
+
+def write_jsonl(rows, stream):
+    n = 0
+    for row in rows:
+        stream.write(json.dumps(format_datetimes(row), sort_keys=True) + '\n')
+        n += 1
+    return n
+
+
+def write_csv(rows, stream):
+    writer = csv.DictWriter(stream, FIELDS)
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        row = format_datetimes(row)
+        for f in DATETIME_FIELDS:
+            row[f] = row[f] or ''
+        row['data'] = '' if row['data'] is None else json.dumps(row['data'], sort_keys=True)
+        row['user'] = row['user'] or ''
+        row['token'] = row['token'] or ''
+        row['token_digest'] = row['token_digest'] or ''
+        row['auto_delete'] = int(row['auto_delete'])
+        writer.writerow(row)
+        n += 1
+    return n
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        row['data'] = json.loads(row['data']) if row.get('data') else None
+        yield row
+
+
+def parse_row(row):
+    """
+    Return row with values of FIELDS converted from text or JSON types.
+    """
+    result = {
+        'action': row['action'],
+        'token': row.get('token') or None,
+        'token_digest': row.get('token_digest') or None,
+        'user': row.get('user') or None,
+        'data': row.get('data'),
+        'hits_limit': 1 if row.get('hits_limit') in (None, '') else int(row['hits_limit']),
+        'hit_counter': int(row.get('hit_counter') or 0),
+        'auto_delete': row.get('auto_delete') in (True, 1, '1', 'true', 'True'),
+    }
+    for f in DATETIME_FIELDS:
+        value = row.get(f) or None
+        result[f] = parse_datetime(value) if isinstance(value, str) else value
+    return result
+
+
+def import_rows(rows, batch_size=500, conflict='skip'):
+    """
+    Create objects from rows (dicts with FIELDS) using batched inserts.
+    Objects are stored in shards of their actions (see settings.PRIVATEURL_SHARDS).
+    conflict - what to do with rows whose (action, token) exists: 'skip', 'update' or 'error' (ValueError
+        is raised, batches imported before stay in database)
+    Rows of unknown users are skipped. Tokens are replaced with digests if settings.PRIVATEURL_TOKEN_DIGEST is set.
+    Return Counter with keys created, updated, skipped, unknown_user.
+    """
+    if conflict not in CONFLICTS:
+        raise ValueError('Unknown conflict handling: {}'.format(conflict))
+    stats = Counter()
+    for chunk in iter_chunks(rows, batch_size):
+        _import_chunk([parse_row(row) for row in chunk], conflict, stats)
+    return stats
+
+
+def _import_chunk(rows, conflict, stats):
+    from .models import PrivateUrl
+    user_model = get_user_model()
+    usernames = set(row['user'] for row in rows if row['user'])
+    users = dict(user_model._default_manager.filter(**{user_model.USERNAME_FIELD + '__in': usernames}).values_list(
+        user_model.USERNAME_FIELD, 'pk')) if usernames else {}
+    by_model, seen = {}, set()
+    for row in rows:
+        if purl_settings.PRIVATEURL_TOKEN_DIGEST and row['token']:
+            row['token'], row['token_digest'] = None, make_digest(row['token'])
+        key = (row['action'], row['token_digest'] or row['token'])
+        if key in seen:
+            stats['skipped'] += 1
+            continue
+        seen.add(key)
+        if row['user'] and row['user'] not in users:
+            stats['unknown_user'] += 1
+            continue
+        model = PrivateUrl.get_shard(row['action'])
+        obj = model(action=row['action'], token=row['token'], user_id=users.get(row['user']), expire=row['expire'],
+                    created=row['created'], hits_limit=row['hits_limit'], hit_counter=row['hit_counter'],
+                    first_hit=row['first_hit'], last_hit=row['last_hit'], auto_delete=row['auto_delete'],
+                    token_digest=row['token_digest'])
+        obj.set_data(row['data'])
+        by_model.setdefault(model, []).append(obj)
+    for model, objs in by_model.items():
+        exist = {}
+        for action, token, digest, pk in model.objects.filter(_lookup_q(objs)).values_list(
+                'action', 'token', 'token_digest', 'pk'):
+            for value in (token, digest):
+                if value:
+                    exist[(action, value)] = pk
+        new = [obj for obj in objs if _ident(obj) not in exist]
+        old = [obj for obj in objs if _ident(obj) in exist]
+        if old and conflict == 'error':
+            raise ValueError('Private urls already exist: {}'.format(
+                ', '.join(sorted('{}/{}'.format(*_ident(obj)) for obj in old))))
+        with transaction.atomic(using=router.db_for_write(model)):
+            if new:
+                created = [obj.created for obj in new]
+                model.objects.bulk_create(new)
+                _restore_created(model, new, created)
+            if old and conflict == 'update':
+                for obj in old:
+                    obj.pk = exist[_ident(obj)]
+                fields = ['user', 'expire', 'data', 'data_compressed', 'created', 'hits_limit', 'hit_counter',
+                          'first_hit', 'last_hit', 'auto_delete', 'token_digest']
+                if hasattr(model.objects, 'bulk_update'):
+                    model.objects.bulk_update(old, fields)
+                else:
+                    for obj in old:
+                        obj.save(update_fields=fields)
+        stats['created'] += len(new)
+        if conflict == 'update':
+            stats['updated'] += len(old)
+            purl_cache.invalidate_many(new + old)
+        else:
+            stats['skipped'] += len(old)
+            purl_cache.invalidate_many(new)
+
+
+def _ident(obj):
+    return obj.action, obj.token_digest or obj.token
+
+
+def _ident_q(obj):
+    if obj.token_digest:
+        return Q(action=obj.action, token_digest=obj.token_digest)
+    return Q(action=obj.action, token=obj.token)
+
+
+def _lookup_q(objs):
+    """
+    Return Q object that matches objects by action and token or digest of token.
+    """
+    values = {}
+    for obj in objs:
+        field = 'token_digest' if obj.token_digest else 'token'
+        values.setdefault((obj.action, field), []).append(getattr(obj, field))
+    q = Q()
+    for (action, field), action_values in values.items():
+        q |= Q(action=action, **{field + '__in': action_values})
+    return q
+
+
+def _restore_created(model, objs, created):
+    """
+    Write imported created values that were replaced with current time by auto_now_add.
+    """
+    pairs = [(obj, value) for obj, value in zip(objs, created) if value]
+    if not pairs:
+        return
+    for obj, value in pairs:
+        obj.created = value
+    whens = [When(_ident_q(obj), then=Value(value)) for obj, value in pairs]
+    model.objects.filter(_lookup_q([obj for obj, value in pairs])).update(
+        created=Case(*whens, output_field=models.DateTimeField()))
@@ -3,3 +3,41 @@ from django.conf import settings
 PRIVATEURL_URL_NAMESPACE = getattr(settings, 'PRIVATEURL_URL_NAMESPACE', 'privateurl')
 PRIVATEURL_DEFAULT_TOKEN_SIZE = getattr(settings, 'PRIVATEURL_DEFAULT_TOKEN_SIZE', (8, 64))
 PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE = getattr(settings, 'PRIVATEURL_DEFAULT_TOKEN_DASHED_PIECE_SIZE', 12)
+PRIVATEURL_CACHE = getattr(settings, 'PRIVATEURL_CACHE', None)
+PRIVATEURL_CACHE_TIMEOUT = getattr(settings, 'PRIVATEURL_CACHE_TIMEOUT', 300)
+PRIVATEURL_CACHE_NOT_FOUND_TIMEOUT = getattr(settings, 'PRIVATEURL_CACHE_NOT_FOUND_TIMEOUT', 30)
+PRIVATEURL_CACHE_KEY_PREFIX = getattr(settings, 'PRIVATEURL_CACHE_KEY_PREFIX', 'privateurl')
+PRIVATEURL_HIT_BUFFER = getattr(settings, 'PRIVATEURL_HIT_BUFFER', None)
+PRIVATEURL_HIT_BUFFER_CACHE = getattr(settings, 'PRIVATEURL_HIT_BUFFER_CACHE', 'default')
+PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL = getattr(settings, 'PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL', 10)
+PRIVATEURL_SIGNED_TOKENS = getattr(settings, 'PRIVATEURL_SIGNED_TOKENS', False)
+PRIVATEURL_SIGNED_SPENT_CACHE = getattr(settings, 'PRIVATEURL_SIGNED_SPENT_CACHE', 'default')
+PRIVATEURL_ASYNC_VIEW = getattr(settings, 'PRIVATEURL_ASYNC_VIEW', False)
+PRIVATEURL_DATA_CODEC = getattr(settings, 'PRIVATEURL_DATA_CODEC', None)
+PRIVATEURL_DATA_COMPRESS_MIN_SIZE = getattr(settings, 'PRIVATEURL_DATA_COMPRESS_MIN_SIZE', 256)
+PRIVATEURL_DEFER_DATA = getattr(settings, 'PRIVATEURL_DEFER_DATA', False)
+PRIVATEURL_PROJECTION = getattr(settings, 'PRIVATEURL_PROJECTION', {})
+PRIVATEURL_ACTION_PROJECTIONS = getattr(settings, 'PRIVATEURL_ACTION_PROJECTIONS', {})
+PRIVATEURL_METRICS_BACKEND = getattr(settings, 'PRIVATEURL_METRICS_BACKEND', None)
+PRIVATEURL_ACTIONS = getattr(settings, 'PRIVATEURL_ACTIONS', None)
+PRIVATEURL_VALIDATE_TOKEN_FORMAT = getattr(settings, 'PRIVATEURL_VALIDATE_TOKEN_FORMAT', False)
+PRIVATEURL_THROTTLE_CACHE = getattr(settings, 'PRIVATEURL_THROTTLE_CACHE', None)
+PRIVATEURL_THROTTLE_RATES = getattr(settings, 'PRIVATEURL_THROTTLE_RATES', {'*': (60, 60)})
+PRIVATEURL_THROTTLE_IP_HEADER = getattr(settings, 'PRIVATEURL_THROTTLE_IP_HEADER', 'REMOTE_ADDR')
+PRIVATEURL_THROTTLE_TRUSTED_PROXIES = getattr(settings, 'PRIVATEURL_THROTTLE_TRUSTED_PROXIES', 1)
+PRIVATEURL_SHARDS = getattr(settings, 'PRIVATEURL_SHARDS', {})
+PRIVATEURL_ADMIN_COUNT_LIMIT = getattr(settings, 'PRIVATEURL_ADMIN_COUNT_LIMIT', 100000)
+PRIVATEURL_ADMIN_ACTIONS_CACHE_TIMEOUT = getattr(settings, 'PRIVATEURL_ADMIN_ACTIONS_CACHE_TIMEOUT', 3600)
+PRIVATEURL_BASE_URL = getattr(settings, 'PRIVATEURL_BASE_URL', None)
+PRIVATEURL_STATS = getattr(settings, 'PRIVATEURL_STATS', False)
+PRIVATEURL_STATS_FLUSH_INTERVAL = getattr(settings, 'PRIVATEURL_STATS_FLUSH_INTERVAL', 10)
+PRIVATEURL_TOKEN_DIGEST = getattr(settings, 'PRIVATEURL_TOKEN_DIGEST', False)
+PRIVATEURL_TOKEN_DIGEST_KEY = getattr(settings, 'PRIVATEURL_TOKEN_DIGEST_KEY', None)
+PRIVATEURL_TOKEN_DIGEST_FALLBACK = getattr(settings, 'PRIVATEURL_TOKEN_DIGEST_FALLBACK', True)
+PRIVATEURL_VERIFY_MAX_TOKENS = getattr(settings, 'PRIVATEURL_VERIFY_MAX_TOKENS', 1000)
+PRIVATEURL_HIT_LOG = getattr(settings, 'PRIVATEURL_HIT_LOG', None)
+PRIVATEURL_HIT_LOG_MAX_SIZE = getattr(settings, 'PRIVATEURL_HIT_LOG_MAX_SIZE', 10000)
+PRIVATEURL_HIT_LOG_BATCH_SIZE = getattr(settings, 'PRIVATEURL_HIT_LOG_BATCH_SIZE', 500)
+PRIVATEURL_HIT_LOG_FLUSH_INTERVAL = getattr(settings, 'PRIVATEURL_HIT_LOG_FLUSH_INTERVAL', 1)
+PRIVATEURL_HIT_LOG_POLICY = getattr(settings, 'PRIVATEURL_HIT_LOG_POLICY', 'drop')
+PRIVATEURL_HIT_LOG_BLOCK_TIMEOUT = getattr(settings, 'PRIVATEURL_HIT_LOG_BLOCK_TIMEOUT', 0.1)
@@ -0,0 +1,210 @@
+import datetime
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError
+from django.db.migrations.operations.base import Operation
+
+from . import settings as purl_settings
+
+DEFAULT_MODEL = 'privateurl.PrivateUrl'
+
+
+def get_model(action):
+    """
+    Return model that stores urls of action (see settings.PRIVATEURL_SHARDS).
+    """
+    return apps.get_model(purl_settings.PRIVATEURL_SHARDS.get(action, DEFAULT_MODEL))
+
+
+def get_models():
+    """
+    Return list of all models that store urls, PrivateUrl goes first.
+    """
+    result = [apps.get_model(DEFAULT_MODEL)]
+    for label in sorted(set(purl_settings.PRIVATEURL_SHARDS.values())):
+        model = apps.get_model(label)
+        if model not in result:
+            result.append(model)
+    return result
+
+
+def is_shard(model):
+    from .models import AbstractPrivateUrl
+    return isinstance(model, type) and issubclass(model, AbstractPrivateUrl)
+
+
+def get_shard_database(model):
+    return model.shard_database if is_shard(model) else None
+
+
+class PrivateUrlRouter(object):
+    """
+    Database router that stores models of private urls in database set by their shard_database attribute.
+    Models with shard_database = None are routed by other routers.
+    Relations of private urls to users stored in other database are allowed, define field user of shard model
+    with db_constraint=False and on_delete=models.DO_NOTHING in this case. Objects related to shards
+    are read from default database, so put this router after routers of your models.
+    """
+
+    def db_for_read(self, model, **hints):
+        database = get_shard_database(model)
+        if database is None and get_shard_database(type(hints.get('instance'))):
+            return DEFAULT_DB_ALIAS
+        return database
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if get_shard_database(type(obj1)) or get_shard_database(type(obj2)):
+            return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        database = get_shard_database(hints.get('model'))
+        if database:
+            return db == database
+
+
+def add_months(d, n):
+    month = d.month - 1 + n
+    return datetime.date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def month_partitions(table, start, months):
+    """
+    Return list of (name, from date, to date) of monthly partitions of table.
+    start - date in the first month
+    months - number of months
+    """
+    start = datetime.date(start.year, start.month, 1)
+    result = []
+    for n in range(months):
+        begin = add_months(start, n)
+        result.append(('{}_{:%Y%m}'.format(table, begin), begin, add_months(begin, 1)))
+    return result
+
+
+def check_partitioned(model, connection):
+    if not model.partition_by_month:
+        raise ValueError('Model {} is not partitioned by month.'.format(model._meta.label))
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError('Partitioning by month requires PostgreSQL 11+.')
+
+
+def get_partitions(model, connection):
+    """
+    Return dict {partition name: first day of month} of existing monthly partitions of model.
+    """
+    check_partitioned(model, connection)
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                       'WHERE i.inhparent = %s::regclass', [table])
+        names = [row[0] for row in cursor.fetchall()]
+    result = {}
+    for name in names:
+        suffix = name[len(table) + 1:]
+        if name.startswith(table + '_') and len(suffix) == 6 and suffix.isdigit():
+            result[name] = datetime.date(int(suffix[:4]), int(suffix[4:]), 1)
+    return result
+
+
+def create_partitions(model, connection, start, months):
+    """
+    Create missing monthly partitions of model starting from month of start. Return names of created partitions.
+    """
+    check_partitioned(model, connection)
+    qn = connection.ops.quote_name
+    exist = get_partitions(model, connection)
+    created = []
+    with connection.cursor() as cursor:
+        for name, begin, end in month_partitions(model._meta.db_table, start, months):
+            if name in exist:
+                continue
+            cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+                qn(name), qn(model._meta.db_table)), [begin.isoformat(), end.isoformat()])
+            created.append(name)
+    return created
+
+
+def drop_partitions(model, connection, before, dry_run=False):
+    """
+    Drop monthly partitions of model which contain only rows created before the month of before.
+    Return names of dropped partitions.
+    """
+    check_partitioned(model, connection)
+    before = datetime.date(before.year, before.month, 1)
+    names = sorted(name for name, begin in get_partitions(model, connection).items() if begin < before)
+    if not dry_run:
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute('DROP TABLE {}'.format(connection.ops.quote_name(name)))
+    return names
+
+
+class PartitionByMonth(Operation):
+    """
+    Migration operation that turns just created empty table of model into table partitioned by month of created
+    (PostgreSQL 11+). Put it after CreateModel and create partitions by privateurl_partitions command.
+    Primary key and unique constraints on (action, token) and (action, token_digest) get column created,
+    so uniqueness of tokens is guaranteed by their randomness only, lookups return the newest object
+    of duplicate token. Rows created out of existing partitions go to default partition.
+    Operation does nothing on other databases.
+    """
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def deconstruct(self):
+        return self.__class__.__name__, [self.model_name], {}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        connection = schema_editor.connection
+        if connection.vendor != 'postgresql' or not self.allow_migrate_model(connection.alias, model):
+            return
+        qn = connection.ops.quote_name
+        opts = model._meta
+        table, template = opts.db_table, opts.db_table + '_template'
+        pk, created = opts.pk.column, opts.get_field('created').column
+        action, token = opts.get_field('action').column, opts.get_field('token').column
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexdef NOT LIKE %s",
+                           [table, 'CREATE UNIQUE %'])
+            index_defs = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                           "WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+            foreign_keys = cursor.fetchall()
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, pk])
+            sequence = cursor.fetchone()[0]
+        sql = [
+            'ALTER TABLE {} RENAME TO {}'.format(qn(table), qn(template)),
+            'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE ({})'.format(
+                qn(table), qn(template), qn(created)),
+            'ALTER TABLE {} ADD PRIMARY KEY ({}, {})'.format(qn(table), qn(pk), qn(created)),
+            'ALTER TABLE {} ADD UNIQUE ({}, {}, {})'.format(qn(table), qn(action), qn(token), qn(created)),
+        ]
+        if any(f.name == 'token_digest' for f in opts.fields):
+            sql.append('ALTER TABLE {} ADD UNIQUE ({}, {}, {})'.format(
+                qn(table), qn(action), qn(opts.get_field('token_digest').column), qn(created)))
+        if sequence:
+            sql.append('ALTER SEQUENCE {} OWNED BY {}.{}'.format(sequence, qn(table), qn(pk)))
+        sql.append('DROP TABLE {}'.format(qn(template)))
+        # indexes and foreign keys of template are dropped with it, so they are created again
+        sql.extend(index_defs)
+        sql.extend('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(qn(table), qn(name), definition)
+                   for name, definition in foreign_keys)
+        sql.append('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(qn(table + '_default'), qn(table)))
+        for statement in sql:
+            schema_editor.execute(statement)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # partitioned table is dropped by reversing CreateModel
+        pass
+
+    def describe(self):
+        return 'Partition table of {} by month of created'.format(self.model_name)
@@ -1,4 +1,4 @@
 from django.dispatch import Signal
 
 privateurl_ok = Signal(providing_args=['request', 'obj', 'action'])
-privateurl_fail = Signal(providing_args=['request', 'obj', 'action'])
+privateurl_fail = Signal(providing_args=['request', 'obj', 'action', 'reason'])
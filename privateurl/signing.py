@@ -0,0 +1,183 @@
+import binascii
+import calendar
+import datetime
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from . import settings as purl_settings, urlbuilder
+
+BASE62_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+SIGNATURE_SIZE = 16
+TOKEN_MAX_SIZE = 64
+TOKEN_RE = re.compile(r'^[0-9A-Za-z]+-[0-9A-Za-z]+-[0-9A-Za-z]+(?:-[0-9A-Za-z]+)?-[0-9A-Za-z]{%d}$' % SIGNATURE_SIZE)
+
+
+def b62_encode(n):
+    if n == 0:
+        return BASE62_ALPHABET[0]
+    s = []
+    while n:
+        n, r = divmod(n, 62)
+        s.append(BASE62_ALPHABET[r])
+    return ''.join(reversed(s))
+
+
+def b62_decode(s):
+    n = 0
+    for c in s:
+        n = n * 62 + BASE62_ALPHABET.index(c)
+    return n
+
+
+def sign(action, payload):
+    # 88 bits of hmac always fit into SIGNATURE_SIZE symbols of base62
+    digest = salted_hmac('privateurl.signing:{}'.format(action), payload).hexdigest()
+    return b62_encode(int(digest[:22], 16)).rjust(SIGNATURE_SIZE, '0')
+
+
+def to_timestamp(dt):
+    """
+    Return unix timestamp of datetime, naive datetime is in current time zone (settings.USE_TZ is False).
+    """
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return calendar.timegm(dt.utctimetuple())
+
+
+def from_timestamp(ts):
+    """
+    Return datetime of unix timestamp comparable with timezone.now(): naive if settings.USE_TZ is False.
+    """
+    dt = datetime.datetime.fromtimestamp(ts, timezone.utc)
+    return dt if settings.USE_TZ else timezone.make_naive(dt)
+
+
+class SignedPrivateUrl(object):
+    """
+    Private url that keeps all its state in signed token, so it isn't stored in database.
+    Single use urls are marked as spent in cache from settings.PRIVATEURL_SIGNED_SPENT_CACHE.
+    """
+    auto_delete = False
+    pk = None
+
+    def __init__(self, action, token, user_id=None, expire=None, hits_limit=0, data=None):
+        self.action = action
+        self.token = token
+        self.user_id = user_id
+        self.expire = expire
+        self.hits_limit = hits_limit
+        self.hit_counter = 0
+        self.first_hit = self.last_hit = None
+        self.data = data
+        self._user = None
+
+    @classmethod
+    def create(cls, action, user=None, expire=None, data=None, single_use=False):
+        """
+        Create signed private url.
+        action - name of action (slug)
+        user - user object or None, user must have integer primary key
+        expire - expire time, datetime, timedelta or None for disable time limit
+        data - small additional data that can be dumped as standard json, None by default
+        single_use - allow only one hit, expire is required for it, bool
+        """
+        if not purl_settings.PRIVATEURL_SIGNED_TOKENS:
+            raise ImproperlyConfigured('Signed private urls are disabled by settings.PRIVATEURL_SIGNED_TOKENS.')
+        if isinstance(expire, datetime.timedelta):
+            expire = timezone.now() + expire
+        if single_use and expire is None:
+            raise AttributeError('Single use signed private url must have expire.')
+        user_id = user.pk if user is not None else None
+        if user_id is not None and not isinstance(user_id, int):
+            raise AttributeError('Signed private url supports only users with integer primary key.')
+        expire_ts = to_timestamp(expire) if expire else 0
+        parts = [b62_encode(user_id + 1 if user_id is not None else 0), b62_encode(expire_ts),
+                 b62_encode(1 if single_use else 0)]
+        if data is not None:
+            raw = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+            parts.append(b62_encode(int(binascii.hexlify(raw), 16)))
+        payload = '-'.join(parts)
+        token = '{}-{}'.format(payload, sign(action, payload))
+        if len(token) > TOKEN_MAX_SIZE:
+            raise AttributeError('Signed token is longer than {} symbols, data is too big.'.format(TOKEN_MAX_SIZE))
+        expire = from_timestamp(expire_ts) if expire_ts else None
+        return cls(action, token, user_id=user_id, expire=expire, hits_limit=1 if single_use else 0, data=data)
+
+    @classmethod
+    def load(cls, action, token):
+        """
+        Return SignedPrivateUrl object if token is correctly signed for action, otherwise None.
+        """
+        if not TOKEN_RE.match(token):
+            return None
+        payload, signature = token.rsplit('-', 1)
+        if not constant_time_compare(signature, sign(action, payload)):
+            return None
+        parts = [b62_decode(p) for p in payload.split('-')]
+        data = None
+        if len(parts) == 4:
+            raw = '{:x}'.format(parts[3])
+            data = json.loads(binascii.unhexlify(raw.zfill(len(raw) + len(raw) % 2)).decode('utf-8'))
+        return cls(action, token, user_id=parts[0] - 1 if parts[0] else None,
+                   expire=from_timestamp(parts[1]) if parts[1] else None,
+                   hits_limit=1 if parts[2] else 0, data=data)
+
+    @property
+    def user(self):
+        if self._user is None and self.user_id is not None:
+            self._user = get_user_model()._default_manager.filter(pk=self.user_id).first()
+        return self._user
+
+    def get_data(self):
+        return self.data
+
+    def unavailable_reason(self, dt=None):
+        """
+        Return reason why object can't be used: 'expired', 'limit_reached' or None if object can be used.
+        """
+        if self.expire and self.expire <= (dt or timezone.now()):
+            return 'expired'
+        if self.hits_limit and (self.hit_counter or self.is_spent()):
+            return 'limit_reached'
+
+    def is_available(self, dt=None):
+        """
+        Return True if object can be used.
+        """
+        return self.unavailable_reason(dt=dt) is None
+
+    def spent_key(self):
+        return '{}:spent:{}'.format(purl_settings.PRIVATEURL_CACHE_KEY_PREFIX, self.token.rsplit('-', 1)[1])
+
+    def is_spent(self):
+        return caches[purl_settings.PRIVATEURL_SIGNED_SPENT_CACHE].get(self.spent_key()) is not None
+
+    def consume(self, dt=None):
+        """
+        Count hit if object is available. Single use object is atomically marked as spent in cache.
+        Return True if hit was counted, otherwise False.
+        """
+        now = dt or timezone.now()
+        if self.expire and self.expire <= now:
+            return False
+        if self.hits_limit:
+            timeout = int((self.expire - now).total_seconds()) + 1
+            if not caches[purl_settings.PRIVATEURL_SIGNED_SPENT_CACHE].add(self.spent_key(), 1, timeout):
+                return False
+        self.hit_counter += 1
+        self.first_hit = self.first_hit or now
+        self.last_hit = now
+        return True
+
+    def delete_if_unavailable(self, dt=None):
+        return False
+
+    def get_absolute_url(self):
+        return urlbuilder.build_url(self.action, self.token)
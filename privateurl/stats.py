@@ -0,0 +1,184 @@
+import atexit
+import threading
+import time
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.utils import timezone
+
+try:
+    from django.db.models.functions import TruncDate
+except ImportError:  # Django < 1.10
+    TruncDate = None
+
+from . import settings as purl_settings
+
+FIELDS = ('created', 'redeemed', 'failed', 'expired')
+
+
+def get_field(reason):
+    """
+    Return counter of result of hit, reason is None for succeeded hit.
+    """
+    if not reason:
+        return 'redeemed'
+    return 'expired' if reason == 'expired' else 'failed'
+
+
+def local_date(dt=None):
+    dt = dt or timezone.now()
+    return timezone.localtime(dt).date() if timezone.is_aware(dt) else dt.date()
+
+
+def apply_stats(counts):
+    """
+    Add counters to daily rollups, one UPDATE per (action, date), row is created if it doesn't exist.
+    counts - dict {(action, date): {field: number}}
+    """
+    model = apps.get_model('privateurl', 'PrivateUrlStats')
+    for (action, date), values in sorted(counts.items()):
+        updates = dict((f, F(f) + n) for f, n in values.items())
+        if model.objects.filter(action=action, date=date).update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(action=action, date=date, **values)
+        except IntegrityError:
+            # row was created concurrently
+            model.objects.filter(action=action, date=date).update(**updates)
+    return len(counts)
+
+
+def collect_rollups(qs, chunk_size=10000, counts=None):
+    """
+    Return dict {(action, date): {'created': n, 'redeemed': n}} counted from objects of queryset
+    (added to counts if it is passed).
+    Rows are aggregated by database in ranges of chunk_size primary keys, so large tables aren't locked
+    by one long query. Hits of url are counted at date of its last hit, failed hits aren't stored,
+    so they can't be counted.
+    """
+    counts = {} if counts is None else counts
+    bounds = qs.order_by().aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    if bounds['min_pk'] is None:
+        return counts
+    start = bounds['min_pk']
+    while start <= bounds['max_pk']:
+        chunk = qs.order_by().filter(pk__gte=start, pk__lt=start + chunk_size)
+        start += chunk_size
+        if TruncDate is None:
+            # dates are truncated in Python, chunk holds at most chunk_size rows
+            for action, created, last_hit, hit_counter in chunk.values_list('action', 'created', 'last_hit',
+                                                                           'hit_counter'):
+                counts.setdefault((action, local_date(created)), {'created': 0, 'redeemed': 0})['created'] += 1
+                if last_hit is not None and hit_counter:
+                    values = counts.setdefault((action, local_date(last_hit)), {'created': 0, 'redeemed': 0})
+                    values['redeemed'] += hit_counter
+            continue
+        rows = chunk.annotate(day=TruncDate('created')).values('action', 'day').annotate(n=Count('pk'))
+        for row in rows:
+            counts.setdefault((row['action'], row['day']), {'created': 0, 'redeemed': 0})['created'] += row['n']
+        rows = chunk.filter(last_hit__isnull=False, hit_counter__gt=0).annotate(
+            day=TruncDate('last_hit')).values('action', 'day').annotate(n=Sum('hit_counter'))
+        for row in rows:
+            counts.setdefault((row['action'], row['day']), {'created': 0, 'redeemed': 0})['redeemed'] += row['n']
+    return counts
+
+
+def fill_stats(counts):
+    """
+    Create daily rollups from counts (see collect_rollups) for (action, date) that have no rollup yet.
+    Existing rollups are kept as they are, their counters were recorded by hits. Return number of created rollups.
+    """
+    model = apps.get_model('privateurl', 'PrivateUrlStats')
+    actions = set(action for action, date in counts)
+    exist = set(model.objects.filter(action__in=actions).values_list('action', 'date'))
+    n = 0
+    for key, values in sorted(counts.items()):
+        if key in exist:
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(action=key[0], date=key[1], **values)
+            n += 1
+        except IntegrityError:
+            # rollup was created concurrently by hits
+            pass
+    return n
+
+
+class StatsBuffer(object):
+    """
+    Accumulate counters in memory of current process. Buffer is flushed on recording when flush interval
+    is over (0 disables it) and on process exit, so most of recordings don't write to database.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.flushed_at = time.time()
+
+    def add(self, action, field, n=1, dt=None):
+        """
+        Add n to counter. Return True if buffer should be flushed.
+        """
+        key = (action, local_date(dt))
+        with self.lock:
+            values = self.counts.setdefault(key, {})
+            values[field] = values.get(field, 0) + n
+        return bool(self.flush_interval) and time.time() - self.flushed_at >= self.flush_interval
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.flushed_at = time.time()
+        return apply_stats(counts) if counts else 0
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_stats_buffer():
+    """
+    Return stats buffer or None if stats are disabled (settings.PRIVATEURL_STATS).
+    """
+    global _buffer
+    if not purl_settings.PRIVATEURL_STATS:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = StatsBuffer(purl_settings.PRIVATEURL_STATS_FLUSH_INTERVAL)
+            atexit.register(_buffer.flush)
+    return _buffer
+
+
+def reset_stats_buffer():
+    global _buffer
+    with _buffer_lock:
+        _buffer = None
+
+
+def add(action, field, n=1, dt=None):
+    """
+    Add n to counter of action without writing to database. Return True if buffer should be flushed.
+    """
+    stats_buffer = get_stats_buffer()
+    return stats_buffer.add(action, field, n=n, dt=dt) if stats_buffer is not None else False
+
+
+def record(action, field, n=1, dt=None):
+    """
+    Add n to counter of action and flush buffer if flush interval is over.
+    """
+    if add(action, field, n=n, dt=dt):
+        flush_stats()
+
+
+def flush_stats():
+    """
+    Write counters accumulated by buffer to database. Return number of updated rollups.
+    """
+    stats_buffer = get_stats_buffer()
+    return stats_buffer.flush() if stats_buffer is not None else 0
@@ -0,0 +1,58 @@
+import time
+
+from django.core.cache import caches
+
+from . import settings as purl_settings
+
+
+def get_rate(action):
+    """
+    Return tuple (number of requests, period in seconds) for action or None if action isn't throttled.
+    """
+    rates = purl_settings.PRIVATEURL_THROTTLE_RATES
+    return rates.get(action, rates.get('*'))
+
+
+def get_client_ip(request):
+    """
+    Return IP address of client. Addresses in header are appended by proxies and the leftmost ones can be set
+    by client, so the address added by the outermost of settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES proxies
+    is used. REMOTE_ADDR is used if header is missing or no proxy is trusted.
+    """
+    header = purl_settings.PRIVATEURL_THROTTLE_IP_HEADER
+    proxies = purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES
+    value = request.META.get(header) if header != 'REMOTE_ADDR' and proxies > 0 else None
+    if not value:
+        return (request.META.get('REMOTE_ADDR') or '').strip()
+    values = [v.strip() for v in value.split(',')]
+    return values[max(len(values) - proxies, 0)]
+
+
+def incr(cache, key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+def is_throttled(request, action, now=None):
+    """
+    Count request of client and return True if client exceeded rate of action.
+    Sliding window is approximated by counters of current and previous fixed windows,
+    the previous one is weighted by part of it that is still in the sliding window.
+    """
+    if not purl_settings.PRIVATEURL_THROTTLE_CACHE:
+        return False
+    rate = get_rate(action)
+    if not rate:
+        return False
+    limit, period = rate
+    cache = caches[purl_settings.PRIVATEURL_THROTTLE_CACHE]
+    now = time.time() if now is None else now
+    window = int(now // period)
+    key = '{}:throttle:{}:{}:'.format(purl_settings.PRIVATEURL_CACHE_KEY_PREFIX, action, get_client_ip(request))
+    current = incr(cache, key + str(window), period * 2)
+    previous = cache.get(key + str(window - 1), 0)
+    return previous * (1 - (now % period) / float(period)) + current > limit
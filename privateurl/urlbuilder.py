@@ -0,0 +1,87 @@
+import re
+
+try:
+    from django.urls import get_resolver, get_script_prefix, get_urlconf, reverse
+except ImportError:
+    from django.core.urlresolvers import get_resolver, get_script_prefix, get_urlconf, reverse  # noqa
+from django.core.exceptions import ImproperlyConfigured
+
+from . import settings as purl_settings
+
+ACTION_RE = re.compile(r'^[-_a-zA-Z0-9]{1,40}$')
+TOKEN_RE = re.compile(r'^[-a-zA-Z0-9]{1,64}$')
+# placeholders match patterns of action and token in privateurl.urls and aren't changed by quoting
+ACTION_PLACEHOLDER = 'privateurlACTION'
+TOKEN_PLACEHOLDER = 'privateurlTOKEN'
+
+_templates = {}
+
+
+def reverse_url(action, token):
+    return reverse('{}:privateurl'.format(purl_settings.PRIVATEURL_URL_NAMESPACE),
+                   kwargs={'action': action, 'token': token})
+
+
+def get_template():
+    """
+    Return format string of url path with fields action and token. It is resolved by reverse() once
+    per URLconf (resolver is replaced when URLconf changes), script prefix and namespace.
+    """
+    key = (get_resolver(get_urlconf()), get_script_prefix(), purl_settings.PRIVATEURL_URL_NAMESPACE)
+    template = _templates.get(key)
+    if template is None:
+        url = reverse_url(ACTION_PLACEHOLDER, TOKEN_PLACEHOLDER)
+        template = url.replace('{', '{{').replace('}', '}}').replace(
+            ACTION_PLACEHOLDER, '{action}').replace(TOKEN_PLACEHOLDER, '{token}')
+        if len(_templates) > 32:
+            # keys of replaced URLconfs aren't needed anymore
+            _templates.clear()
+        _templates[key] = template
+    return template
+
+
+def get_base_url(base_url=None):
+    base_url = base_url or purl_settings.PRIVATEURL_BASE_URL
+    if not base_url:
+        raise ImproperlyConfigured('Set settings.PRIVATEURL_BASE_URL or pass base_url for building absolute urls.')
+    return base_url.rstrip('/')
+
+
+def build_url(action, token, absolute=False, base_url=None):
+    """
+    Return url of private url the same as reverse() does, but without resolving url pattern every time.
+    absolute - prepend base_url or settings.PRIVATEURL_BASE_URL (e.g. https://example.com), bool
+    """
+    if ACTION_RE.match(action) and TOKEN_RE.match(token):
+        path = get_template().format(action=action, token=token)
+    else:
+        # reverse() raises NoReverseMatch for values that don't match url pattern
+        path = reverse_url(action, token)
+    return get_base_url(base_url) + path if absolute else path
+
+
+def build_urls(objs, absolute=False, base_url=None):
+    """
+    Return list of urls of objects in one pass. objs - queryset (only action and token are fetched)
+    or iterable of objects with action and token attributes.
+    absolute, base_url - the same as in build_url
+    Raise ValueError for object whose token isn't stored (settings.PRIVATEURL_TOKEN_DIGEST), its url can be built
+    only by object returned from create or get_or_none.
+    """
+    if hasattr(objs, 'values_list'):
+        pairs = objs.values_list('action', 'token').iterator()
+    else:
+        pairs = ((obj.action, obj.token) for obj in objs)
+    template = get_template()
+    prefix = get_base_url(base_url) if absolute else ''
+    match_action, match_token = ACTION_RE.match, TOKEN_RE.match
+    urls = []
+    for action, token in pairs:
+        if token is None:
+            raise ValueError('Url of private url (action={}) whose token is stored as digest only '
+                             'can\'t be built.'.format(action))
+        if match_action(action) and match_token(token):
+            urls.append(prefix + template.format(action=action, token=token))
+        else:
+            urls.append(prefix + reverse_url(action, token))
+    return urls
@@ -1,11 +1,16 @@
 from django.conf.urls import url
 
-from . import views
+from . import settings as purl_settings, views
+
+if purl_settings.PRIVATEURL_ASYNC_VIEW:
+    from .async_views import privateurl_view
+else:
+    privateurl_view = views.privateurl_view
 
 urlpatterns = [
     url(
         r'^(?P<action>[\-_a-zA-Z0-9]{1,40})/(?P<token>[\-a-zA-Z0-9]{1,64})$',
-        views.privateurl_view,
+        privateurl_view,
         name='privateurl'
     ),
 ]
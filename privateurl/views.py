@@ -1,22 +1,134 @@
-from django.http.response import Http404, HttpResponseRedirect
+import json
+from timeit import default_timer
 
+from django.http.response import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import hitlog, settings as purl_settings, stats as purl_stats
+from .metrics import get_metrics, send_signal
 from .models import PrivateUrl
+from .registry import get_action
 from .signals import privateurl_ok, privateurl_fail
+from .signing import SignedPrivateUrl
+from .throttling import is_throttled
 
+try:
+    # Python 2: JSON strings are decoded as unicode
+    string_types = (basestring,)  # noqa: F821
+except NameError:
+    string_types = (str,)
 
-def privateurl_view(request, action, token):
-    obj = PrivateUrl.objects.get_or_none(action, token)
-    ok = False
-    if not obj or not obj.is_available():
-        results = privateurl_fail.send(PrivateUrl, request=request, obj=obj, action=action)
-    else:
-        results = privateurl_ok.send(PrivateUrl, request=request, obj=obj, action=action)
-        obj.hit_counter_inc()
-        ok = True
+
+def get_response(results, reason):
+    """
+    Return response of receivers or default response.
+    """
     for receiver, result in results:
         if isinstance(result, dict):
             if 'response' in result:
                 return result['response']
-    if not ok:
+    if reason == 'throttled':
+        return HttpResponse(status=429)
+    if reason:
         raise Http404
     return HttpResponseRedirect('/')
+
+
+def dispatch(signal, name, **named):
+    """
+    Call handler of registered action and send signal unless action disabled it.
+    Return list of (receiver, result) where result of handler goes first.
+    """
+    entry = get_action(named['action'])
+    if entry is None:
+        return send_signal(signal, name, PrivateUrl, **named)
+    results = []
+    handler = entry.on_ok if name == 'ok' else entry.on_fail
+    if handler is not None:
+        start = default_timer()
+        results.append((handler, handler(**named)))
+        get_metrics().timing('handler', default_timer() - start, named['action'], signal=name)
+    if entry.send_signals:
+        results.extend(send_signal(signal, name, PrivateUrl, **named))
+    return results
+
+
+def process_hit(request, action, token):
+    """
+    Find private url and count hit: throttling, signed token, format of token, lookup, availability
+    and counter. Stats and hit log are recorded too. It is shared by sync and async views (async view
+    calls it in thread), handlers and receivers aren't called.
+    Return (obj, reason, now), reason is None if hit is counted.
+    """
+    metrics = get_metrics()
+    start = default_timer()
+    obj, reason = None, None
+    if is_throttled(request, action):
+        reason = 'throttled'
+    elif purl_settings.PRIVATEURL_SIGNED_TOKENS:
+        obj = SignedPrivateUrl.load(action, token)
+    if obj is None and reason is None:
+        reason = PrivateUrl.precheck(action, token)
+        if reason is None:
+            obj = PrivateUrl.objects.get_or_none(action, token)
+            if obj is None:
+                reason = 'not_found'
+    now = timezone.now()
+    metrics.timing('lookup', default_timer() - start, action)
+    if obj is not None:
+        reason = obj.unavailable_reason(dt=now)
+        if reason is None:
+            start = default_timer()
+            if not obj.consume(dt=now):
+                reason = obj.unavailable_reason(dt=now) or 'limit_reached'
+            metrics.timing('counter', default_timer() - start, action)
+    purl_stats.record(action, purl_stats.get_field(reason), dt=now)
+    hitlog.log_hit(request, action, obj, reason, now)
+    if reason:
+        metrics.incr('fail', action, reason=reason)
+    else:
+        metrics.incr('ok', action)
+    return obj, reason, now
+
+
+def privateurl_view(request, action, token):
+    obj, reason, now = process_hit(request, action, token)
+    if reason:
+        results = dispatch(privateurl_fail, 'fail', request=request, obj=obj, action=action, reason=reason)
+    else:
+        results = dispatch(privateurl_ok, 'ok', request=request, obj=obj, action=action)
+        if obj.auto_delete:
+            obj.delete_if_unavailable(dt=now)
+    return get_response(results, reason)
+
+
+@csrf_exempt
+@require_POST
+def verify_view(request):
+    """
+    Check many tokens of action by one request. It isn't included in privateurl.urls, add it to url patterns
+    protected by authentication of your services.
+    Request body is JSON {"action": "...", "tokens": ["...", ...], "consume": false}, response is JSON
+    {"action": "...", "results": {"<token>": {"available": true, "reason": null}, ...}},
+    see PrivateUrlManager.verify_many.
+    """
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+        action, tokens, consume = payload['action'], payload['tokens'], payload.get('consume', False)
+        if not isinstance(action, string_types) or not isinstance(tokens, list) or not isinstance(consume, bool):
+            raise ValueError
+        if not all(isinstance(token, string_types) for token in tokens):
+            raise ValueError
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'invalid_request'}, status=400)
+    if len(tokens) > purl_settings.PRIVATEURL_VERIFY_MAX_TOKENS:
+        return JsonResponse({'error': 'too_many_tokens'}, status=400)
+    if is_throttled(request, action):
+        return JsonResponse({'error': 'throttled'}, status=429)
+    results = PrivateUrl.objects.verify_many(action, tokens, consume=consume)
+    return JsonResponse({
+        'action': action,
+        'results': dict((token, {'available': reason is None, 'reason': reason}) for token, reason in results.items()),
+    })
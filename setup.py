@@ -13,7 +13,7 @@ setup(
     author='Igor Melnyk @liminspace',
     author_email='liminspace@gmail.com',
     url='https://github.com/liminspace/django-privateurl',
-    packages=find_packages(exclude=('tests', 'tests.*')),
+    packages=find_packages(exclude=('tests', 'tests.*', 'benchmarks', 'benchmarks.*')),
     include_package_data=True,
     zip_safe=False,  # because include static
     install_requires=[
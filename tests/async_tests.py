@@ -0,0 +1,93 @@
+"""
+Tests of async views. They are kept apart from tests.py because async syntax can't be parsed by Python 2,
+tests.py imports them on Django 3.1+.
+"""
+from asgiref.sync import sync_to_async
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.encoding import force_str
+
+import privateurl
+from privateurl import metrics as purl_metrics, settings as purl_settings
+from privateurl.models import PrivateUrl
+from privateurl.signals import privateurl_ok, privateurl_fail
+
+
+class TestPrivateUrlAsyncView(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestPrivateUrlAsyncView, cls).setUpClass()
+
+        @receiver(privateurl_ok, weak=False, dispatch_uid='async_ok')
+        async def ok(action, obj, **kwargs):  # noqa: F841
+            if action == 'async':
+                return {'response': HttpResponse('ok {}'.format(obj.hit_counter))}
+
+        @receiver(privateurl_fail, weak=False, dispatch_uid='sync_fail')
+        def fail(action, **kwargs):  # noqa: F841
+            if action == 'async':
+                return {'response': HttpResponse('fail')}
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestPrivateUrlAsyncView, cls).tearDownClass()
+        privateurl_ok.disconnect(dispatch_uid='async_ok')
+        privateurl_fail.disconnect(dispatch_uid='sync_fail')
+
+    def get_url(self, obj):
+        return reverse('privateurl_async', kwargs={'action': obj.action, 'token': obj.token})
+
+    async def test_receivers(self):
+        t = await sync_to_async(PrivateUrl.create)('async', hits_limit=2, auto_delete=True)
+        for i in range(2):
+            response = await self.async_client.get(self.get_url(t))
+            self.assertEqual(force_str(response.content), 'ok {}'.format(i + 1))
+        response = await self.async_client.get(self.get_url(t))
+        self.assertEqual(force_str(response.content), 'fail')
+        exists = await sync_to_async(PrivateUrl.objects.filter(pk=t.pk).exists)()
+        self.assertFalse(exists)
+
+    async def test_registered_action(self):
+        async def on_ok(obj, **kwargs):
+            return {'response': HttpResponse('handler {}'.format(obj.hit_counter))}
+
+        privateurl.register_action('async3', on_ok=on_ok)
+        try:
+            t = await sync_to_async(PrivateUrl.create)('async3')
+            response = await self.async_client.get(self.get_url(t))
+            self.assertEqual(force_str(response.content), 'handler 1')
+        finally:
+            privateurl.unregister_action('async3')
+
+    async def test_metrics(self):
+        backend_bak = purl_settings.PRIVATEURL_METRICS_BACKEND
+        purl_settings.PRIVATEURL_METRICS_BACKEND = 'privateurl.metrics.InMemoryMetrics'
+        purl_metrics.reset_metrics()
+        try:
+            t = await sync_to_async(PrivateUrl.create)('async')
+            for i in range(2):
+                await self.async_client.get(self.get_url(t))
+            snapshot = purl_metrics.get_metrics().snapshot()
+        finally:
+            purl_settings.PRIVATEURL_METRICS_BACKEND = backend_bak
+            purl_metrics.reset_metrics()
+        self.assertEqual(snapshot['counters'], {
+            ('ok', 'async'): 1,
+            ('fail', 'async', ('reason', 'limit_reached')): 1,
+        })
+        timings = snapshot['timings']
+        self.assertEqual(timings[('lookup', 'async')][0], 2)
+        self.assertEqual(timings[('counter', 'async')][0], 1)
+        self.assertEqual((timings[('ok', 'async')][0], timings[('fail', 'async')][0]), (1, 1))
+        name = 'tests.async_tests.TestPrivateUrlAsyncView.setUpClass.<locals>.ok'
+        receiver_key = ('receiver', 'async', ('receiver', name), ('signal', 'ok'))
+        self.assertEqual(timings[receiver_key][0], 1)
+
+    async def test_default_responses(self):
+        t = await sync_to_async(PrivateUrl.create)('async2')
+        response = await self.async_client.get(self.get_url(t))
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(self.get_url(t))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.db import models
+
+from privateurl.models import AbstractPrivateUrl
+
+
+class TrackingUrl(AbstractPrivateUrl):
+    shard_database = 'shard'
+
+    # users are stored in other database
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.DO_NOTHING,
+                             db_constraint=False, related_name='+')
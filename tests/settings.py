@@ -51,6 +51,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db.sqlite3'),
+        # file database lets concurrency tests use several connections
+        'TEST': {'NAME': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_db.sqlite3')},
         # 'ENGINE': 'django.db.backends.mysql',
         # 'NAME': 'dju',
         # 'USER': 'root',
@@ -58,6 +60,26 @@ DATABASES = {
     }
 }
 
+# database of shard model tests.TrackingUrl
+DATABASES['shard'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shard.sqlite3'),
+    'TEST': {'NAME': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_shard.sqlite3')},
+}
+
+if os.environ.get('PRIVATEURL_TEST_POSTGRESQL'):
+    # connection parameters are taken from PGHOST, PGUSER, PGPASSWORD environment variables
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PGDATABASE', 'privateurl'),
+    }
+    DATABASES['shard'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PGDATABASE', 'privateurl') + '_shard',
+    }
+
+DATABASE_ROUTERS = ['privateurl.sharding.PrivateUrlRouter']
+
 LANGUAGE_CODE = 'en'
 
 TIME_ZONE = 'Europe/Kiev'
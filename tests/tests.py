@@ -1,18 +1,50 @@
 import datetime
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import skipIf, skipUnless
 
+import django
 from django.contrib.auth import get_user_model
 
 try:
-    from django.urls import reverse, NoReverseMatch
+    from django.urls import reverse, set_script_prefix, NoReverseMatch
 except ImportError:
-    from django.core.urlresolvers import reverse, NoReverseMatch  # noqa
+    from django.core.urlresolvers import reverse, set_script_prefix, NoReverseMatch  # noqa
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.migrations.state import ProjectState
+from django.db.models import QuerySet
 from django.dispatch import receiver
 from django.http import HttpResponse
 from django.shortcuts import resolve_url
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
 from django.utils.encoding import force_str
-from privateurl.models import PrivateUrl
+import privateurl
+from privateurl import admin as purl_admin, cache as purl_cache, hits as purl_hits, metrics as purl_metrics
+from privateurl import models as purl_models, settings as purl_settings, sharding as purl_sharding, urlbuilder
+from privateurl import hitlog as purl_hitlog, stats as purl_stats
+from privateurl.digest import make_digest
+from privateurl.serialization import import_rows, read_jsonl
+from privateurl.models import PrivateUrl, PrivateUrlHit, PrivateUrlStats
 from privateurl.signals import privateurl_ok, privateurl_fail
+from privateurl.signing import SignedPrivateUrl
+from privateurl.throttling import get_client_ip, is_throttled
+from tests.models import TrackingUrl
+
+if django.VERSION >= (3, 1):
+    # async views require Django 3.1+ (Python 3), syntax of their tests can't be parsed by Python 2
+    from tests.async_tests import TestPrivateUrlAsyncView  # noqa: F401
 
 
 class TestPrivateUrl(TestCase):
@@ -46,6 +78,55 @@ class TestPrivateUrl(TestCase):
         PrivateUrl.create('test', user=user, replace=True)
         self.assertEqual(PrivateUrl.objects.filter(action='test', user=user).count(), 1)
 
+    def test_bulk_create_urls(self):
+        user = get_user_model().objects.create(username='test', email='test@mail.com', password='test')
+        old = PrivateUrl.create('test', user=user)
+        specs = [{'data': {'n': i}, 'expire': datetime.timedelta(days=1)} for i in range(10)]
+        specs.append({'user': user, 'replace': True, 'hits_limit': 0, 'auto_delete': True})
+        objs = PrivateUrl.bulk_create_urls('test', specs, batch_size=4)
+        self.assertEqual(len(objs), 11)
+        self.assertEqual(PrivateUrl.objects.filter(action='test').count(), 11)
+        self.assertFalse(PrivateUrl.objects.filter(pk=old.pk).exists())
+        self.assertEqual(len(set(obj.token for obj in objs)), 11)
+        self.assertEqual([obj.get_data() for obj in objs[:10]], [{'n': i} for i in range(10)])
+        self.assertTrue(all(obj.expire > obj.created for obj in objs[:10]))
+        j = PrivateUrl.objects.get_or_none('test', objs[-1].token)
+        self.assertEqual((j.user, j.hits_limit, j.auto_delete), (user, 0, True))
+        self.assertEqual(objs[3].get_absolute_url(),
+                         reverse('purl:privateurl', kwargs={'action': 'test', 'token': objs[3].token}))
+        objs = PrivateUrl.bulk_create_urls('test', [{'user': user, 'replace': True}] * 3)
+        self.assertEqual(len(objs), 1)
+        self.assertEqual(PrivateUrl.objects.filter(action='test', user=user).count(), 1)
+        # replace in later batch removes object of previous batch
+        objs = PrivateUrl.bulk_create_urls('test', [{'user': user, 'replace': True, 'hits_limit': 2}] * 2,
+                                           batch_size=1)
+        self.assertEqual(len(objs), 1)
+        self.assertEqual(list(PrivateUrl.objects.filter(action='test', user=user).values_list('pk', flat=True)),
+                         [objs[0].pk])
+        self.assertTrue(objs[0].consume())
+        self.assertEqual(PrivateUrl.objects.get(pk=objs[0].pk).hit_counter, 1)
+        with self.assertRaises(AttributeError):
+            PrivateUrl.bulk_create_urls('test', specs, batch_size=0)
+
+    def test_bulk_create_urls_collisions(self):
+        exist = PrivateUrl.create('test')
+        tokens = [exist.token, exist.token, 'token-new-1', 'token-new-1', 'token-new-2']
+        generate_tokens_bak = PrivateUrl.generate_tokens
+        try:
+            PrivateUrl.generate_tokens = classmethod(lambda cls, n, **kwargs: [tokens.pop(0) for i in range(n)])
+            objs = PrivateUrl.bulk_create_urls('test', [{}, {}])
+        finally:
+            PrivateUrl.generate_tokens = generate_tokens_bak
+        self.assertEqual(sorted(obj.token for obj in objs), ['token-new-1', 'token-new-2'])
+        self.assertEqual(PrivateUrl.objects.filter(action='test').count(), 3)
+        token_min_size_bak = PrivateUrl.TOKEN_MIN_SIZE
+        try:
+            PrivateUrl.TOKEN_MIN_SIZE = 1
+            with self.assertRaises(RuntimeError):
+                PrivateUrl.bulk_create_urls('test', [{}] * 100, token_size=1)
+        finally:
+            PrivateUrl.TOKEN_MIN_SIZE = token_min_size_bak
+
     def test_token_size(self):
         t = PrivateUrl.create('test', token_size=50, dashed_piece_size=0)
         self.assertEqual(len(t.token), 50)
@@ -69,6 +150,70 @@ class TestPrivateUrl(TestCase):
         t.set_data(None)
         self.assertEqual(t.data, '')
         self.assertIsNone(t.get_data())
+        t.set_data(d)
+        self.assertIs(t.get_data(), t.get_data())
+        t.data = '{"k": 1}'
+        self.assertEqual(t.get_data(), {'k': 1})
+
+    def test_data_compressed(self):
+        d = {'items': [{'id': i, 'name': 'product'} for i in range(100)]}
+        codec_bak = purl_settings.PRIVATEURL_DATA_CODEC
+        try:
+            for codec in ('zlib', 'bz2', 'lzma'):
+                purl_settings.PRIVATEURL_DATA_CODEC = codec
+                t = PrivateUrl.create('test', data=d)
+                self.assertEqual(t.data, '')
+                self.assertLess(len(t.data_compressed), len(json.dumps(d)) / 5)
+                self.assertEqual(PrivateUrl.objects.get(pk=t.pk).get_data(), d)
+            t = PrivateUrl.create('test', data={'k': 'v'})
+            self.assertEqual((t.data, t.data_compressed), ('{"k": "v"}', None))
+            purl_settings.PRIVATEURL_DATA_CODEC = 'unknown'
+            with self.assertRaises(ValueError):
+                PrivateUrl.create('test', data=d)
+        finally:
+            purl_settings.PRIVATEURL_DATA_CODEC = codec_bak
+        t = PrivateUrl.objects.get(pk=t.pk)
+        self.assertEqual(t.get_data(), {'k': 'v'})
+
+    def test_defer_data(self):
+        t = PrivateUrl.create('test', data={'k': 'v'})
+        defer_data_bak = purl_settings.PRIVATEURL_DEFER_DATA
+        try:
+            purl_settings.PRIVATEURL_DEFER_DATA = True
+            j = PrivateUrl.objects.get_or_none(t.action, t.token)
+        finally:
+            purl_settings.PRIVATEURL_DEFER_DATA = defer_data_bak
+        self.assertEqual(j.get_deferred_fields(), {'data', 'data_compressed'})
+        with self.assertNumQueries(1):
+            self.assertEqual(j.get_data(), {'k': 'v'})
+
+    def test_projection(self):
+        user = get_user_model().objects.create_user('proj', 'proj@site.com', 'proj')
+        t = PrivateUrl.create('test', user=user, data={'k': 'v'}, hits_limit=0)
+        t2 = PrivateUrl.create('test2', user=user)
+        projection_bak = purl_settings.PRIVATEURL_PROJECTION
+        action_projections_bak = purl_settings.PRIVATEURL_ACTION_PROJECTIONS
+        try:
+            purl_settings.PRIVATEURL_PROJECTION = {'user_fields': ['username'], 'defer_data': True}
+            purl_settings.PRIVATEURL_ACTION_PROJECTIONS = {'test2': {'select_user': False}}
+            j = PrivateUrl.objects.get_or_none(t.action, t.token)
+            j2 = PrivateUrl.objects.get_or_none(t2.action, t2.token)
+            purl_settings.PRIVATEURL_ACTION_PROJECTIONS = {'test2': {'unknown': 1}}
+            self.assertRaises(ValueError, PrivateUrl.objects.get_or_none, t2.action, t2.token)
+        finally:
+            purl_settings.PRIVATEURL_PROJECTION = projection_bak
+            purl_settings.PRIVATEURL_ACTION_PROJECTIONS = action_projections_bak
+        self.assertEqual(j.get_deferred_fields(), {'data', 'data_compressed'})
+        with self.assertNumQueries(0):
+            self.assertEqual(j.user.username, 'proj')
+        self.assertIn('email', j.user.get_deferred_fields())
+        with self.assertNumQueries(1):
+            j.hit_counter_inc()
+        self.assertEqual(PrivateUrl.objects.get(pk=t.pk).get_data(), {'k': 'v'})
+        self.assertEqual(j.get_deferred_fields(), {'data', 'data_compressed'})
+        self.assertEqual(j2.get_deferred_fields(), {'data', 'data_compressed'})
+        with self.assertNumQueries(1):
+            self.assertEqual(j2.user.email, 'proj@site.com')
 
     def test_manager_get_or_none(self):
         t = PrivateUrl.create('test')
@@ -110,6 +255,43 @@ class TestPrivateUrl(TestCase):
         j.hit_counter_inc()
         self.assertIsNone(j.pk)
 
+    def test_consume(self):
+        for returning in (True, False):
+            can_update_returning_bak = purl_models.can_update_returning
+            try:
+                purl_models.can_update_returning = lambda conn: returning and can_update_returning_bak(conn)
+                t = PrivateUrl.create('test', hits_limit=2, auto_delete=True)
+                stale = PrivateUrl.objects.get(pk=t.pk)
+                self.assertTrue(t.consume())
+                self.assertEqual(t.hit_counter, 1)
+                self.assertIsNotNone(t.first_hit)
+                self.assertTrue(stale.consume())
+                self.assertEqual(stale.hit_counter, 2)
+                self.assertFalse(stale.is_available())
+                self.assertFalse(t.consume())
+                self.assertEqual(PrivateUrl.objects.get(pk=t.pk).hit_counter, 2)
+                self.assertFalse(t.delete_if_unavailable())
+                self.assertTrue(stale.delete_if_unavailable())
+                self.assertIsNone(stale.pk)
+                self.assertFalse(PrivateUrl.objects.filter(pk=t.pk).exists())
+                j = PrivateUrl.create('test', expire=datetime.timedelta(seconds=-1))
+                self.assertFalse(j.consume())
+                self.assertEqual(PrivateUrl.objects.get(pk=j.pk).hit_counter, 0)
+            finally:
+                purl_models.can_update_returning = can_update_returning_bak
+        t = PrivateUrl(action='test', token='test', hits_limit=1)
+        self.assertTrue(t.consume())
+        self.assertFalse(t.consume())
+        self.assertEqual(t.hit_counter, 1)
+
+    def test_available_queryset(self):
+        a = PrivateUrl.create('test', hits_limit=0)
+        b = PrivateUrl.create('test', expire=datetime.timedelta(seconds=-1))
+        c = PrivateUrl.create('test')
+        c.hit_counter_inc()
+        self.assertEqual(list(PrivateUrl.objects.available().values_list('pk', flat=True)), [a.pk])
+        self.assertEqual(set(PrivateUrl.objects.unavailable().values_list('pk', flat=True)), {b.pk, c.pk})
+
     def test_long_action_name_fail(self):
         action = 'a' * 32
         a = PrivateUrl.create(action)
@@ -127,6 +309,56 @@ class TestPrivateUrl(TestCase):
     def test_generate_token(self):
         self.assertEqual(len(PrivateUrl.generate_token(size=(60, 60), dashed_piece_size=10)), 60)
         self.assertEqual(len(PrivateUrl.generate_token(size=(60, 60), dashed_piece_size=9)), 59)  # strip end dash
+        token = PrivateUrl.generate_token(size=30, dashed_piece_size=4)
+        self.assertEqual([len(p) for p in token.split('-')], [4] * 6)
+        self.assertIsNotNone(re.match(r'^[-a-zA-Z0-9]+$', token), token)
+        random.seed(1)
+        value = random.random()
+        random.seed(1)
+        PrivateUrl.generate_token(size=(8, 64))
+        self.assertEqual(random.random(), value)
+        for i in range(2):  # the second call uses cached configuration
+            self.assertRaises(AttributeError, PrivateUrl.generate_token, size=10.0)
+            self.assertRaises(AttributeError, PrivateUrl.generate_token, size=(10, 20.0))
+            self.assertRaises(AttributeError, PrivateUrl.generate_token, size=(10, 20), dashed_piece_size=-1)
+            PrivateUrl.generate_token(size=10)
+            PrivateUrl.generate_token(size=(10, 20), dashed_piece_size=1)
+
+    def test_is_valid_token(self):
+        for size, dashed_piece_size in (((8, 64), 12), (30, 4), ((10, 20), 0), ((8, 16), 1)):
+            for i in range(50):
+                token = PrivateUrl.generate_token(size=size, dashed_piece_size=dashed_piece_size)
+                self.assertTrue(PrivateUrl.is_valid_token(token, size=size, dashed_piece_size=dashed_piece_size))
+        self.assertTrue(PrivateUrl.is_valid_token('abcd-efgh-ij', size=12, dashed_piece_size=4))
+        self.assertTrue(PrivateUrl.is_valid_token('abcd-efgh-ijk', size=(12, 13), dashed_piece_size=4))
+        self.assertFalse(PrivateUrl.is_valid_token('abcd-efgh-ijk', size=12, dashed_piece_size=4))
+        self.assertFalse(PrivateUrl.is_valid_token('abc-defgh-ij', size=12, dashed_piece_size=4))
+        self.assertFalse(PrivateUrl.is_valid_token('abcd-efgh-', size=10, dashed_piece_size=4))
+        self.assertFalse(PrivateUrl.is_valid_token('abcdefgh_j', size=10, dashed_piece_size=0))
+        self.assertFalse(PrivateUrl.is_valid_token('abcdefgh', size=10, dashed_piece_size=0))
+
+    def test_generate_tokens(self):
+        tokens = PrivateUrl.generate_tokens(500, size=(8, 12), dashed_piece_size=0)
+        self.assertEqual(len(set(tokens)), 500)
+        self.assertTrue(all(8 <= len(t) <= 12 for t in tokens))
+        token_min_size_bak = PrivateUrl.TOKEN_MIN_SIZE
+        try:
+            PrivateUrl.TOKEN_MIN_SIZE = 1
+            with self.assertRaises(RuntimeError):
+                PrivateUrl.generate_tokens(100, size=1)
+        finally:
+            PrivateUrl.TOKEN_MIN_SIZE = token_min_size_bak
+
+    def test_generate_tokens_speed(self):
+        from benchmarks.tokens import legacy_generate_token
+        n = 2000
+        t = time.time()
+        for i in range(n):
+            legacy_generate_token(size=(8, 64), dashed_piece_size=12)
+        legacy_time = time.time() - t
+        t = time.time()
+        PrivateUrl.generate_tokens(n, size=(8, 64), dashed_piece_size=12)
+        self.assertLess(time.time() - t, legacy_time)
 
 
 class TestPrivateUrlView(TestCase):
@@ -162,6 +394,61 @@ class TestPrivateUrlView(TestCase):
         response = self.client.get(t.get_absolute_url())
         self.assertEqual(response.status_code, 404)
 
+    def test_signed(self):
+        user = get_user_model().objects.create(username='test', email='test@mail.com', password='test')
+        signed_tokens_bak = purl_settings.PRIVATEURL_SIGNED_TOKENS
+        try:
+            purl_settings.PRIVATEURL_SIGNED_TOKENS = True
+            cache.clear()
+            t = PrivateUrl.create_signed('test', user=user, expire=datetime.timedelta(days=1), single_use=True)
+            with self.assertNumQueries(0):
+                response = self.client.get(t.get_absolute_url())
+            self.assertEqual(force_str(response.content), 'ok')
+            response = self.client.get(t.get_absolute_url())
+            self.assertEqual(force_str(response.content), 'fail')
+            t = PrivateUrl.create_signed('test2')
+            for i in range(2):
+                response = self.client.get(t.get_absolute_url())
+                self.assertEqual(response.status_code, 302)
+            forged = t.token[:-1] + ('0' if t.token[-1] != '0' else '1')
+            response = self.client.get(reverse('purl:privateurl', kwargs={'action': 'test2', 'token': forged}))
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(reverse('purl:privateurl', kwargs={'action': 'test3', 'token': t.token}))
+            self.assertEqual(response.status_code, 404)
+        finally:
+            purl_settings.PRIVATEURL_SIGNED_TOKENS = signed_tokens_bak
+
+    def test_fail_reasons(self):
+        reasons = []
+
+        def fail(reason, **kwargs):
+            reasons.append(reason)
+
+        privateurl_fail.connect(fail, dispatch_uid='fail_reasons')
+        actions_bak = purl_settings.PRIVATEURL_ACTIONS
+        validate_bak = purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT
+        try:
+            t = PrivateUrl.create('test2', hits_limit=1)
+            self.client.get(t.get_absolute_url())
+            self.client.get(t.get_absolute_url())
+            t = PrivateUrl.create('test2', expire=datetime.timedelta(seconds=-1))
+            self.client.get(t.get_absolute_url())
+            t.token = 'unknown'
+            self.client.get(t.get_absolute_url())
+            purl_settings.PRIVATEURL_ACTIONS = ['test2']
+            purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT = True
+            t.action = 'test3'
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 404)
+            t.action, t.token = 'test2', 'short'
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 404)
+        finally:
+            purl_settings.PRIVATEURL_ACTIONS = actions_bak
+            purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT = validate_bak
+            privateurl_fail.disconnect(dispatch_uid='fail_reasons')
+        self.assertEqual(reasons, ['limit_reached', 'expired', 'not_found', 'unknown_action', 'invalid_token'])
+
     def test_receivers2(self):
         t = PrivateUrl.create('test2')
         response = self.client.get(t.get_absolute_url())
@@ -170,6 +457,1273 @@ class TestPrivateUrlView(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class TestPrivateUrlBuilder(TestCase):
+    def test_build_url(self):
+        name = '{}:privateurl'.format(purl_settings.PRIVATEURL_URL_NAMESPACE)
+        for action in ('test', 'a', 'x-y_Z' * 8):
+            for size in ((8, 64), 64, 8):
+                token = PrivateUrl.generate_token(size=size)
+                self.assertEqual(urlbuilder.build_url(action, token),
+                                 reverse(name, kwargs={'action': action, 'token': token}))
+        with self.assertRaises(NoReverseMatch):
+            urlbuilder.build_url('bad action', 'token')
+        with self.assertRaises(NoReverseMatch):
+            PrivateUrl(action='test', token='bad_token').get_absolute_url()
+        set_script_prefix('/prefix/')
+        try:
+            self.assertEqual(urlbuilder.build_url('test', 'token'), '/prefix/private/test/token')
+        finally:
+            set_script_prefix('/')
+        self.assertEqual(urlbuilder.build_url('test', 'token'), '/private/test/token')
+
+    def test_absolute(self):
+        with self.assertRaises(ImproperlyConfigured):
+            urlbuilder.build_url('test', 'token', absolute=True)
+        self.assertEqual(urlbuilder.build_url('test', 'token', absolute=True, base_url='https://example.com/'),
+                         'https://example.com/private/test/token')
+        base_url_bak = purl_settings.PRIVATEURL_BASE_URL
+        try:
+            purl_settings.PRIVATEURL_BASE_URL = 'http://example.com'
+            self.assertEqual(urlbuilder.build_urls([PrivateUrl(action='test', token='token')], absolute=True),
+                             ['http://example.com/private/test/token'])
+        finally:
+            purl_settings.PRIVATEURL_BASE_URL = base_url_bak
+
+    def test_build_urls(self):
+        objs = PrivateUrl.bulk_create_urls('test', [{}] * 5)
+        urls = [obj.get_absolute_url() for obj in PrivateUrl.objects.order_by('pk')]
+        with self.assertNumQueries(1):
+            self.assertEqual(urlbuilder.build_urls(PrivateUrl.objects.order_by('pk')), urls)
+        self.assertEqual(sorted(urlbuilder.build_urls(objs)), sorted(urls))
+
+    def test_build_urls_digest(self):
+        digest_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST
+        try:
+            purl_settings.PRIVATEURL_TOKEN_DIGEST = True
+            objs = PrivateUrl.bulk_create_urls('test', [{}] * 2)
+            self.assertEqual(len(urlbuilder.build_urls(objs)), 2)
+            with self.assertRaises(ValueError):
+                urlbuilder.build_urls(PrivateUrl.objects.filter(action='test'))
+        finally:
+            purl_settings.PRIVATEURL_TOKEN_DIGEST = digest_bak
+
+
+class TestPrivateUrlCache(TestCase):
+    def setUp(self):
+        self.cache_bak = purl_settings.PRIVATEURL_CACHE
+        purl_settings.PRIVATEURL_CACHE = 'default'
+        purl_cache.connect_signals()
+        purl_cache.get_cache().clear()
+
+    def tearDown(self):
+        purl_cache.disconnect_signals()
+        purl_settings.PRIVATEURL_CACHE = self.cache_bak
+
+    def test_get_or_none(self):
+        user = get_user_model().objects.create(username='test', email='test@mail.com', password='test')
+        t = PrivateUrl.create('test', user=user, hits_limit=0, data={'k': 'v'})
+        with self.assertNumQueries(1):
+            PrivateUrl.objects.get_or_none(t.action, t.token)
+        with self.assertNumQueries(0):
+            j = PrivateUrl.objects.get_or_none(t.action, t.token)
+        self.assertEqual((j.pk, j.user_id, j.get_data(), j.hits_limit), (t.pk, user.pk, {'k': 'v'}, 0))
+        self.assertFalse(j._state.adding)
+        with self.assertNumQueries(1):
+            self.assertEqual(j.user, user)
+        with self.assertNumQueries(1):
+            self.assertTrue(j.consume())
+        self.assertEqual(PrivateUrl.objects.get(pk=t.pk).hit_counter, 1)
+
+    def test_binary_data(self):
+        codec_bak = purl_settings.PRIVATEURL_DATA_CODEC
+        try:
+            purl_settings.PRIVATEURL_DATA_CODEC = 'zlib'
+            t = PrivateUrl.create('test', data={'k': 'v' * 1000})
+        finally:
+            purl_settings.PRIVATEURL_DATA_CODEC = codec_bak
+        obj = PrivateUrl.objects.get(pk=t.pk)
+        # PostgreSQL returns binary fields as memoryview
+        obj.data_compressed = memoryview(bytes(obj.data_compressed))
+        row = purl_cache.make_row(obj)
+        self.assertEqual(type(row['data_compressed']), bytes)
+        get_or_none_from_db_bak = PrivateUrl.objects.get_or_none_from_db
+        try:
+            PrivateUrl.objects.get_or_none_from_db = lambda action, token: obj
+            PrivateUrl.objects.get_or_none(t.action, t.token)
+        finally:
+            PrivateUrl.objects.get_or_none_from_db = get_or_none_from_db_bak
+        with self.assertNumQueries(0):
+            j = PrivateUrl.objects.get_or_none(t.action, t.token)
+        self.assertEqual(j.get_data(), {'k': 'v' * 1000})
+
+    def test_not_found(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(PrivateUrl.objects.get_or_none('test', 'none'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(PrivateUrl.objects.get_or_none('test', 'none'))
+        t = PrivateUrl(action='test', token='none')
+        t.save()
+        self.assertEqual(PrivateUrl.objects.get_or_none('test', 'none'), t)
+
+    def test_invalidation(self):
+        t = PrivateUrl.create('test', hits_limit=1)
+        PrivateUrl.objects.get_or_none(t.action, t.token)
+        t.hits_limit = 5
+        t.save()
+        self.assertEqual(PrivateUrl.objects.get_or_none(t.action, t.token).hits_limit, 5)
+        t.delete()
+        self.assertIsNone(PrivateUrl.objects.get_or_none(t.action, t.token))
+        t = PrivateUrl.create('test', hits_limit=1)
+        self.assertTrue(PrivateUrl.objects.get_or_none(t.action, t.token).consume())
+        stale = PrivateUrl.objects.get_or_none(t.action, t.token)
+        self.assertFalse(stale.consume())
+        self.assertFalse(PrivateUrl.objects.get_or_none(t.action, t.token).is_available())
+
+
+class TestPrivateUrlTokenDigest(TestCase):
+    def setUp(self):
+        self.digest_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST
+        self.fallback_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = True
+
+    def tearDown(self):
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = self.digest_bak
+        purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK = self.fallback_bak
+
+    def test_create(self):
+        t = PrivateUrl.create('test', data={'k': 'v'})
+        urls = PrivateUrl.bulk_create_urls('test', [{}, {}])
+        self.assertEqual(len(make_digest(t.token)), 32)
+        self.assertNotEqual(make_digest(t.token), make_digest(urls[0].token))
+        self.assertEqual(list(PrivateUrl.objects.filter(pk=t.pk).values_list('token', 'token_digest')),
+                         [(None, make_digest(t.token))])
+        self.assertFalse(PrivateUrl.objects.filter(token__isnull=False).exists())
+        self.assertEqual(PrivateUrl.objects.filter(token_digest__in=[make_digest(u.token) for u in urls]).count(), 2)
+        purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK = False
+        with self.assertNumQueries(1):
+            j = PrivateUrl.objects.get_or_none(t.action, t.token)
+        self.assertEqual((j.pk, j.token, j.get_data()), (t.pk, t.token, {'k': 'v'}))
+        self.assertIsNotNone(PrivateUrl.objects.get_or_none('test', urls[1].token))
+        self.assertIsNone(PrivateUrl.objects.get_or_none('test', 'unknown'))
+        self.assertIsNone(PrivateUrl.objects.get_or_none('test2', t.token))
+        self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 302)
+        self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 404)
+        self.assertRaises(ValueError, PrivateUrl.objects.get(pk=t.pk).get_absolute_url)
+
+    def test_cache(self):
+        cache_bak = purl_settings.PRIVATEURL_CACHE
+        purl_settings.PRIVATEURL_CACHE = 'default'
+        purl_cache.connect_signals()
+        purl_cache.get_cache().clear()
+        try:
+            t = PrivateUrl.create('test', hits_limit=0)
+            PrivateUrl.objects.get_or_none(t.action, t.token)
+            with self.assertNumQueries(0):
+                j = PrivateUrl.objects.get_or_none(t.action, t.token)
+            self.assertEqual(j.token, t.token)
+            obj = PrivateUrl.objects.get(pk=t.pk)
+            obj.hits_limit = 5
+            obj.save()
+            self.assertIsNone(PrivateUrl.objects.get(pk=t.pk).token)
+            self.assertEqual(PrivateUrl.objects.get_or_none(t.action, t.token).hits_limit, 5)
+        finally:
+            purl_cache.disconnect_signals()
+            purl_settings.PRIVATEURL_CACHE = cache_bak
+
+    def test_convert(self):
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = False
+        urls = [PrivateUrl.create('test') for i in range(3)]
+        self.assertFalse(PrivateUrl.objects.filter(token_digest__isnull=False).exists())
+        self.assertRaises(CommandError, call_command, 'privateurl_digest_tokens', clear_tokens=True, verbosity=0)
+        purl_settings.PRIVATEURL_TOKEN_DIGEST = True
+        with self.assertNumQueries(2):
+            self.assertEqual(PrivateUrl.objects.get_or_none('test', urls[0].token).pk, urls[0].pk)
+        out = StringIO()
+        call_command('privateurl_digest_tokens', dry_run=True, stdout=out)
+        self.assertIn('privateurl.PrivateUrl: 3 rows.', out.getvalue())
+        call_command('privateurl_digest_tokens', batch_size=2, verbosity=0)
+        self.assertEqual(PrivateUrl.objects.filter(token__isnull=False, token_digest__isnull=False).count(), 3)
+        purl_settings.PRIVATEURL_TOKEN_DIGEST_FALLBACK = False
+        with self.assertNumQueries(1):
+            self.assertEqual(PrivateUrl.objects.get_or_none('test', urls[1].token).pk, urls[1].pk)
+        call_command('privateurl_digest_tokens', batch_size=2, clear_tokens=True, verbosity=0)
+        self.assertFalse(PrivateUrl.objects.filter(token__isnull=False).exists())
+        self.assertEqual(PrivateUrl.objects.get_or_none('test', urls[2].token).pk, urls[2].pk)
+
+    def test_export(self):
+        t = PrivateUrl.create('test', data={'k': 'v'})
+        out = StringIO()
+        call_command('privateurl_export', stdout=out)
+        PrivateUrl.objects.all().delete()
+        self.assertEqual(import_rows(read_jsonl(StringIO(out.getvalue())))['created'], 1)
+        self.assertEqual(PrivateUrl.objects.get_or_none(t.action, t.token).get_data(), {'k': 'v'})
+
+
+class TestPrivateUrlHitBuffer(TestCase):
+    def setUp(self):
+        self.hit_buffer_bak = purl_settings.PRIVATEURL_HIT_BUFFER
+        self.flush_interval_bak = purl_settings.PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL
+        purl_settings.PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL = 0
+        purl_hits.reset_hit_buffer()
+        cache.clear()
+
+    def tearDown(self):
+        purl_settings.PRIVATEURL_HIT_BUFFER = self.hit_buffer_bak
+        purl_settings.PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL = self.flush_interval_bak
+        purl_hits.reset_hit_buffer()
+
+    def check_buffer(self, mode):
+        purl_settings.PRIVATEURL_HIT_BUFFER = mode
+        purl_hits.reset_hit_buffer()
+        first_hit = datetime.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        a = PrivateUrl.create('test', hits_limit=0)
+        b = PrivateUrl.create('test', hits_limit=0)
+        PrivateUrl.objects.filter(pk=b.pk).update(first_hit=first_hit, hit_counter=5)
+        c = PrivateUrl.create('test', hits_limit=2)
+        with self.assertNumQueries(0):
+            for i in range(3):
+                self.assertTrue(a.consume())
+            self.assertTrue(b.consume())
+        self.assertEqual(a.hit_counter, 3)
+        self.assertTrue(c.consume())
+        self.assertEqual(PrivateUrl.objects.get(pk=c.pk).hit_counter, 1)
+        self.assertEqual(PrivateUrl.objects.get(pk=a.pk).hit_counter, 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(purl_hits.flush_hits(), 2)
+        a_db, b_db = PrivateUrl.objects.get(pk=a.pk), PrivateUrl.objects.get(pk=b.pk)
+        self.assertEqual((a_db.hit_counter, a_db.first_hit, a_db.last_hit), (3, a.first_hit, a.last_hit))
+        self.assertEqual((b_db.hit_counter, b_db.first_hit, b_db.last_hit), (6, first_hit, b.last_hit))
+        self.assertEqual(purl_hits.flush_hits(), 0)
+        a.consume()
+        call_command('privateurl_flush_hits', verbosity=0)
+        self.assertEqual(PrivateUrl.objects.get(pk=a.pk).hit_counter, 4)
+        a.expire = datetime.datetime(2015, 10, 10, tzinfo=timezone.utc)
+        self.assertFalse(a.consume())
+
+    def test_memory_buffer(self):
+        self.check_buffer('memory')
+
+    def test_memory_buffer_interval(self):
+        purl_settings.PRIVATEURL_HIT_BUFFER = 'memory'
+        purl_settings.PRIVATEURL_HIT_BUFFER_FLUSH_INTERVAL = 0.000001
+        t = PrivateUrl.create('test', hits_limit=0)
+        t.consume()
+        self.assertEqual(PrivateUrl.objects.get(pk=t.pk).hit_counter, 1)
+
+    def test_cache_buffer(self):
+        self.check_buffer('cache')
+
+    def test_cache_buffer_evicted(self):
+        purl_settings.PRIVATEURL_HIT_BUFFER = 'cache'
+        purl_hits.reset_hit_buffer()
+        a = PrivateUrl.create('test', hits_limit=0)
+        b = PrivateUrl.create('test', hits_limit=0)
+        a.consume()
+        b.consume()
+        buffer = purl_hits.get_hit_buffer()
+        decr = buffer.cache.decr
+
+        def evicting_decr(key, delta=1, version=None):
+            buffer.cache.delete(key)
+            return decr(key, delta, version=version)
+
+        buffer.cache.decr = evicting_decr
+        try:
+            self.assertEqual(purl_hits.flush_hits(), 2)
+        finally:
+            del buffer.cache.decr
+        self.assertEqual(PrivateUrl.objects.get(pk=a.pk).hit_counter, 1)
+        self.assertEqual(PrivateUrl.objects.get(pk=b.pk).hit_counter, 1)
+        self.assertEqual(purl_hits.flush_hits(), 0)
+
+
+class TestPrivateUrlRevoke(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='revoke')
+        self.other = get_user_model().objects.create(username='revoke2')
+        self.urls = [PrivateUrl.create(action, user=user) for action in ('test', 'test2')
+                     for user in (self.user, self.other)]
+
+    def test_soft(self):
+        self.assertRaises(ValueError, PrivateUrl.objects.revoke)
+        used = PrivateUrl.create('test3', user=self.user)
+        used.consume()
+        with self.assertNumQueries(1):
+            self.assertEqual(PrivateUrl.objects.revoke(user=self.user), 2)
+        self.assertEqual(sorted(t.action for t in PrivateUrl.objects.filter(user=self.user).unavailable()),
+                         ['test', 'test2', 'test3'])
+        self.assertIsNone(PrivateUrl.objects.get(pk=used.pk).expire)
+        self.assertEqual(PrivateUrl.objects.filter(user=self.other).available().count(), 2)
+        self.assertEqual(PrivateUrl.objects.revoke(actions=['test2'], user=self.other.pk), 1)
+        self.assertEqual(PrivateUrl.objects.revoke(actions=['test2']), 0)
+        self.assertEqual(PrivateUrl.objects.count(), 5)
+
+    def test_hard(self):
+        cache_bak = purl_settings.PRIVATEURL_CACHE
+        purl_settings.PRIVATEURL_CACHE = 'default'
+        purl_cache.get_cache().clear()
+        try:
+            t = self.urls[2]
+            self.assertIsNotNone(PrivateUrl.objects.get_or_none(t.action, t.token))
+            self.assertEqual(PrivateUrl.objects.revoke(actions=['test2'], hard=True, batch_size=1), 2)
+            self.assertIsNone(PrivateUrl.objects.get_or_none(t.action, t.token))
+        finally:
+            purl_settings.PRIVATEURL_CACHE = cache_bak
+        created_before = timezone.now() + datetime.timedelta(seconds=1)
+        self.assertEqual(PrivateUrl.objects.revoke(created_before=created_before - datetime.timedelta(days=1),
+                                                   hard=True), 0)
+        self.assertEqual(PrivateUrl.objects.revoke(created_before=created_before, hard=True), 2)
+        self.assertFalse(PrivateUrl.objects.exists())
+
+
+class TestPrivateUrlVerify(TestCase):
+    def setUp(self):
+        self.urls = [PrivateUrl.create('test', hits_limit=2), PrivateUrl.create('test', hits_limit=0),
+                     PrivateUrl.create('test', expire=timezone.now() - datetime.timedelta(days=1)),
+                     PrivateUrl.create('test', auto_delete=True), PrivateUrl.create('test2')]
+        self.tokens = [t.token for t in self.urls]
+
+    def test_get_many(self):
+        pairs = [(t.action, t.token) for t in self.urls] + [('test', 'unknown'), ('test2', self.tokens[0])]
+        with self.assertNumQueries(3):
+            objs = PrivateUrl.objects.get_many(pairs, chunk_size=3)
+        self.assertEqual(dict((key, obj.pk) for key, obj in objs.items()),
+                         dict(((t.action, t.token), t.pk) for t in self.urls))
+        self.assertEqual(len(PrivateUrl.objects.get_many(pairs, chunk_size=1)), 5)
+        digest_bak = purl_settings.PRIVATEURL_TOKEN_DIGEST
+        try:
+            purl_settings.PRIVATEURL_TOKEN_DIGEST = True
+            t = PrivateUrl.create('test')
+            objs = PrivateUrl.objects.get_many([('test', t.token), ('test', self.tokens[0])])
+        finally:
+            purl_settings.PRIVATEURL_TOKEN_DIGEST = digest_bak
+        self.assertEqual((objs[('test', t.token)].token, objs[('test', self.tokens[0])].pk), (t.token, self.urls[0].pk))
+
+    def test_verify_many(self):
+        tokens = self.tokens[:4] + ['unknown']
+        expected = {self.tokens[0]: None, self.tokens[1]: None, self.tokens[2]: 'expired', self.tokens[3]: None,
+                    'unknown': 'not_found'}
+        with self.assertNumQueries(1):
+            self.assertEqual(PrivateUrl.objects.verify_many('test', tokens), expected)
+        self.assertEqual(PrivateUrl.objects.get(pk=self.urls[0].pk).hit_counter, 0)
+        self.assertEqual(PrivateUrl.objects.verify_many('test', tokens, consume=True), expected)
+        counters = dict(PrivateUrl.objects.values_list('pk', 'hit_counter'))
+        self.assertEqual((counters[self.urls[0].pk], counters[self.urls[1].pk], counters[self.urls[2].pk]), (1, 1, 0))
+        self.assertNotIn(self.urls[3].pk, counters)
+        expected.update({self.tokens[3]: 'not_found'})
+        self.assertEqual(PrivateUrl.objects.verify_many('test', tokens, consume=True), expected)
+        expected.update({self.tokens[0]: 'limit_reached'})
+        self.assertEqual(PrivateUrl.objects.verify_many('test', tokens), expected)
+        actions_bak = purl_settings.PRIVATEURL_ACTIONS
+        try:
+            purl_settings.PRIVATEURL_ACTIONS = ['test']
+            with self.assertNumQueries(0):
+                self.assertEqual(PrivateUrl.objects.verify_many('test3', ['a']), {'a': 'unknown_action'})
+        finally:
+            purl_settings.PRIVATEURL_ACTIONS = actions_bak
+
+    def test_consume_many(self):
+        objs = [PrivateUrl.objects.get(pk=t.pk) for t in self.urls[:3]]
+        stale = PrivateUrl.objects.get(pk=self.urls[0].pk)
+        PrivateUrl.objects.filter(pk=stale.pk).update(hit_counter=2)
+        self.assertEqual(PrivateUrl.consume_many(objs), [objs[1]])
+        self.assertEqual((objs[1].hit_counter, PrivateUrl.objects.get(pk=objs[1].pk).hit_counter), (1, 1))
+        self.assertEqual(PrivateUrl.consume_many(objs[1:2], batch_size=1), [objs[1]])
+        self.assertEqual(PrivateUrl.objects.get(pk=objs[1].pk).hit_counter, 2)
+
+    def test_view(self):
+        url = reverse('privateurl_verify')
+
+        def post(data):
+            return self.client.post(url, json.dumps(data), content_type='application/json')
+
+        response = post({'action': 'test', 'tokens': self.tokens[:3], 'consume': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'action': 'test', 'results': {
+            self.tokens[0]: {'available': True, 'reason': None},
+            self.tokens[1]: {'available': True, 'reason': None},
+            self.tokens[2]: {'available': False, 'reason': 'expired'},
+        }})
+        self.assertEqual(PrivateUrl.objects.get(pk=self.urls[0].pk).hit_counter, 1)
+        self.assertEqual(post({'action': 'test', 'tokens': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        max_tokens_bak = purl_settings.PRIVATEURL_VERIFY_MAX_TOKENS
+        try:
+            purl_settings.PRIVATEURL_VERIFY_MAX_TOKENS = 2
+            self.assertEqual(post({'action': 'test', 'tokens': self.tokens[:3]}).status_code, 400)
+        finally:
+            purl_settings.PRIVATEURL_VERIFY_MAX_TOKENS = max_tokens_bak
+
+
+class TestPrivateUrlPurge(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.available = [
+            PrivateUrl.create('test', hits_limit=0),
+            PrivateUrl.create('test', expire=datetime.timedelta(days=1)),
+        ]
+        self.expired_old = PrivateUrl.create('test', expire=now - datetime.timedelta(days=10))
+        self.expired_new = PrivateUrl.create('test2', expire=now - datetime.timedelta(hours=1))
+        self.exhausted = PrivateUrl.create('test2', hits_limit=1)
+        self.exhausted.hit_counter_inc()
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('privateurl_purge', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purge(self):
+        out = self.purge('--batch-size=1')
+        self.assertIn('Purged 3 private urls.', out)
+        self.assertEqual(out.count('Deleted 1 rows'), 3)
+        self.assertEqual(set(PrivateUrl.objects.values_list('pk', flat=True)), set(t.pk for t in self.available))
+
+    def test_dry_run(self):
+        out = self.purge('--dry-run')
+        self.assertIn('test: 1', out)
+        self.assertIn('test2: 2', out)
+        self.assertIn('Total: 3', out)
+        self.assertEqual(PrivateUrl.objects.count(), 5)
+
+    def test_filters(self):
+        self.purge('--action=test2', '--retention=1')
+        self.assertTrue(PrivateUrl.objects.filter(pk=self.expired_old.pk).exists())
+        self.assertTrue(PrivateUrl.objects.filter(pk=self.expired_new.pk).exists())
+        self.assertTrue(PrivateUrl.objects.filter(pk=self.exhausted.pk).exists())
+        self.purge('--retention=1', '--action-retention=test=5')
+        self.assertEqual(PrivateUrl.objects.count(), 4)
+        self.assertFalse(PrivateUrl.objects.filter(pk=self.expired_old.pk).exists())
+        self.purge('--retention=1', '--action-retention=test2=0')
+        self.assertEqual(PrivateUrl.objects.count(), 2)
+        with self.assertRaises(CommandError):
+            self.purge('--action-retention=test')
+
+
+class TestPrivateUrlExport(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='export')
+        self.dir = tempfile.mkdtemp()
+        now = timezone.now()
+        self.urls = [
+            PrivateUrl.create('test', user=self.user, data={'a': [1, 2]}, hits_limit=0),
+            PrivateUrl.create('test', expire=now - datetime.timedelta(days=1)),
+            PrivateUrl.create('test2', data='x' * 300, auto_delete=True),
+        ]
+        self.urls[0].hit_counter_inc()
+        PrivateUrl.objects.filter(pk=self.urls[1].pk).update(created=now - datetime.timedelta(days=40))
+        self.urls = [PrivateUrl.objects.get(pk=t.pk) for t in self.urls]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('privateurl_export', *args, stdout=out)
+        return out.getvalue()
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('privateurl_import', *args, stdout=out)
+        return out.getvalue()
+
+    def dump(self, qs):
+        fields = ('action', 'token', 'user', 'expire', 'created', 'hits_limit', 'hit_counter', 'first_hit',
+                  'last_hit', 'auto_delete')
+        return sorted((tuple(getattr(t, f) for f in fields), t.get_data()) for t in qs)
+
+    def check_roundtrip(self, filename):
+        path = os.path.join(self.dir, filename)
+        codec_bak = purl_settings.PRIVATEURL_DATA_CODEC
+        try:
+            purl_settings.PRIVATEURL_DATA_CODEC = 'zlib'
+            self.assertIn('Exported 3 private urls.', self.export('--output={}'.format(path), '--chunk-size=2'))
+            before = self.dump(PrivateUrl.objects.all())
+            PrivateUrl.objects.all().delete()
+            out = self.load(path, '--batch-size=2')
+            self.assertIn('Created 3, updated 0, skipped 0', out)
+            self.assertEqual(self.dump(PrivateUrl.objects.all()), before)
+            self.assertIsNotNone(PrivateUrl.objects.get(action='test2').data_compressed)
+        finally:
+            purl_settings.PRIVATEURL_DATA_CODEC = codec_bak
+
+    def test_jsonl(self):
+        self.check_roundtrip('urls.jsonl')
+
+    def test_csv(self):
+        self.check_roundtrip('urls.csv')
+
+    def test_filters(self):
+        rows = [json.loads(line) for line in self.export('--action=test').splitlines()]
+        self.assertEqual([row['token'] for row in rows], [self.urls[0].token, self.urls[1].token])
+        self.assertEqual(rows[0]['user'], 'export')
+        self.assertEqual(rows[0]['data'], {'a': [1, 2]})
+        out = self.export('--available', '--format=csv')
+        self.assertEqual(len(out.splitlines()), 3)
+        self.assertNotIn(self.urls[1].token, out)
+        self.assertEqual(self.export('--unavailable').count('\n'), 1)
+        created_from = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.export('--created-from={}'.format(created_from)).count('\n'), 2)
+        self.assertEqual(self.export('--created-to={}'.format(created_from)).count('\n'), 1)
+
+    def test_conflicts(self):
+        path = os.path.join(self.dir, 'urls.jsonl')
+        self.export('--output={}'.format(path))
+        self.assertIn('Created 0, updated 0, skipped 3', self.load(path))
+        PrivateUrl.objects.filter(pk=self.urls[0].pk).update(hit_counter=10)
+        self.assertIn('updated 3', self.load(path, '--conflict=update'))
+        self.assertEqual(PrivateUrl.objects.get(pk=self.urls[0].pk).hit_counter, 1)
+        with self.assertRaises(CommandError):
+            self.load(path, '--conflict=error')
+        self.user.delete()
+        PrivateUrl.objects.all().delete()
+        self.assertIn('Created 2, updated 0, skipped 0, skipped with unknown users 1', self.load(path))
+
+
+class TestSignedPrivateUrl(TestCase):
+    def setUp(self):
+        self.signed_tokens_bak = purl_settings.PRIVATEURL_SIGNED_TOKENS
+        purl_settings.PRIVATEURL_SIGNED_TOKENS = True
+        cache.clear()
+
+    def tearDown(self):
+        purl_settings.PRIVATEURL_SIGNED_TOKENS = self.signed_tokens_bak
+
+    def test_create_and_load(self):
+        user = get_user_model().objects.create(username='test', email='test@mail.com', password='test')
+        t = PrivateUrl.create_signed('test', user=user, expire=datetime.timedelta(days=30), data={'n': 1})
+        self.assertLessEqual(len(t.token), 64)
+        self.assertEqual(t.get_absolute_url(),
+                         reverse('purl:privateurl', kwargs={'action': 'test', 'token': t.token}))
+        j = SignedPrivateUrl.load('test', t.token)
+        self.assertEqual((j.user_id, j.expire, j.get_data(), j.hits_limit), (user.pk, t.expire, {'n': 1}, 0))
+        self.assertEqual(j.user, user)
+        self.assertTrue(j.is_available())
+        self.assertIsNone(SignedPrivateUrl.load('test2', t.token))
+        self.assertIsNone(SignedPrivateUrl.load('test', t.token.replace('-', '-1', 1)))
+        self.assertIsNone(SignedPrivateUrl.load('test', 'abc'))
+        j = SignedPrivateUrl.load('test', PrivateUrl.create_signed('test').token)
+        self.assertEqual((j.user, j.expire, j.get_data()), (None, None, None))
+
+    def test_verify_many(self):
+        t = PrivateUrl.create_signed('test', expire=datetime.timedelta(days=1), single_use=True)
+        expired = PrivateUrl.create_signed('test', expire=timezone.now() - datetime.timedelta(days=1))
+        stored = PrivateUrl.create('test')
+        tokens = [t.token, expired.token, stored.token, PrivateUrl.create_signed('test2').token]
+        expected = {t.token: None, expired.token: 'expired', stored.token: None, tokens[3]: 'not_found'}
+        # only stored tokens are looked up
+        with self.assertNumQueries(1):
+            self.assertEqual(PrivateUrl.objects.verify_many('test', tokens), expected)
+        self.assertEqual(PrivateUrl.objects.verify_many('test', tokens, consume=True), expected)
+        expected.update({t.token: 'limit_reached', stored.token: 'limit_reached'})
+        self.assertEqual(PrivateUrl.objects.verify_many('test', tokens, consume=True), expected)
+
+    def test_availability(self):
+        t = PrivateUrl.create_signed('test', expire=datetime.timedelta(seconds=-1))
+        self.assertFalse(SignedPrivateUrl.load('test', t.token).is_available())
+        self.assertFalse(SignedPrivateUrl.load('test', t.token).consume())
+        t = PrivateUrl.create_signed('test', expire=datetime.timedelta(days=1), single_use=True)
+        self.assertTrue(SignedPrivateUrl.load('test', t.token).consume())
+        j = SignedPrivateUrl.load('test', t.token)
+        self.assertFalse(j.is_available())
+        self.assertFalse(j.consume())
+
+    def test_naive_datetimes(self):
+        with override_settings(USE_TZ=False):
+            expire = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(hours=2)
+            t = PrivateUrl.create_signed('test', expire=expire, single_use=True)
+            j = SignedPrivateUrl.load('test', t.token)
+            self.assertEqual((t.expire, j.expire), (expire, expire))
+            self.assertTrue(j.is_available())
+            self.assertTrue(j.consume())
+            self.assertEqual(j.unavailable_reason(), 'limit_reached')
+            t = PrivateUrl.create_signed('test', expire=datetime.timedelta(seconds=-1))
+            self.assertEqual(SignedPrivateUrl.load('test', t.token).unavailable_reason(), 'expired')
+        j = SignedPrivateUrl.load('test', PrivateUrl.create_signed('test', expire=expire).token)
+        self.assertEqual(j.expire, timezone.make_aware(expire))
+
+    def test_errors(self):
+        with self.assertRaises(AttributeError):
+            PrivateUrl.create_signed('test', single_use=True)
+        with self.assertRaises(AttributeError):
+            PrivateUrl.create_signed('test', data={'k': 'v' * 40})
+        purl_settings.PRIVATEURL_SIGNED_TOKENS = False
+        with self.assertRaises(ImproperlyConfigured):
+            PrivateUrl.create_signed('test')
+
+
+@skipUnless(hasattr(QuerySet, 'explain'), 'QuerySet.explain requires Django 2.1+')
+class TestPrivateUrlIndexes(TestCase):
+    def get_plan(self, qs):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked only on SQLite and PostgreSQL.')
+        return qs.explain()
+
+    def assertUsesIndex(self, qs, index_name):
+        plan = self.get_plan(qs)
+        if connection.vendor == 'sqlite':
+            pattern = r'SEARCH (TABLE )?privateurl_privateurl USING (COVERING )?INDEX {}'.format(index_name)
+        else:
+            pattern = r'Index (Only )?Scan using {}'.format(index_name)
+        self.assertIsNotNone(re.search(pattern, plan), plan)
+
+    def test_lookup(self):
+        user = get_user_model().objects.create(username='test', email='test@mail.com', password='test')
+        t = PrivateUrl.create('test', user=user)
+        qs = PrivateUrl.objects.select_related('user').filter(action=t.action, token=t.token)
+        # partial unique index (Django 3.0+) leaves out rows that store only digests of tokens
+        self.assertUsesIndex(qs, r'privateurl_privateurl_(token|action_token_\w+)_uniq')
+        qs = PrivateUrl.objects.filter(action=t.action, token_digest=make_digest(t.token))
+        self.assertUsesIndex(qs, r'privateurl_privateurl_action_token_digest_\w+_uniq')
+        qs = PrivateUrl.objects.filter(action=t.action, user=user)
+        self.assertUsesIndex(qs, r'privateurl_privateurl_action_user_id_\w+_idx')
+
+    def test_expire(self):
+        if not purl_models.PARTIAL_INDEXES:
+            self.skipTest('Partial indexes are not supported.')
+        qs = PrivateUrl.objects.filter(expire__lte=timezone.now()).order_by()
+        self.assertUsesIndex(qs, 'privateurl_expire_notnull')
+
+
+class TestPrivateUrlConcurrency(TransactionTestCase):
+    def hammer(self, obj, threads=8):
+        results = []
+        # threading.Barrier isn't available on Python 2
+        ready, start = threading.Semaphore(0), threading.Event()
+
+        def worker():
+            try:
+                try:
+                    stale = PrivateUrl.objects.get(pk=obj.pk)
+                finally:
+                    ready.release()
+                start.wait()
+                results.append(stale.consume())
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for w in workers:
+            w.start()
+        for _ in range(threads):
+            ready.acquire()
+        start.set()
+        for w in workers:
+            w.join()
+        return results
+
+    def test_consume_concurrently(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory database does not allow multiple connections.')
+        t = PrivateUrl.create('test', hits_limit=3)
+        results = self.hammer(t)
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(PrivateUrl.objects.get(pk=t.pk).hit_counter, 3)
+        t = PrivateUrl.create('test', hits_limit=0)
+        results = self.hammer(t)
+        self.assertTrue(all(results))
+        self.assertEqual(PrivateUrl.objects.get(pk=t.pk).hit_counter, len(results))
+
+
+class TestPrivateUrlRegistry(TestCase):
+    def tearDown(self):
+        for name in ('reg', 'reg2'):
+            privateurl.unregister_action(name)
+
+    def test_defaults(self):
+        with self.assertRaises(ValueError):
+            privateurl.register_action('reg', defaults={'hits': 1})
+        privateurl.register_action('reg', defaults={'hits_limit': 3, 'expire': datetime.timedelta(days=1),
+                                                    'token_size': 12, 'auto_delete': True})
+        t = PrivateUrl.create('reg')
+        self.assertEqual((t.hits_limit, len(t.token), t.auto_delete), (3, 12, True))
+        self.assertTrue(timezone.now() < t.expire < timezone.now() + datetime.timedelta(days=1))
+        t = PrivateUrl.create('reg', hits_limit=0, auto_delete=False, token_size=8)
+        self.assertEqual((t.hits_limit, len(t.token), t.auto_delete), (0, 8, False))
+        objs = PrivateUrl.bulk_create_urls('reg', [{}, {'hits_limit': 5}])
+        self.assertEqual([(o.hits_limit, len(o.token)) for o in objs], [(3, 12), (5, 12)])
+        t = PrivateUrl.create('reg2')
+        self.assertEqual((t.hits_limit, t.expire, t.auto_delete), (1, None, False))
+
+    def test_view(self):
+        calls = []
+
+        def on_ok(request, obj, action):
+            calls.append(('ok', action))
+            return {'response': HttpResponse('handler ok')}
+
+        def on_fail(request, obj, action, reason):
+            calls.append(('fail', reason))
+
+        def ok(action, **kwargs):
+            calls.append(('signal', action))
+            return {'response': HttpResponse('signal ok')}
+
+        privateurl_ok.connect(ok, dispatch_uid='registry_ok')
+        try:
+            privateurl.register_action('reg', on_ok=on_ok, on_fail=on_fail)
+            privateurl.register_action('reg2', on_ok=on_ok, send_signals=False)
+            t = PrivateUrl.create('reg')
+            response = self.client.get(t.get_absolute_url())
+            self.assertEqual(force_str(response.content), 'handler ok')
+            self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 404)
+            t = PrivateUrl.create('reg2')
+            self.client.get(t.get_absolute_url())
+            self.assertEqual(calls, [('ok', 'reg'), ('signal', 'reg'), ('fail', 'limit_reached'), ('ok', 'reg2')])
+        finally:
+            privateurl_ok.disconnect(dispatch_uid='registry_ok')
+
+    def test_precheck(self):
+        actions_bak = purl_settings.PRIVATEURL_ACTIONS
+        try:
+            purl_settings.PRIVATEURL_ACTIONS = {'test'}
+            self.assertEqual(PrivateUrl.precheck('reg', 'a' * 32), 'unknown_action')
+            privateurl.register_action('reg')
+            self.assertIsNone(PrivateUrl.precheck('reg', 'a' * 32))
+        finally:
+            purl_settings.PRIVATEURL_ACTIONS = actions_bak
+
+    def test_precheck_token_size(self):
+        validate_bak = purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT
+        try:
+            purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT = True
+            privateurl.register_action('reg', defaults={'token_size': 40, 'dashed_piece_size': 0})
+            t = PrivateUrl.create('reg')
+            self.assertEqual(len(t.token), 40)
+            self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 302)
+            self.assertEqual(PrivateUrl.precheck('reg', 'a' * 32), 'invalid_token')
+            self.assertEqual(PrivateUrl.precheck('reg', 'a' * 20 + '-' + 'a' * 19), 'invalid_token')
+            t = PrivateUrl.create('reg2', token_size=50, dashed_piece_size=0)
+            self.assertEqual(self.client.get(t.get_absolute_url()).status_code, 302)
+            self.assertEqual(PrivateUrl.precheck('reg2', 'a_b' * 4), 'invalid_token')
+            self.assertEqual(PrivateUrl.precheck('reg2', 'a' * 65), 'invalid_token')
+        finally:
+            purl_settings.PRIVATEURL_VALIDATE_TOKEN_FORMAT = validate_bak
+
+
+class TestPrivateUrlThrottling(TestCase):
+    def setUp(self):
+        self.cache_bak = purl_settings.PRIVATEURL_THROTTLE_CACHE
+        self.rates_bak = purl_settings.PRIVATEURL_THROTTLE_RATES
+        purl_settings.PRIVATEURL_THROTTLE_CACHE = 'default'
+        purl_settings.PRIVATEURL_THROTTLE_RATES = {'*': (3, 60), 'open': None, 'strict': (1, 60)}
+        cache.clear()
+
+    def tearDown(self):
+        purl_settings.PRIVATEURL_THROTTLE_CACHE = self.cache_bak
+        purl_settings.PRIVATEURL_THROTTLE_RATES = self.rates_bak
+
+    def get(self, action, ip='1.1.1.1'):
+        url = reverse('purl:privateurl', kwargs={'action': action, 'token': 'unknown-token'})
+        return self.client.get(url, REMOTE_ADDR=ip).status_code
+
+    def test_view(self):
+        reasons = []
+
+        def fail(reason, **kwargs):
+            reasons.append(reason)
+
+        privateurl_fail.connect(fail, dispatch_uid='throttling')
+        try:
+            self.assertEqual([self.get('test') for i in range(3)], [404] * 3)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get('test'), 429)
+            self.assertEqual(self.get('test', ip='2.2.2.2'), 404)
+            self.assertEqual(self.get('test2'), 404)
+            self.assertEqual([self.get('strict') for i in range(2)], [404, 429])
+            self.assertEqual([self.get('open') for i in range(5)], [404] * 5)
+        finally:
+            privateurl_fail.disconnect(dispatch_uid='throttling')
+        self.assertEqual(reasons.count('throttled'), 2)
+
+    def test_sliding_window(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='3.3.3.3, 10.0.0.1')
+        header_bak = purl_settings.PRIVATEURL_THROTTLE_IP_HEADER
+        try:
+            purl_settings.PRIVATEURL_THROTTLE_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+            self.assertEqual(get_client_ip(request), '10.0.0.1')
+            results = [is_throttled(request, 'test', now=600 + i) for i in range(4)]
+            self.assertEqual(results, [False, False, False, True])
+            # requests of previous window are weighted by their share of sliding window
+            self.assertTrue(is_throttled(request, 'test', now=661))
+            self.assertFalse(is_throttled(request, 'test', now=719))
+        finally:
+            purl_settings.PRIVATEURL_THROTTLE_IP_HEADER = header_bak
+
+    def test_client_ip(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 3.3.3.3, 10.0.0.1', REMOTE_ADDR='10.0.0.2')
+        header_bak = purl_settings.PRIVATEURL_THROTTLE_IP_HEADER
+        proxies_bak = purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES
+        try:
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+            purl_settings.PRIVATEURL_THROTTLE_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+            # the leftmost address is set by client
+            purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES = 2
+            self.assertEqual(get_client_ip(request), '3.3.3.3')
+            purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES = 5
+            self.assertEqual(get_client_ip(request), '6.6.6.6')
+            purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES = 0
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+        finally:
+            purl_settings.PRIVATEURL_THROTTLE_IP_HEADER = header_bak
+            purl_settings.PRIVATEURL_THROTTLE_TRUSTED_PROXIES = proxies_bak
+
+
+class TestPrivateUrlSharding(TestCase):
+    multi_db = True  # Django < 2.2
+    databases = {'default', 'shard'}
+
+    def setUp(self):
+        self.shards_bak = purl_settings.PRIVATEURL_SHARDS
+        purl_settings.PRIVATEURL_SHARDS = {'tracking': 'tests.TrackingUrl'}
+        self.user = get_user_model().objects.create(username='shard')
+
+    def tearDown(self):
+        purl_settings.PRIVATEURL_SHARDS = self.shards_bak
+
+    def test_routing(self):
+        self.assertIs(PrivateUrl.get_shard('tracking'), TrackingUrl)
+        self.assertIs(PrivateUrl.get_shard('test'), PrivateUrl)
+        self.assertIs(TrackingUrl.get_shard('test'), TrackingUrl)
+        self.assertEqual(purl_sharding.get_models(), [PrivateUrl, TrackingUrl])
+        t = PrivateUrl.create('tracking', user=self.user, hits_limit=2)
+        self.assertIsInstance(t, TrackingUrl)
+        self.assertEqual(t._state.db, 'shard')
+        self.assertFalse(PrivateUrl.objects.filter(token=t.token).exists())
+        with self.assertNumQueries(1, using='shard'):
+            obj = PrivateUrl.objects.get_or_none('tracking', t.token)
+        self.assertEqual(obj.pk, t.pk)
+        self.assertEqual(obj.user, self.user)
+        self.assertIsNone(PrivateUrl.objects.get_or_none('test', t.token))
+        objs = PrivateUrl.bulk_create_urls('tracking', [{'user': self.user}, {}])
+        self.assertEqual([type(o) for o in objs], [TrackingUrl, TrackingUrl])
+        self.assertEqual(TrackingUrl.objects.count(), 3)
+        t = PrivateUrl.create('tracking', user=self.user, replace=True)
+        self.assertEqual(TrackingUrl.objects.filter(user=self.user).count(), 1)
+
+    def test_view(self):
+        t = PrivateUrl.create('tracking', auto_delete=True)
+        response = self.client.get(t.get_absolute_url())
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(TrackingUrl.objects.filter(pk=t.pk).exists())
+        t = PrivateUrl.create('tracking', expire=timezone.now() - datetime.timedelta(days=30))
+        call_command('privateurl_purge', stdout=StringIO())
+        self.assertFalse(TrackingUrl.objects.filter(pk=t.pk).exists())
+
+    def test_hit_buffer(self):
+        t = PrivateUrl.create('tracking', hits_limit=0)
+        p = PrivateUrl.create('test', hits_limit=0)
+        buffer = purl_hits.MemoryHitBuffer(flush_interval=0)
+        now = timezone.now()
+        for obj in (t, t, p):
+            buffer.add(obj.pk, now, model=type(obj))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(TrackingUrl.objects.get(pk=t.pk).hit_counter, 2)
+        self.assertEqual(PrivateUrl.objects.get(pk=p.pk).hit_counter, 1)
+
+    def test_expire_index(self):
+        with connections['shard'].cursor() as cursor:
+            constraints = connections['shard'].introspection.get_constraints(cursor, TrackingUrl._meta.db_table)
+        self.assertIn(['expire'], [c['columns'] for c in constraints.values() if c['index'] and not c['unique']])
+
+    def test_partitions(self):
+        partitions = purl_sharding.month_partitions('t', datetime.date(2020, 11, 15), 3)
+        self.assertEqual(partitions, [
+            ('t_202011', datetime.date(2020, 11, 1), datetime.date(2020, 12, 1)),
+            ('t_202012', datetime.date(2020, 12, 1), datetime.date(2021, 1, 1)),
+            ('t_202101', datetime.date(2021, 1, 1), datetime.date(2021, 2, 1)),
+        ])
+        with self.assertRaises(CommandError):
+            call_command('privateurl_partitions', 'tests.TrackingUrl', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('privateurl_partitions', 'auth.User', stdout=StringIO())
+
+    def test_partitioned_lookup(self):
+        t = PrivateUrl.create('tracking')
+        TrackingUrl.partition_by_month = True
+        try:
+            # tokens of partitioned tables aren't unique, the newest object is taken
+            with CaptureQueriesContext(connections['shard']) as queries:
+                self.assertEqual(PrivateUrl.objects.get_or_none('tracking', t.token).pk, t.pk)
+            self.assertIn('ORDER BY', queries[0]['sql'])
+            self.assertIsNone(PrivateUrl.objects.get_or_none('tracking', 'unknown'))
+            self.assertEqual(PrivateUrl.objects.get_many([('tracking', t.token)])[('tracking', t.token)].pk, t.pk)
+        finally:
+            TrackingUrl.partition_by_month = False
+
+
+@skipUnless(os.environ.get('PRIVATEURL_TEST_POSTGRESQL'), 'Set PRIVATEURL_TEST_POSTGRESQL for tests of partitions.')
+class TestPrivateUrlPartitionByMonth(TestCase):
+    multi_db = True  # Django < 2.2
+    databases = {'default', 'shard'}
+
+    def setUp(self):
+        self.shards_bak = purl_settings.PRIVATEURL_SHARDS
+        purl_settings.PRIVATEURL_SHARDS = {'tracking': 'tests.TrackingUrl'}
+        self.connection = connections['shard']
+        # DDL of PostgreSQL is transactional, partitioned table is rolled back after test
+        state = ProjectState.from_apps(TrackingUrl._meta.apps)
+        with self.connection.schema_editor() as editor:
+            purl_sharding.PartitionByMonth('TrackingUrl').database_forwards('tests', editor, state, state)
+        TrackingUrl.partition_by_month = True
+
+    def tearDown(self):
+        TrackingUrl.partition_by_month = False
+        purl_settings.PRIVATEURL_SHARDS = self.shards_bak
+
+    def test_partitions(self):
+        today = timezone.now().date()
+        next_month = purl_sharding.add_months(today, 1)
+        name = '{}_{:%Y%m}'.format(TrackingUrl._meta.db_table, next_month)
+        self.assertEqual(purl_sharding.create_partitions(TrackingUrl, self.connection, next_month, 1), [name])
+        self.assertEqual(purl_sharding.get_partitions(TrackingUrl, self.connection), {name: next_month})
+        self.assertEqual(purl_sharding.create_partitions(TrackingUrl, self.connection, next_month, 1), [])
+
+        # older url goes to default partition, newer one to partition of next month
+        old = TrackingUrl.objects.create(action='tracking', token='duplicate')
+        new = TrackingUrl.objects.create(action='tracking', token='duplicate')
+        TrackingUrl.objects.filter(pk=new.pk).update(created=timezone.now() + datetime.timedelta(days=31))
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM {}'.format(self.connection.ops.quote_name(name)))
+            self.assertEqual([row[0] for row in cursor.fetchall()], [new.pk])
+        self.assertEqual(PrivateUrl.objects.get_or_none('tracking', 'duplicate').pk, new.pk)
+        self.assertEqual(PrivateUrl.objects.get_many([('tracking', 'duplicate')])[('tracking', 'duplicate')].pk,
+                         new.pk)
+        self.assertEqual(purl_sharding.drop_partitions(TrackingUrl, self.connection, next_month), [])
+        self.assertEqual(TrackingUrl.objects.filter(pk=old.pk).count(), 1)
+
+
+def metrics_receiver(action, **kwargs):
+    if action == 'metrics':
+        return {'response': HttpResponse('ok')}
+
+
+class CounterMetrics(purl_metrics.BaseMetrics):
+    counters = []
+
+    def incr(self, name, action, value=1, **tags):
+        self.counters.append((name, action))
+
+
+class TestPrivateUrlMetrics(TestCase):
+    def setUp(self):
+        self.backend_bak = purl_settings.PRIVATEURL_METRICS_BACKEND
+        purl_settings.PRIVATEURL_METRICS_BACKEND = 'privateurl.metrics.InMemoryMetrics'
+        purl_metrics.reset_metrics()
+        privateurl_ok.connect(metrics_receiver, dispatch_uid='metrics_ok')
+
+    def tearDown(self):
+        privateurl_ok.disconnect(dispatch_uid='metrics_ok')
+        purl_settings.PRIVATEURL_METRICS_BACKEND = self.backend_bak
+        purl_metrics.reset_metrics()
+
+    def get(self, action, token):
+        return self.client.get(reverse('purl:privateurl', kwargs={'action': action, 'token': token}))
+
+    def test_view(self):
+        t = PrivateUrl.create('metrics')
+        self.assertEqual(force_str(self.get(t.action, t.token).content), 'ok')
+        self.get(t.action, t.token)
+        self.get(t.action, 'unknown')
+        j = PrivateUrl.create('metrics', expire=datetime.timedelta(seconds=-1))
+        self.get(j.action, j.token)
+        snapshot = purl_metrics.get_metrics().snapshot()
+        self.assertEqual(snapshot['counters'], {
+            ('ok', 'metrics'): 1,
+            ('fail', 'metrics', ('reason', 'limit_reached')): 1,
+            ('fail', 'metrics', ('reason', 'not_found')): 1,
+            ('fail', 'metrics', ('reason', 'expired')): 1,
+        })
+        timings = snapshot['timings']
+        self.assertEqual(timings[('lookup', 'metrics')][0], 4)
+        self.assertEqual(timings[('counter', 'metrics')][0], 1)
+        self.assertEqual(timings[('ok', 'metrics')][0], 1)
+        receiver_key = ('receiver', 'metrics', ('receiver', 'tests.tests.metrics_receiver'), ('signal', 'ok'))
+        self.assertEqual(timings[receiver_key][0], 1)
+        purl_metrics.get_metrics().reset()
+        self.assertEqual(purl_metrics.get_metrics().snapshot(), {'counters': {}, 'timings': {}})
+
+    def test_cache(self):
+        cache_bak = purl_settings.PRIVATEURL_CACHE
+        try:
+            purl_settings.PRIVATEURL_CACHE = 'default'
+            cache.clear()
+            t = PrivateUrl.create('metrics', hits_limit=0)
+            for i in range(2):
+                PrivateUrl.objects.get_or_none(t.action, t.token)
+                PrivateUrl.objects.get_or_none(t.action, 'unknown')
+        finally:
+            purl_settings.PRIVATEURL_CACHE = cache_bak
+        counters = purl_metrics.get_metrics().snapshot()['counters']
+        self.assertEqual(counters[('cache', 'metrics', ('result', 'hit'))], 1)
+        self.assertEqual(counters[('cache', 'metrics', ('result', 'miss'))], 2)
+        self.assertEqual(counters[('cache', 'metrics', ('result', 'not_found'))], 1)
+
+    def test_partial_backend(self):
+        purl_settings.PRIVATEURL_METRICS_BACKEND = 'tests.tests.CounterMetrics'
+        purl_metrics.reset_metrics()
+        t = PrivateUrl.create('metrics')
+        self.assertEqual(force_str(self.get(t.action, t.token).content), 'ok')
+        self.assertEqual(CounterMetrics.counters, [('ok', 'metrics')])
+
+    def test_logging(self):
+        purl_settings.PRIVATEURL_METRICS_BACKEND = 'privateurl.metrics.LoggingMetrics'
+        purl_metrics.reset_metrics()
+        with self.assertLogs('privateurl.metrics', 'DEBUG') as logs:
+            self.get('metrics', 'unknown')
+        self.assertIn('privateurl.fail +1 action=metrics reason=not_found', '\n'.join(logs.output))
+
+    def test_disabled(self):
+        purl_settings.PRIVATEURL_METRICS_BACKEND = None
+        purl_metrics.reset_metrics()
+        self.assertFalse(purl_metrics.get_metrics().enabled)
+        t = PrivateUrl.create('metrics')
+        self.assertEqual(force_str(self.get(t.action, t.token).content), 'ok')
+
+
+class TestPrivateUrlStats(TestCase):
+    def setUp(self):
+        self.stats_bak = purl_settings.PRIVATEURL_STATS
+        self.flush_interval_bak = purl_settings.PRIVATEURL_STATS_FLUSH_INTERVAL
+        purl_settings.PRIVATEURL_STATS = True
+        purl_settings.PRIVATEURL_STATS_FLUSH_INTERVAL = 0
+        purl_stats.reset_stats_buffer()
+
+    def tearDown(self):
+        purl_stats.flush_stats()
+        purl_settings.PRIVATEURL_STATS = self.stats_bak
+        purl_settings.PRIVATEURL_STATS_FLUSH_INTERVAL = self.flush_interval_bak
+        purl_stats.reset_stats_buffer()
+
+    def test_record(self):
+        t = PrivateUrl.create('stats', hits_limit=1)
+        PrivateUrl.bulk_create_urls('stats', [{}, {}])
+        expired = PrivateUrl.create('stats', expire=timezone.now() - datetime.timedelta(days=1))
+        with self.assertNumQueries(2):
+            self.client.get(t.get_absolute_url())
+        self.client.get(t.get_absolute_url())
+        self.client.get(expired.get_absolute_url())
+        self.assertFalse(PrivateUrlStats.objects.exists())
+        # UPDATE of missing row and INSERT in savepoint
+        with self.assertNumQueries(4):
+            self.assertEqual(purl_stats.flush_stats(), 1)
+        today = purl_stats.local_date()
+        totals = {'created': 4, 'redeemed': 1, 'failed': 1, 'expired': 1}
+        self.assertEqual(PrivateUrlStats.objects.period(today, today).totals(), totals)
+        self.assertEqual(PrivateUrlStats.objects.by_action(), {'stats': totals})
+        self.client.get(t.get_absolute_url())
+        with self.assertNumQueries(1):
+            purl_stats.flush_stats()
+        self.assertEqual(PrivateUrlStats.objects.get(action='stats', date=today).failed, 2)
+        self.assertEqual(PrivateUrlStats.objects.period(date_to=today - datetime.timedelta(days=1)).totals(),
+                         {'created': 0, 'redeemed': 0, 'failed': 0, 'expired': 0})
+
+    def test_interval(self):
+        purl_settings.PRIVATEURL_STATS_FLUSH_INTERVAL = 0.000001
+        PrivateUrl.create('stats')
+        self.assertEqual(PrivateUrlStats.objects.get(action='stats').created, 1)
+        purl_settings.PRIVATEURL_STATS = False
+        purl_stats.reset_stats_buffer()
+        PrivateUrl.create('stats')
+        self.assertEqual(PrivateUrlStats.objects.get(action='stats').created, 1)
+
+    def test_backfill(self):
+        day = datetime.datetime(2020, 1, 10, 12, tzinfo=timezone.utc)
+        PrivateUrl.bulk_create_urls('stats', [{'hits_limit': 0}] * 3)
+        PrivateUrl.create('stats2')
+        purl_stats.flush_stats()
+        pks = list(PrivateUrl.objects.filter(action='stats').order_by('pk').values_list('pk', flat=True))
+        PrivateUrl.objects.filter(pk=pks[0]).update(created=day, last_hit=day, hit_counter=5)
+        PrivateUrl.objects.filter(pk=pks[1]).update(created=day)
+        PrivateUrlStats.objects.filter(action='stats').update(failed=3)
+        out = StringIO()
+        call_command('privateurl_stats_backfill', action=['stats'], chunk_size=1, dry_run=True, stdout=out)
+        self.assertIn('stats 2020-01-10: created 2, redeemed 5', out.getvalue())
+        self.assertFalse(PrivateUrlStats.objects.filter(date=day.date()).exists())
+        counts = purl_stats.collect_rollups(PrivateUrl.objects.all(), chunk_size=2)
+        trunc_date, purl_stats.TruncDate = purl_stats.TruncDate, None
+        try:
+            # Django < 1.10 truncates dates in Python
+            self.assertEqual(purl_stats.collect_rollups(PrivateUrl.objects.all(), chunk_size=2), counts)
+        finally:
+            purl_stats.TruncDate = trunc_date
+        call_command('privateurl_stats_backfill', chunk_size=2, verbosity=0)
+        today = purl_stats.local_date()
+        stats = dict(((obj.action, obj.date), (obj.created, obj.redeemed, obj.failed))
+                     for obj in PrivateUrlStats.objects.all())
+        # rollups recorded by hits are kept
+        self.assertEqual(stats, {('stats', day.date()): (2, 5, 0), ('stats', today): (3, 0, 3),
+                                 ('stats2', today): (1, 0, 0)})
+        call_command('privateurl_stats_backfill', verbosity=0)
+        self.assertEqual(PrivateUrlStats.objects.get(action='stats', date=day.date()).created, 2)
+
+    def test_backfill_after_hits(self):
+        t = PrivateUrl.create('stats', hits_limit=0)
+        self.client.get(t.get_absolute_url())
+        self.client.get(t.get_absolute_url())
+        self.client.get(PrivateUrl.create('stats', expire=timezone.now()).get_absolute_url())
+        # deleted url is counted by hits only
+        self.client.get(PrivateUrl.create('stats', auto_delete=True).get_absolute_url())
+        call_command('privateurl_stats_backfill', verbosity=0)
+        self.assertEqual(PrivateUrlStats.objects.by_action(),
+                         {'stats': {'created': 3, 'redeemed': 3, 'failed': 0, 'expired': 1}})
+
+    def test_admin(self):
+        PrivateUrl.create('stats')
+        purl_stats.flush_stats()
+        get_user_model().objects.create_superuser('admin', 'admin@site.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(resolve_url('admin:privateurl_privateurlstats_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        obj = PrivateUrlStats.objects.get()
+        url = resolve_url('admin:privateurl_privateurlstats_change', obj.pk)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'action': 'changed', 'date': '2020-01-01', 'created': 100})
+        self.assertEqual(PrivateUrlStats.objects.get().created, 1)
+        # Django < 2.1 needs change permission for changelist, saving is refused by admin
+        model_admin = purl_admin.PrivateUrlStatsAdmin(PrivateUrlStats, purl_admin.admin.site)
+        request = RequestFactory().get(url)
+        request.user = response.wsgi_request.user
+        self.assertIn('created', model_admin.get_readonly_fields(request, obj))
+        self.assertEqual(list(model_admin.get_actions(request)), ['delete_selected'])
+        with self.assertRaises(PermissionDenied):
+            model_admin.save_model(request, obj, None, True)
+
+
+class HitLogSettingsMixin(object):
+    hit_log = 'on_commit'
+
+    def setUp(self):
+        self.hit_log_bak = purl_settings.PRIVATEURL_HIT_LOG
+        self.max_size_bak = purl_settings.PRIVATEURL_HIT_LOG_MAX_SIZE
+        self.batch_size_bak = purl_settings.PRIVATEURL_HIT_LOG_BATCH_SIZE
+        self.flush_interval_bak = purl_settings.PRIVATEURL_HIT_LOG_FLUSH_INTERVAL
+        purl_settings.PRIVATEURL_HIT_LOG = self.hit_log
+        purl_settings.PRIVATEURL_HIT_LOG_FLUSH_INTERVAL = 60
+        purl_hitlog.reset_writer()
+
+    def tearDown(self):
+        purl_hitlog.reset_writer()
+        purl_settings.PRIVATEURL_HIT_LOG = self.hit_log_bak
+        purl_settings.PRIVATEURL_HIT_LOG_MAX_SIZE = self.max_size_bak
+        purl_settings.PRIVATEURL_HIT_LOG_BATCH_SIZE = self.batch_size_bak
+        purl_settings.PRIVATEURL_HIT_LOG_FLUSH_INTERVAL = self.flush_interval_bak
+
+
+class TestPrivateUrlHitLog(HitLogSettingsMixin, TestCase):
+    def test_log_hit(self):
+        t = PrivateUrl.create('hitlog', hits_limit=1)
+        with self.assertNumQueries(2):
+            self.client.get(t.get_absolute_url(), HTTP_USER_AGENT='test agent', REMOTE_ADDR='10.0.0.1')
+        self.client.get(t.get_absolute_url())
+        self.client.get(reverse('purl:privateurl', kwargs={'action': 'hitlog', 'token': 'missing'}))
+        self.assertFalse(PrivateUrlHit.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(purl_hitlog.flush_hit_log(), 3)
+        hits = list(PrivateUrlHit.objects.order_by('pk').values_list(
+            'action', 'url_id', 'outcome', 'ip', 'user_agent'))
+        self.assertEqual(hits, [('hitlog', t.pk, 'ok', '10.0.0.1', 'test agent'),
+                                ('hitlog', t.pk, 'limit_reached', '127.0.0.1', ''),
+                                ('hitlog', None, 'not_found', '127.0.0.1', '')])
+
+    def test_due(self):
+        purl_settings.PRIVATEURL_HIT_LOG_BATCH_SIZE = 2
+        purl_hitlog.reset_writer()
+        t = PrivateUrl.create('hitlog', hits_limit=0)
+        request = RequestFactory().get('/')
+        self.assertFalse(purl_hitlog.add(request, 'hitlog', t, None, timezone.now()))
+        self.assertTrue(purl_hitlog.add(request, 'hitlog', t, None, timezone.now()))
+        purl_hitlog.flush_hit_log()
+        self.assertFalse(purl_hitlog.add(request, 'hitlog', t, None, timezone.now()))
+        purl_hitlog.get_writer().flushed_at -= 60
+        self.assertTrue(purl_hitlog.add(request, 'hitlog', t, None, timezone.now()))
+
+    def test_drop(self):
+        purl_settings.PRIVATEURL_HIT_LOG_MAX_SIZE = 2
+        purl_hitlog.reset_writer()
+        t = PrivateUrl.create('hitlog', hits_limit=0)
+        for _ in range(3):
+            self.client.get(t.get_absolute_url())
+        writer = purl_hitlog.get_writer()
+        self.assertEqual(writer.dropped, 1)
+        purl_hitlog.reset_writer()
+        self.assertEqual(PrivateUrlHit.objects.count(), 2)
+
+    def test_disabled(self):
+        purl_settings.PRIVATEURL_HIT_LOG = None
+        purl_hitlog.reset_writer()
+        t = PrivateUrl.create('hitlog')
+        self.client.get(t.get_absolute_url())
+        self.assertIsNone(purl_hitlog.get_writer())
+        self.assertEqual(purl_hitlog.flush_hit_log(), 0)
+        self.assertFalse(PrivateUrlHit.objects.exists())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            purl_hitlog.HitLogWriter('unknown', 10, 10, 1)
+        with self.assertRaises(ValueError):
+            purl_hitlog.HitLogWriter('thread', 10, 10, 1, policy='unknown')
+
+    def test_admin(self):
+        t = PrivateUrl.create('hitlog')
+        self.client.get(t.get_absolute_url())
+        purl_hitlog.flush_hit_log()
+        get_user_model().objects.create_superuser('admin', 'admin@site.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(resolve_url('admin:privateurl_privateurlhit_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        url = resolve_url('admin:privateurl_privateurlhit_change', PrivateUrlHit.objects.get().pk)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIsInstance(purl_admin.admin.site._registry[PrivateUrlHit], purl_admin.ReadOnlyAdmin)
+
+
+class TestPrivateUrlHitLogThread(HitLogSettingsMixin, TransactionTestCase):
+    hit_log = 'thread'
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory database does not allow multiple connections.')
+        super(TestPrivateUrlHitLogThread, self).setUp()
+
+    def wait_hits(self, n, timeout=5):
+        deadline = time.time() + timeout
+        while PrivateUrlHit.objects.count() < n and time.time() < deadline:
+            time.sleep(0.01)
+        return PrivateUrlHit.objects.count()
+
+    def test_batch(self):
+        purl_settings.PRIVATEURL_HIT_LOG_BATCH_SIZE = 2
+        purl_hitlog.reset_writer()
+        t = PrivateUrl.create('hitlog', hits_limit=0)
+        self.client.get(t.get_absolute_url())
+        self.client.get(t.get_absolute_url())
+        self.assertEqual(self.wait_hits(2), 2)
+        self.assertTrue(purl_hitlog.get_writer().thread.is_alive())
+
+    def test_stop(self):
+        t = PrivateUrl.create('hitlog', hits_limit=0)
+        self.client.get(t.get_absolute_url())
+        writer = purl_hitlog.get_writer()
+        purl_hitlog.reset_writer()
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual(PrivateUrlHit.objects.count(), 1)
+
+    def test_block(self):
+        writer = purl_hitlog.HitLogWriter('thread', max_size=1, batch_size=1, flush_interval=60, policy='block',
+                                          block_timeout=5)
+        request = RequestFactory().get('/')
+        for _ in range(5):
+            writer.add(purl_hitlog.make_record(request, 'hitlog', None, 'not_found', timezone.now()))
+        writer.stop()
+        self.assertEqual(writer.dropped, 0)
+        self.assertEqual(PrivateUrlHit.objects.count(), 5)
+
+
 class TestPrivateUrlAdmin(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -186,3 +1740,51 @@ class TestPrivateUrlAdmin(TestCase):
     def test_admin_list(self):
         response = self.client.get(resolve_url('admin:privateurl_privateurl_changelist'))
         self.assertEqual(response.status_code, 200)
+
+    def test_filters(self):
+        PrivateUrl.create('test2', expire=timezone.now() - datetime.timedelta(days=1))
+        cache.clear()
+        url = resolve_url('admin:privateurl_privateurl_changelist')
+        response = self.client.get(url, {'available': '0'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(url, {'available': '1', 'action__exact': 'test'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(purl_admin.get_actions(PrivateUrl), ['test', 'test2'])
+        actions_bak = purl_settings.PRIVATEURL_ACTIONS
+        try:
+            purl_settings.PRIVATEURL_ACTIONS = ['test3']
+            self.assertEqual(purl_admin.get_actions(PrivateUrl), ['test3'])
+        finally:
+            purl_settings.PRIVATEURL_ACTIONS = actions_bak
+
+    def test_paginator(self):
+        for i in range(3):
+            PrivateUrl.create('test2')
+        limit_bak = purl_settings.PRIVATEURL_ADMIN_COUNT_LIMIT
+        try:
+            purl_settings.PRIVATEURL_ADMIN_COUNT_LIMIT = 2
+            self.assertEqual(purl_admin.EstimatedCountPaginator(PrivateUrl.objects.all(), 1).count, 2)
+            purl_settings.PRIVATEURL_ADMIN_COUNT_LIMIT = 0
+            self.assertEqual(purl_admin.EstimatedCountPaginator(PrivateUrl.objects.all(), 1).count, 4)
+        finally:
+            purl_settings.PRIVATEURL_ADMIN_COUNT_LIMIT = limit_bak
+
+    def test_actions(self):
+        urls = [PrivateUrl.create('test2', hits_limit=0) for i in range(3)]
+        for t in urls:
+            t.hit_counter_inc()
+        url = resolve_url('admin:privateurl_privateurl_changelist')
+
+        def run(action, objs):
+            return self.client.post(url, {'action': action, '_selected_action': [t.pk for t in objs]})
+
+        run('reset_counters', urls[:2])
+        self.assertEqual(sorted(PrivateUrl.objects.filter(action='test2').values_list('hit_counter', flat=True)),
+                         [0, 0, 1])
+        run('purge_unavailable', urls)
+        self.assertEqual(PrivateUrl.objects.filter(action='test2').count(), 3)
+        run('expire_now', urls[:2])
+        self.assertEqual(PrivateUrl.objects.filter(action='test2').unavailable().count(), 2)
+        run('purge_unavailable', urls)
+        self.assertEqual(list(PrivateUrl.objects.filter(action='test2').values_list('pk', flat=True)), [urls[2].pk])
@@ -1,17 +1,29 @@
 import django
 from django.contrib import admin
 
+from privateurl.views import verify_view as privateurl_verify_view
+
 if django.VERSION >= (2, 0):
-    from django.urls import path, include
+    from django.urls import path, re_path, include
 
     urlpatterns = [
         path('admin/', admin.site.urls),
         path('private/', include(('privateurl.urls', 'privateurl'), namespace='purl')),
+        path('private-verify/', privateurl_verify_view, name='privateurl_verify'),
     ]
+
+    if django.VERSION >= (3, 1):
+        from privateurl.async_views import privateurl_view as privateurl_async_view
+
+        urlpatterns += [
+            re_path(r'^private-async/(?P<action>[\-_a-zA-Z0-9]{1,40})/(?P<token>[\-a-zA-Z0-9]{1,64})$',
+                    privateurl_async_view, name='privateurl_async'),
+        ]
 else:
     from django.conf.urls import include, url
 
     urlpatterns = [
         url(r'^admin/', include(admin.site.urls)),
         url(r'^private/', include('privateurl.urls', namespace='purl')),
+        url(r'^private-verify/$', privateurl_verify_view, name='privateurl_verify'),
     ]
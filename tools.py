@@ -14,12 +14,13 @@ from django.core.management.utils import handle_extensions
 APPS = ('privateurl',)
 LANGUAGES = ('en', 'uk', 'ru')
 
-COMMANDS_LIST = ('makemessages', 'compilemessages', 'testmanage', 'test', 'release')
+COMMANDS_LIST = ('makemessages', 'compilemessages', 'testmanage', 'test', 'benchmark', 'release')
 COMMANDS_INFO = {
     'makemessages': 'make po-files',
     'compilemessages': 'compile po-files to mo-files',
     'testmanage': 'run manage for test project',
     'test': 'run tests (eq. "testmanage test")',
+    'benchmark': 'run benchmarks and print results as JSON (names of benchmarks, --output=<file>)',
     'release': 'make distributive and upload to pypi (setup.py bdist_wheel upload)'
 }
 
@@ -113,6 +114,12 @@ def test(*args):
     testmanage('test', *args)
 
 
+def benchmark(*args):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from benchmarks import main
+    main(*args)
+
+
 def release(*args):  # noqa: F841
     root_dir = os.path.dirname(os.path.abspath(__file__))
     shutil.rmtree(os.path.join(root_dir, 'build'), ignore_errors=True)